@@ -0,0 +1,56 @@
+# Compares the old serial page loop with the pipelined PagePipeline against a
+# local fake Sensedata server:
+#
+#   python -m benchmarks.bench_pipeline --rows 20000 --latency 0.05
+import argparse
+import time
+
+from benchmarks.fake_servers import FakeSensedataServer
+from sensedata_api import SensedataAPI
+from sync_engine import PagePipeline
+
+
+def serial(api: SensedataAPI, entity_name: str) -> int:
+    rows = 0
+    for page_number in range(1, 500):
+        temp_data = api.get_entity_data(entity_name=entity_name, page=page_number)
+        if temp_data['count'] == 0:
+            break
+        rows += temp_data['count']
+    return rows
+
+
+def pipelined(api: SensedataAPI, entity_name: str, workers: int, prefetch: int) -> int:
+    pipeline = PagePipeline(sense_data_api=api, workers=workers, prefetch=prefetch)
+    return sum(data['count'] for _, data in pipeline.iter_pages(entity_name=entity_name))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--limit', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--prefetch', type=int, default=8)
+    args = parser.parse_args()
+
+    with FakeSensedataServer(rows=args.rows, latency=args.latency) as server:
+        api = SensedataAPI(base_url=server.base_url, token='bench', limit=args.limit)
+
+        start = time.perf_counter()
+        serial_rows = serial(api, 'tasks')
+        serial_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        pipelined_rows = pipelined(api, 'tasks', args.workers, args.prefetch)
+        pipelined_time = time.perf_counter() - start
+
+    assert serial_rows == pipelined_rows == args.rows
+    print(f'serial:    {serial_rows} rows in {serial_time:.2f}s')
+    print(f'pipelined: {pipelined_rows} rows in {pipelined_time:.2f}s '
+          f'(workers={args.workers}, prefetch={args.prefetch})')
+    print(f'speedup:   {serial_time / pipelined_time:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
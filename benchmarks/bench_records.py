@@ -0,0 +1,57 @@
+# Memory and allocations of a parsed page held as record dicts against the
+# compact RecordPage, measured with tracemalloc on synthetic pages, plus the
+# time to get from rows to serialized records either way:
+#
+#   python -m benchmarks.bench_records --rows 500
+import argparse
+import gc
+import timeit
+import tracemalloc
+
+from benchmarks.fixtures import ENTITIES, generate_rows
+from commons import get_serializer
+from stitch_api import StitchApi
+
+
+def measure(build) -> tuple:
+    # Bytes held by what build() returns, and memory blocks still allocated for it
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    result = build()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, 'filename')
+    del result
+    return sum(stat.size_diff for stat in stats), sum(stat.count_diff for stat in stats)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=500)
+    parser.add_argument('--custom-fields', type=int, default=20)
+    parser.add_argument('--number', type=int, default=20)
+    args = parser.parse_args()
+
+    serializer = get_serializer()
+    stitch = StitchApi(client_id='bench', serializer=serializer)
+    print(f'{args.rows} rows per page, {serializer.name}')
+    for entity_name in ENTITIES:
+        rows = generate_rows(entity_name, args.rows, custom_fields=args.custom_fields)
+        # Warms up the custom fields schema so it isn't counted
+        stitch.parse_entity_data_to_record_page(rows, entity_name)
+
+        dict_bytes, dict_blocks = measure(lambda: stitch.parse_entity_data_to_stitch_records(rows, entity_name))
+        page_bytes, page_blocks = measure(lambda: stitch.parse_entity_data_to_record_page(rows, entity_name))
+        dict_time = timeit.timeit(lambda: [serializer.dumps(record) for record in
+                                           stitch.parse_entity_data_to_stitch_records(rows, entity_name)],
+                                  number=args.number) / args.number
+        page_time = timeit.timeit(lambda: stitch.parse_entity_data_to_record_page(rows, entity_name)
+                                  .encode(serializer), number=args.number) / args.number
+        print(f'{entity_name:10} dicts: {dict_bytes / 1024:7.0f} KB {dict_blocks:6} blocks '
+              f'{dict_time * 1000:6.2f} ms   page: {page_bytes / 1024:7.0f} KB {page_blocks:6} blocks '
+              f'{page_time * 1000:6.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+# Encode/decode throughput of each installed serializer backend on customers
+# pages with many custom fields:
+#
+#   python -m benchmarks.bench_serializer --custom-fields 100
+import argparse
+import timeit
+
+from benchmarks.fixtures import generate_rows
+from commons.serializer import SERIALIZERS
+from stitch_api import StitchApi
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=500)
+    parser.add_argument('--custom-fields', type=int, default=100)
+    parser.add_argument('--number', type=int, default=20)
+    args = parser.parse_args()
+
+    page = generate_rows('customers', args.rows, custom_fields=args.custom_fields)
+    records = StitchApi(client_id='bench').parse_entity_data_to_stitch_records(page, 'customers')
+
+    for name, serializer_class in SERIALIZERS.items():
+        try:
+            serializer = serializer_class()
+        except ImportError:
+            print(f'{name:8} not installed')
+            continue
+        response_body = serializer.dumps({'count': len(page), 'customers': page})
+        loads = timeit.timeit(lambda: serializer.loads(response_body), number=args.number) / args.number
+        dumps = timeit.timeit(lambda: serializer.dumps(records), number=args.number) / args.number
+        print(f'{name:8} decode page: {loads * 1000:7.2f} ms  encode records: {dumps * 1000:7.2f} ms  '
+              f'({len(response_body) / 1e6:.1f} MB in)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+# End-to-end throughput of the real threaded sync (SyncEngine with the
+# batcher) against local fake Sensedata and Stitch servers, one entity at a
+# time. The servers run in a child process and each entity is synced in a
+# child process of its own, so CPU time and peak RSS are that entity's sync
+# alone (ru_maxrss is a high-water mark that never goes down). Results are
+# written as JSON to benchmarks/results/, keyed by the current commit, so
+# runs on different commits can be compared:
+#
+#   python -m benchmarks.bench_sync --rows 50000 --latency 0.05 --error-rate 0.01
+#   python -m benchmarks.bench_sync --compare benchmarks/results/sync-<old commit>.json
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+from functools import partial
+
+from benchmarks.fake_servers import FakeSensedataServer, FakeStitchServer
+from benchmarks.fixtures import ENTITIES, generate_row
+from commons import RetryPolicy, TokenBucket, get_serializer
+from sensedata_api import SensedataAPI
+from stitch_api import StitchApi, StitchBatcher
+from sync_engine import Metrics, MetricsHook, SyncEngine
+
+
+def serve(options: dict, connection):
+    # Child process: runs both servers until the parent sends anything
+    sensedata_options = dict(options['server'], rate_limit=options['sensedata_rate_limit'])
+    stitch_options = dict(options['server'], rate_limit=options['stitch_rate_limit'])
+    row_factory = partial(generate_row, seed=options['seed'], custom_fields=options['custom_fields'])
+    with FakeSensedataServer(rows=options['rows'], row_factory=row_factory, compress=options['compress'],
+                             **sensedata_options) as sensedata, \
+            FakeStitchServer(keep_batches=False, **stitch_options) as stitch:
+        connection.send((sensedata.base_url, stitch.base_url))
+        connection.recv()
+        connection.send({'sensedata_requests': sensedata.requests, 'stitch_requests': stitch.requests,
+                         'stitch_rows': stitch.rows, 'errors': sensedata.errors + stitch.errors,
+                         'throttled': sensedata.throttled + stitch.throttled})
+
+
+class LatencyCollector(MetricsHook):
+    def __init__(self):
+        self.seconds = {}
+
+    def on_event(self, event: dict):
+        if event['stage'] in ('fetch', 'push'):
+            self.seconds.setdefault((event['entity'], event['stage']), []).append(event['seconds'])
+
+    def percentiles(self, entity_name: str, stage: str) -> dict:
+        seconds = self.seconds.get((entity_name, stage), [])
+        if len(seconds) < 2:
+            return {'p50': seconds[0] if seconds else None, 'p99': seconds[0] if seconds else None}
+        cuts = statistics.quantiles(seconds, n=100, method='inclusive')
+        return {'p50': cuts[49], 'p99': cuts[98]}
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux; it is the process peak so far, which
+    # is why every entity is synced in a fresh process (see sync_entity)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def current_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run_entity(args, sensedata_url: str, stitch_url: str, entity_name: str, collector: LatencyCollector) -> dict:
+    serializer = get_serializer(args.serializer)
+    retry_policy = RetryPolicy(max_retries=args.max_retries, backoff_factor=args.backoff)
+    sense_data_api = SensedataAPI(base_url=sensedata_url, token='bench', limit=args.limit,
+                                  pool_size=args.workers, rate_limiter=TokenBucket(), retry_policy=retry_policy,
+                                  serializer=serializer)
+    stitch = StitchApi(base_url=stitch_url, api_token='bench', client_id='bench', rate_limiter=TokenBucket(),
+                       retry_policy=retry_policy, serializer=serializer)
+    metrics = Metrics(hooks=[collector])
+    batcher = StitchBatcher(stitch=stitch, metrics=metrics, serializer=serializer)
+    engine = SyncEngine(sense_data_api=sense_data_api, stitch=stitch, workers=args.workers, prefetch=args.prefetch,
+                        batcher=batcher, metrics=metrics, serializer=serializer)
+
+    cpu, start = time.process_time(), time.perf_counter()
+    with sense_data_api, stitch:
+        rows = engine.run(entities=[entity_name])[entity_name]
+    seconds, cpu_seconds = time.perf_counter() - start, time.process_time() - cpu
+
+    totals = metrics.summary().get(entity_name, {})
+    return {
+        'rows': rows,
+        'seconds': seconds,
+        'rows_per_second': rows / seconds if seconds else 0.0,
+        'fetch_latency': collector.percentiles(entity_name, 'fetch'),
+        'push_latency': collector.percentiles(entity_name, 'push'),
+        'cpu_seconds': cpu_seconds,
+        'peak_rss_mb': peak_rss_mb(),
+        'pages': totals.get('fetch_count', 0),
+        'pushes': totals.get('push_count', 0),
+        'retries': totals.get('fetch_retries', 0) + totals.get('push_retries', 0),
+    }
+
+
+def sync_entity(args, sensedata_url: str, stitch_url: str, entity_name: str) -> dict:
+    # run_entity in a child process, whose peak RSS is only that entity's
+    parent, child = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=_sync_entity_child,
+                                      args=(args, sensedata_url, stitch_url, entity_name, child))
+    process.start()
+    child.close()
+    try:
+        result = parent.recv()
+    except EOFError:
+        result = None
+    process.join()
+    if isinstance(result, BaseException) or result is None:
+        raise RuntimeError(f'syncing {entity_name} failed (exit code {process.exitcode})') from result
+    return result
+
+
+def _sync_entity_child(args, sensedata_url: str, stitch_url: str, entity_name: str, connection):
+    try:
+        connection.send(run_entity(args, sensedata_url, stitch_url, entity_name, LatencyCollector()))
+    except Exception as error:
+        connection.send(error)
+    finally:
+        connection.close()
+
+
+def compare(previous: dict, current: dict):
+    print(f"rows/s change from {previous['commit']} to {current['commit']}:")
+    for entity_name, result in current['entities'].items():
+        before = previous['entities'].get(entity_name)
+        if before and before['rows_per_second']:
+            change = result['rows_per_second'] / before['rows_per_second'] - 1
+            print(f"  {entity_name:10} {before['rows_per_second']:>10,.0f} -> {result['rows_per_second']:>10,.0f} "
+                  f"({change:+.1%})")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=20000, help='rows served per entity')
+    parser.add_argument('--limit', type=int, default=500, help='page size')
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds added to every server answer')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests answered with a 503')
+    parser.add_argument('--sensedata-rate-limit', type=float, default=None, help='Sensedata requests per second')
+    parser.add_argument('--stitch-rate-limit', type=float, default=None, help='Stitch requests per second')
+    parser.add_argument('--custom-fields', type=int, default=20, help='custom fields per customer')
+    parser.add_argument('--compress', action='store_true', help='gzip Sensedata responses')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--prefetch', type=int, default=8)
+    parser.add_argument('--max-retries', type=int, default=5)
+    parser.add_argument('--backoff', type=float, default=0.05)
+    parser.add_argument('--serializer', default=None)
+    parser.add_argument('--entities', nargs='+', default=list(ENTITIES), choices=ENTITIES)
+    parser.add_argument('--output', default=None,
+                        help='results file (default: benchmarks/results/sync-<commit>.json)')
+    parser.add_argument('--compare', default=None, help='earlier results file to compare rows/s with')
+    args = parser.parse_args()
+
+    options = {
+        'rows': args.rows, 'compress': args.compress, 'seed': args.seed, 'custom_fields': args.custom_fields,
+        'sensedata_rate_limit': args.sensedata_rate_limit, 'stitch_rate_limit': args.stitch_rate_limit,
+        'server': {'latency': args.latency, 'error_rate': args.error_rate, 'seed': args.seed},
+    }
+    parent, child = multiprocessing.Pipe()
+    server = multiprocessing.Process(target=serve, args=(options, child), daemon=True)
+    server.start()
+    sensedata_url, stitch_url = parent.recv()
+
+    try:
+        entities = {entity_name: sync_entity(args, sensedata_url, stitch_url, entity_name)
+                    for entity_name in args.entities}
+    finally:
+        parent.send('stop')
+        server_stats = parent.recv()
+        server.join()
+
+    commit = current_commit()
+    results = {
+        'commit': commit,
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'config': vars(args),
+        'entities': entities,
+        'servers': server_stats,
+    }
+    for entity_name, result in entities.items():
+        fetch, push = result['fetch_latency'], result['push_latency']
+        print(f"{entity_name:10} {result['rows']:>8} rows {result['rows_per_second']:>10,.0f} rows/s  "
+              f"fetch p50/p99 {fetch['p50'] * 1000:.1f}/{fetch['p99'] * 1000:.1f} ms  "
+              f"push p50/p99 {push['p50'] * 1000:.1f}/{push['p99'] * 1000:.1f} ms  "
+              f"cpu {result['cpu_seconds']:.2f}s  peak rss {result['peak_rss_mb']:.0f} MB")
+    print(f'servers: {server_stats}')
+
+    output = args.output or os.path.join(os.path.dirname(__file__), 'results', f'sync-{commit}.json')
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as results_file:
+        json.dump(results, results_file, indent=2, sort_keys=True)
+    print(f'results written to {output}')
+
+    if args.compare:
+        with open(args.compare) as previous_file:
+            compare(json.load(previous_file), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+import gzip
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class FakeServer:
+    # Runs a local HTTP server on a random port in a background thread.
+    # Subclasses answer requests in handle_get/handle_post by returning
+    # a (status, body, headers) tuple.
+    #
+    # error_rate answers that share of requests with a 503, and rate_limit
+    # answers 429 with Retry-After to requests above that many per second.
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, rate_limit: float = None, seed: int = None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+        self.injected_errors = []
+        self._random = random.Random(seed)
+        self._window = (0, 0)  # second, requests in it
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.05,), daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address
+        return f'http://{host}:{port}'
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def inject_errors(self, *errors):
+        # Answers the next requests with the given (status, headers) pairs
+        # before serving normally again
+        with self._lock:
+            self.injected_errors.extend(errors)
+
+    def _next_error(self):
+        with self._lock:
+            if self.injected_errors:
+                status, headers = self.injected_errors.pop(0)
+                return status, b'{"error": "injected"}', headers
+            if self.rate_limit is not None:
+                second = int(time.monotonic())
+                window, count = self._window
+                count = count + 1 if window == second else 1
+                self._window = (second, count)
+                if count > self.rate_limit:
+                    self.throttled += 1
+                    # Until the next one second window opens
+                    retry_after = f'{1 - time.monotonic() % 1:.3f}'
+                    return 429, b'{"error": "rate limited"}', {'Retry-After': retry_after}
+            if self.error_rate and self._random.random() < self.error_rate:
+                self.errors += 1
+                return 503, b'{"error": "unavailable"}', {}
+        return None
+
+    def handle_get(self, path: str, query: dict, headers) -> tuple:
+        return 404, b'', {}
+
+    def handle_post(self, path: str, body: bytes, headers) -> tuple:
+        return 404, b'', {}
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body are separate writes; with Nagle each response
+            # would wait for the client's delayed ACK
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                self._respond(*(fake._next_error()
+                                or fake.handle_get(url.path, parse_qs(url.query), self.headers)))
+
+            def do_POST(self):
+                body = self._read_body()
+                if self.headers.get('Content-Encoding') == 'gzip':
+                    body = gzip.decompress(body)
+                self._respond(*(fake._next_error()
+                                or fake.handle_post(urlparse(self.path).path, body, self.headers)))
+
+            def _read_body(self) -> bytes:
+                if self.headers.get('Transfer-Encoding', '').lower() != 'chunked':
+                    return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                body = bytearray()
+                while True:
+                    size = int(self.rfile.readline().split(b';')[0], 16)
+                    if size == 0:
+                        self.rfile.readline()
+                        return bytes(body)
+                    body += self.rfile.read(size)
+                    self.rfile.readline()
+
+            def _respond(self, status: int, body: bytes, headers: dict):
+                with fake._lock:
+                    fake.requests += 1
+                time.sleep(fake.latency)
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+class FakeSensedataServer(FakeServer):
+    # Local stand-in for api.sensedata.io that serves `rows` rows per entity,
+    # paginated like the real /v2/<entity> endpoint. With compress, pages are
+    # gzipped for clients that accept it. `row_factory(entity_name, index)`
+    # builds the rows, by default just an id and updated_at. With etags,
+    # pages carry an ETag and If-None-Match for an unchanged page gets a 304.
+    # With max_limit, a larger limit is capped to it, as some APIs do.
+    def __init__(self, rows: int = 5000, latency: float = 0.05, compress: bool = False, row_factory=None,
+                 etags: bool = False, max_limit: int = None, **options):
+        super().__init__(latency=latency, **options)
+        self.rows = rows
+        self.max_limit = max_limit
+        self.compress = compress
+        self.etags = etags
+        self.not_modified = 0
+        self.row_factory = row_factory or (lambda entity_name, index: {'id': index,
+                                                                      'updated_at': '2020-01-01T00:00:00Z'})
+
+    def page(self, entity_name: str, page: int, limit: int) -> dict:
+        start = (page - 1) * limit
+        end = min(start + limit, self.rows)
+        rows = [self.row_factory(entity_name, i) for i in range(start, end)]
+        return {'count': len(rows), entity_name: rows}
+
+    def handle_get(self, path: str, query: dict, headers) -> tuple:
+        entity_name = path.rsplit('/', 1)[-1]
+        page = int(query.get('page', ['1'])[0])
+        limit = int(query.get('limit', ['500'])[0])
+        if self.max_limit is not None:
+            limit = min(limit, self.max_limit)
+        body = json.dumps(self.page(entity_name, page, limit)).encode()
+        if self.etags:
+            etag = f'"{hashlib.sha1(body).hexdigest()}"'
+            if headers.get('If-None-Match') == etag:
+                with self._lock:
+                    self.not_modified += 1
+                return 304, b'', {'ETag': etag}
+            return 200, body, {'ETag': etag}
+        if self.compress and 'gzip' in headers.get('Accept-Encoding', ''):
+            return 200, gzip.compress(body), {'Content-Encoding': 'gzip'}
+        return 200, body, {}
+
+
+class FakeStitchServer(FakeServer):
+    # Local stand-in for the Stitch Import API push endpoint. Keeps every
+    # accepted batch so tests can inspect what was pushed, unless keep_batches
+    # is off (long benchmark runs), in which case only rows are counted.
+    #
+    # `reject(record)` returns an error message for records Stitch should
+    # refuse; a batch holding any of them is answered with a 400 as a whole.
+    def __init__(self, latency: float = 0.0, keep_batches: bool = True, reject=None, **options):
+        super().__init__(latency=latency, **options)
+        self.keep_batches = keep_batches
+        self.reject = reject
+        self.batches = []
+        self.rows = 0
+        self.rejected = 0
+
+    def handle_post(self, path: str, body: bytes, headers) -> tuple:
+        batch = json.loads(body)
+        if self.reject is not None:
+            for record in batch:
+                message = self.reject(record)
+                if message:
+                    with self._lock:
+                        self.rejected += 1
+                    return 400, json.dumps({'status': 'error', 'error': message}).encode(), {}
+        with self._lock:
+            self.rows += len(batch)
+            if self.keep_batches:
+                self.batches.append(batch)
+        return 201, json.dumps({'status': 'OK', 'message': 'Batch accepted'}).encode(), {}
@@ -0,0 +1,184 @@
+# Synthetic Sensedata pages with the shape and value types of the real API,
+# for benchmarks and the fake servers. Generation is deterministic for a seed
+# and any row can be built on its own, so pages of any size are cheap:
+#
+#   page = generate_page('customers', rows=500, custom_fields=50)
+import random
+from datetime import datetime, timedelta, timezone
+
+ENTITIES = ('contacts', 'customers', 'nps', 'tasks')
+
+_EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+_NAMES = ('Ana', 'Bruno', 'Carla', 'Diego', 'Elisa', 'Fábio', 'Gabriela', 'Heitor', 'Íris', 'João')
+_STAGES = ('Onboarding', 'Adoção', 'Expansão', 'Renovação', '')
+_GROUPS = ('G01', 'G02', 'G03', '')
+
+
+def _timestamp(rng: random.Random, days: int = 900) -> str:
+    return (_EPOCH + timedelta(seconds=rng.randrange(days * 86400))).isoformat().replace('+00:00', 'Z')
+
+
+def _date(rng: random.Random) -> str:
+    return _timestamp(rng)[:10]
+
+
+def _user(rng: random.Random) -> dict:
+    name = rng.choice(_NAMES)
+    user_id = rng.randrange(1, 500)
+    return {
+        'id': user_id,
+        'name': name,
+        'username': f'{name.lower()}.{user_id}',
+        'email': f'{name.lower()}.{user_id}@empresa.com',
+        'profile': {'name': rng.choice(('Viewer', 'Admin', 'CS')), 'role': rng.choice(('viewer', 'admin'))},
+        'active': rng.random() < 0.9,
+        'registered_on': _timestamp(rng),
+        'created_at': _timestamp(rng),
+        'updated_at': _timestamp(rng),
+    }
+
+
+def contact_row(index: int, rng: random.Random) -> dict:
+    name = rng.choice(_NAMES)
+    return {
+        'id': index,
+        'id_legacy': f'CONT-{index:06d}',
+        'customer': {'id': rng.randrange(1, 5000), 'id_legacy': f'CLI-{rng.randrange(10000):05d}',
+                     'group': rng.choice(_GROUPS), 'name_contract': f'Contrato {index}',
+                     'name': f'Cliente {rng.randrange(5000)}', 'cnpj': f'{rng.randrange(10 ** 14):014d}'},
+        'is_main_sponsor': rng.random() < 0.2,
+        'is_active': rng.random() < 0.9,
+        'name': name,
+        'nickname': name[:3],
+        'email': f'{name.lower()}{index}@cliente.com.br',
+        'occupation': rng.choice(('CEO', 'CTO', 'Gerente', 'Analista')),
+        'phone': f'+55 11 9{rng.randrange(10 ** 8):08d}',
+        'phone2': rng.choice(('', f'+55 11 3{rng.randrange(10 ** 7):07d}')),
+        'address': f'Rua {rng.choice(_NAMES)}, {rng.randrange(1, 3000)}',
+        'skype': '',
+        'email_unsubscribe': rng.random() < 0.05,
+        'unsubscribe_reason': '',
+        'is_favorite': rng.random() < 0.1,
+        'obs_info': rng.choice(('', 'Prefere contato por email')),
+        'types': [{'id': rng.randrange(1, 10), 'name': rng.choice(('Sponsor', 'Usuário', 'Financeiro'))}
+                  for _ in range(rng.randrange(3))],
+        'created_at': _timestamp(rng),
+        'updated_at': _timestamp(rng),
+    }
+
+
+def customer_row(index: int, rng: random.Random, custom_fields: int = 20) -> dict:
+    # About a fifth of the customers have no cs or csm assigned
+    return {
+        'id': index,
+        'id_legacy': f'CLI-{index:05d}',
+        'group': rng.choice(_GROUPS),
+        'name_contract': f'Contrato {index}',
+        'name': f'Cliente {index}',
+        'cnpj': f'{rng.randrange(10 ** 14):014d}',
+        'state': rng.choice(('SP', 'RJ', 'MG', 'RS')),
+        'city': rng.choice(('São Paulo', 'Rio de Janeiro', 'Belo Horizonte', 'Porto Alegre')),
+        'size': rng.choice(('P', 'M', 'G')),
+        'stage': rng.choice(_STAGES),
+        'dt_stage': _date(rng),
+        'dt_register': _date(rng),
+        'industry': rng.choice(('Varejo', 'Tecidos', 'Educação', 'Saúde')),
+        'salesperson': rng.choice(_NAMES),
+        'sponsor': rng.choice(_NAMES),
+        'sponsor_phone': f'+55 11 9{rng.randrange(10 ** 8):08d}',
+        'sponsor_email': f'sponsor{index}@cliente.com.br',
+        'dt_cancel': None,
+        'cancel_tag': None,
+        'cancel_description': None,
+        'created_at': _timestamp(rng),
+        'updated_at': _timestamp(rng),
+        'status': {'id': rng.randrange(1, 5), 'description': rng.choice(('Ativo', 'Inativo')), 'enabled': True},
+        'cs': _user(rng) if rng.random() < 0.8 else None,
+        'csm': _user(rng) if rng.random() < 0.8 else None,
+        'custom_fields': {f'field_{field}': {'value': rng.choice((f'valor {field}', rng.randrange(1000), None, True))}
+                          for field in range(custom_fields)},
+    }
+
+
+def nps_row(index: int, rng: random.Random) -> dict:
+    score = rng.randrange(11)
+    return {
+        'id': index,
+        'id_legacy': f'NPS-{index:06d}',
+        'id_customer': rng.randrange(1, 5000),
+        'ref_date': _date(rng) + 'T00:00:00',
+        'survey_date': _date(rng) + 'T00:00:00',
+        'medium': f'respondente{index}@cliente.com.br',
+        'respondent': rng.choice(_NAMES),
+        'score': score,
+        'role': rng.choice(('SUPER_ADMIN', 'ADMIN', 'USER')),
+        'stage': rng.choice(_STAGES),
+        'group': rng.choice(_GROUPS),
+        'category': '',
+        'nps_status': 'promoter' if score > 8 else 'neutral' if score > 6 else 'detractor',
+        'comments': rng.choice(('', 'Produto atende bem', 'Suporte demorou a responder o chamado')),
+        'tags': '',
+        'created_at': _timestamp(rng),
+        'updated_at': rng.choice(('', _timestamp(rng))),
+    }
+
+
+def task_row(index: int, rng: random.Random) -> dict:
+    # owner and created_by are null on some tasks, e.g. those created by rules
+    return {
+        'id': index,
+        'id_legacy': f'ATIV-{index:06d}',
+        'id_customer': rng.randrange(1, 5000),
+        'id_parent': rng.choice((None, rng.randrange(1, index + 2))),
+        'id_contact': rng.randrange(1, 20000),
+        'group': rng.choice(_GROUPS),
+        'description': rng.choice(('Ligar para cliente', 'Reunião de alinhamento', 'Enviar proposta')),
+        'notes': f'Ligar para o telefone +55 11 9{rng.randrange(10 ** 8):08d}',
+        'start_date': _date(rng),
+        'due_date': _date(rng),
+        'end_date': rng.choice((None, _timestamp(rng))),
+        'type': {'id': rng.randrange(1, 3000), 'description': 'meeting', 'caption': 'Reunião',
+                 'enabled': True, 'is_default': rng.random() < 0.5},
+        'status': {'id': rng.randrange(1, 3000), 'description': rng.choice(('Concluída', 'Aberta'))},
+        'priority': {'id': rng.randrange(1, 3000), 'description': rng.choice(('Alta', 'Média', 'Baixa'))},
+        'owner': _user(rng) if rng.random() < 0.9 else None,
+        'created_by': _user(rng) if rng.random() < 0.9 else None,
+        'hours_spent': rng.randrange(40),
+        'hours_planned': rng.randrange(40),
+        'progress': rng.randrange(101),
+        'id_playbook': rng.choice((None, rng.randrange(1, 100))),
+        'id_rule': rng.choice((None, rng.randrange(1, 100))),
+        'tags': '',
+        'created_at': _timestamp(rng),
+        'system_end_date': rng.choice((None, _timestamp(rng))),
+        'updated_at': _timestamp(rng),
+        'custom_value': None,
+        'favorite': rng.random() < 0.1,
+    }
+
+
+_ROW_BUILDERS = {
+    'contacts': contact_row,
+    'customers': customer_row,
+    'nps': nps_row,
+    'tasks': task_row,
+}
+
+
+def generate_row(entity_name: str, index: int, seed: int = 0, custom_fields: int = 20) -> dict:
+    # The same (entity, index, seed) always gives the same row
+    rng = random.Random(f'{seed}:{entity_name}:{index}')
+    if entity_name == 'customers':
+        return customer_row(index, rng, custom_fields=custom_fields)
+    return _ROW_BUILDERS[entity_name](index, rng)
+
+
+def generate_rows(entity_name: str, rows: int, start: int = 0, seed: int = 0, custom_fields: int = 20) -> list:
+    return [generate_row(entity_name, index, seed=seed, custom_fields=custom_fields)
+            for index in range(start, start + rows)]
+
+
+def generate_page(entity_name: str, rows: int = 500, page: int = 1, seed: int = 0, custom_fields: int = 20) -> dict:
+    # One page of a Sensedata /v2/<entity> response
+    data = generate_rows(entity_name, rows, start=(page - 1) * rows, seed=seed, custom_fields=custom_fields)
+    return {'count': len(data), entity_name: data}
@@ -0,0 +1,34 @@
+from .compression import (ACCEPT_ENCODING, GzipCompression, add_transfer, count_transfer, iter_counted,
+                          iter_decompressed, thread_transfer, transfer_since)
+from .files import write_json_atomic
+from .http_session import build_async_session, build_session, connection_stats
+from .json_stream import iter_array_bytes, iter_array_items
+from .rate_limiter import TokenBucket, retry_after_seconds
+from .retry import (RetryPolicy, async_request_with_retry, request_with_retry, thread_retries,
+                    thread_throttles)
+from .serializer import get_serializer
+
+__all__: [
+    'ACCEPT_ENCODING',
+    'GzipCompression',
+    'RetryPolicy',
+    'TokenBucket',
+    'add_transfer',
+    'async_request_with_retry',
+    'build_async_session',
+    'build_session',
+    'connection_stats',
+    'count_transfer',
+    'get_serializer',
+    'iter_array_bytes',
+    'iter_array_items',
+    'iter_counted',
+    'iter_decompressed',
+    'request_with_retry',
+    'retry_after_seconds',
+    'thread_retries',
+    'thread_throttles',
+    'thread_transfer',
+    'transfer_since',
+    'write_json_atomic',
+]
@@ -0,0 +1,108 @@
+import threading
+import zlib
+
+# wbits for zlib: gzip framing when compressing, gzip or zlib header detected
+# when decompressing
+_GZIP_WBITS = 16 + zlib.MAX_WBITS
+_AUTO_WBITS = 32 + zlib.MAX_WBITS
+
+ACCEPT_ENCODING = 'gzip, deflate'
+
+_local = threading.local()
+
+
+def thread_transfer() -> dict:
+    # Bytes sent and received so far by the calling thread, as they went over
+    # the wire and uncompressed, so callers can attribute them to the page or
+    # batch they were working on (see transfer_since)
+    transfer = getattr(_local, 'transfer', None)
+    if transfer is None:
+        transfer = _local.transfer = {'sent': 0, 'sent_raw': 0, 'received': 0, 'received_raw': 0}
+    return dict(transfer)
+
+
+def transfer_since(before: dict, direction: str) -> dict:
+    # {'bytes': uncompressed, 'wire_bytes': on the wire} moved in `direction`
+    # ('sent' or 'received') since the thread_transfer() snapshot `before`
+    now = thread_transfer()
+    return {'bytes': now[f'{direction}_raw'] - before[f'{direction}_raw'],
+            'wire_bytes': now[direction] - before[direction]}
+
+
+def add_transfer(values: dict, before: dict, direction: str):
+    # Adds transfer_since to a metrics values dict; clients that don't count
+    # their transfers (e.g. test doubles) leave the values untouched
+    transfer = transfer_since(before, direction)
+    if transfer['wire_bytes']:
+        values.update(transfer)
+
+
+def count_transfer(direction: str, wire: int, raw: int):
+    thread_transfer()
+    _local.transfer[direction] += wire
+    _local.transfer[f'{direction}_raw'] += raw
+
+
+def iter_counted(chunks, direction: str, wire: bool = True, raw: bool = True):
+    # Counts streamed chunks as wire and/or uncompressed bytes while passing them on
+    for chunk in chunks:
+        count_transfer(direction, len(chunk) if wire else 0, len(chunk) if raw else 0)
+        yield chunk
+
+
+class GzipCompression:
+    # gzip Content-Encoding for request bodies. Bodies smaller than
+    # `threshold` bytes are sent as they are, they gain too little to pay for
+    # the compression time.
+    def __init__(self, level: int = 6, threshold: int = 1024):
+        if not 0 <= level <= 9:
+            raise ValueError('compression level must be between 0 and 9')
+        self.level = level
+        self.threshold = threshold
+
+    def compress(self, data: bytes) -> tuple:
+        # (body, extra request headers)
+        if len(data) < self.threshold:
+            return data, {}
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, _GZIP_WBITS)
+        return compressor.compress(data) + compressor.flush(), {'Content-Encoding': 'gzip'}
+
+    def iter_compress(self, chunks):
+        # Streaming counterpart of compress for chunked bodies, always compressed
+        # since the size isn't known up front
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, _GZIP_WBITS)
+        for chunk in chunks:
+            compressed = compressor.compress(chunk)
+            if compressed:
+                yield compressed
+        yield compressor.flush()
+
+
+def iter_decompressed(chunks, encoding: str):
+    # Decodes a gzip or deflate response body chunk by chunk. "deflate" is
+    # meant to be zlib-wrapped but some servers send raw deflate, so that is
+    # tried when the zlib header is missing.
+    encoding = (encoding or 'identity').strip().lower()
+    if encoding == 'identity':
+        yield from chunks
+        return
+    if encoding not in ('gzip', 'x-gzip', 'deflate'):
+        raise ValueError(f'unsupported content encoding {encoding}')
+
+    decompressor = zlib.decompressobj(_AUTO_WBITS)
+    first = True
+    for chunk in chunks:
+        if first and encoding == 'deflate' and chunk:
+            first = False
+            try:
+                data = decompressor.decompress(chunk)
+            except zlib.error:
+                decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+                data = decompressor.decompress(chunk)
+        else:
+            data = decompressor.decompress(chunk)
+        if data:
+            yield data
+    data = decompressor.flush()
+    if data:
+        yield data
@@ -0,0 +1,22 @@
+import json
+import os
+
+
+def write_json_atomic(path: str, value, fsync: bool = True, **dump_options):
+    # Writes value as JSON to a temporary file first and renames it over
+    # path, so a crash never leaves half a file. With fsync the data, then
+    # the rename, are flushed to disk before returning, so the new file also
+    # survives a power loss.
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as json_file:
+        json.dump(value, json_file, **dump_options)
+        if fsync:
+            json_file.flush()
+            os.fsync(json_file.fileno())
+    os.replace(tmp_path, path)
+    if fsync and hasattr(os, 'O_DIRECTORY'):
+        directory = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
@@ -0,0 +1,44 @@
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover - optional dependency
+    aiohttp = None
+
+
+def build_session(headers: dict, pool_size: int = 10) -> requests.Session:
+    # One keep-alive session per client, so every page reuses the same
+    # TCP/TLS connections instead of doing a fresh handshake.
+    session = requests.Session()
+    session.headers.update(headers)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def build_async_session(headers: dict, pool_size: int = 10, timeout: tuple = (10, 60)):
+    # aiohttp counterpart of build_session, must be called inside a running loop
+    if aiohttp is None:
+        raise ImportError('aiohttp is required for the asyncio clients')
+    connect_timeout, read_timeout = timeout
+    return aiohttp.ClientSession(
+        headers=headers,
+        connector=aiohttp.TCPConnector(limit=pool_size),
+        timeout=aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout),
+    )
+
+
+def connection_stats(session: requests.Session) -> dict:
+    # Connections opened and requests served per host, as tracked by urllib3
+    stats = {}
+    for adapter in set(session.adapters.values()):
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools[key]
+            stats[f'{pool.scheme}://{pool.host}:{pool.port}'] = {
+                'connections': pool.num_connections,
+                'requests': pool.num_requests,
+            }
+    return stats
@@ -0,0 +1,78 @@
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+
+def retry_after_seconds(headers) -> float:
+    # Seconds the server asked us to wait, from Retry-After (delta seconds or
+    # HTTP date) or from an exhausted X-RateLimit/RateLimit budget. None when
+    # the response carries no such hint.
+    retry_after = headers.get('Retry-After')
+    if retry_after is not None:
+        try:
+            return max(float(retry_after), 0.0)
+        except ValueError:
+            try:
+                return max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0.0)
+            except (TypeError, ValueError):
+                return None
+
+    for prefix in ('X-RateLimit-', 'RateLimit-'):
+        remaining = headers.get(f'{prefix}Remaining')
+        reset = headers.get(f'{prefix}Reset')
+        if remaining is None or reset is None:
+            continue
+        try:
+            if int(remaining) > 0:
+                return None
+            reset = float(reset)
+        except ValueError:
+            return None
+        # Reset is either an epoch timestamp or a delay in seconds
+        return max(reset - time.time(), 0.0) if reset > 1e9 else reset
+    return None
+
+
+class TokenBucket:
+    # Allows `rate` requests per second with bursts of up to `capacity`.
+    # A rate of None never throttles but still honours server pauses.
+    def __init__(self, rate: float = None, capacity: float = None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity or max(rate or 1, 1)
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        # Takes a token and returns how long the caller must wait before using it
+        with self._lock:
+            now = self.clock()
+            wait = max(self._paused_until - now, 0.0)
+            if self.rate is None:
+                return wait
+
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens < 0:
+                wait = max(wait, -self._tokens / self.rate)
+            return wait
+
+    def acquire(self) -> float:
+        wait = self.reserve()
+        if wait > 0:
+            self.sleep(wait)
+        return wait
+
+    def pause(self, seconds: float):
+        # Holds every caller of this bucket, e.g. after a 429 with Retry-After
+        with self._lock:
+            self._paused_until = max(self._paused_until, self.clock() + seconds)
+
+    def update_from_headers(self, headers):
+        seconds = retry_after_seconds(headers)
+        if seconds:
+            self.pause(seconds)
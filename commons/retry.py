@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+
+import requests
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover - optional dependency
+    aiohttp = None
+
+from .rate_limiter import TokenBucket, retry_after_seconds
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+_local = threading.local()
+
+
+def thread_retries() -> int:
+    # Retries made so far by request_with_retry in the calling thread, so
+    # callers can attribute them to the page or batch they were working on
+    return getattr(_local, 'retries', 0)
+
+
+def thread_throttles() -> int:
+    # Of thread_retries, those answering a 429
+    return getattr(_local, 'throttles', 0)
+
+
+class RetryPolicy:
+    # Exponential backoff with full jitter for retryable statuses and
+    # connection errors.
+    def __init__(self, max_retries: int = 5, backoff_factor: float = 0.5, max_backoff: float = 60,
+                 statuses: frozenset = RETRY_STATUSES):
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.statuses = statuses
+
+    def is_retryable(self, status_code: int) -> bool:
+        return status_code in self.statuses
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_backoff, self.backoff_factor * 2 ** attempt))
+
+
+def request_with_retry(send, rate_limiter: TokenBucket, retry_policy: RetryPolicy,
+                       limiter: threading.Semaphore = None) -> requests.Response:
+    # Calls `send` (a zero-argument function returning a requests Response)
+    # until it gets a non retryable answer or the retries run out. The last
+    # response is returned as is, so callers still decide on raise_for_status.
+    # `limiter` caps the requests in flight, e.g. across every client of an API.
+    attempt = 0
+    while True:
+        rate_limiter.acquire()
+        try:
+            if limiter is None:
+                response = send()
+            else:
+                with limiter:
+                    response = send()
+        except (requests.ConnectionError, requests.Timeout) as error:
+            if attempt >= retry_policy.max_retries:
+                raise
+            delay = retry_policy.backoff(attempt)
+            logger.warning(f'{error.__class__.__name__}, retrying in {delay:.2f}s')
+        else:
+            rate_limiter.update_from_headers(response.headers)
+            if not retry_policy.is_retryable(response.status_code) or attempt >= retry_policy.max_retries:
+                return response
+            delay = retry_after_seconds(response.headers)
+            if delay is None:
+                delay = retry_policy.backoff(attempt)
+            if response.status_code == 429:
+                _local.throttles = thread_throttles() + 1
+            logger.warning(f'{response.status_code} from {response.url}, retrying in {delay:.2f}s')
+            # Frees the connection of a streamed response
+            response.close()
+        time.sleep(delay)
+        attempt += 1
+        _local.retries = thread_retries() + 1
+
+
+async def async_request_with_retry(send, read, rate_limiter: TokenBucket, retry_policy: RetryPolicy):
+    # asyncio counterpart of request_with_retry for aiohttp. `send` returns
+    # the request context manager and `read` turns the final response into
+    # the value returned to the caller.
+    attempt = 0
+    while True:
+        wait = rate_limiter.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        try:
+            async with send() as response:
+                rate_limiter.update_from_headers(response.headers)
+                if not retry_policy.is_retryable(response.status) or attempt >= retry_policy.max_retries:
+                    return await read(response)
+                delay = retry_after_seconds(response.headers)
+                if delay is None:
+                    delay = retry_policy.backoff(attempt)
+                logger.warning(f'{response.status} from {response.url}, retrying in {delay:.2f}s')
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as error:
+            if attempt >= retry_policy.max_retries:
+                raise
+            delay = retry_policy.backoff(attempt)
+            logger.warning(f'{error.__class__.__name__}, retrying in {delay:.2f}s')
+        await asyncio.sleep(delay)
+        attempt += 1
@@ -0,0 +1,69 @@
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover - optional dependency
+    msgspec = None
+
+
+class StdlibSerializer:
+    name = 'json'
+
+    def dumps(self, obj) -> bytes:
+        return json.dumps(obj).encode()
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+class OrjsonSerializer:
+    name = 'orjson'
+
+    def __init__(self):
+        if orjson is None:
+            raise ImportError('orjson is not installed')
+
+    def dumps(self, obj) -> bytes:
+        return orjson.dumps(obj)
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+
+class MsgspecSerializer:
+    name = 'msgspec'
+
+    def __init__(self):
+        if msgspec is None:
+            raise ImportError('msgspec is not installed')
+        self._encoder = msgspec.json.Encoder()
+        self._decoder = msgspec.json.Decoder()
+
+    def dumps(self, obj) -> bytes:
+        return self._encoder.encode(obj)
+
+    def loads(self, data):
+        return self._decoder.decode(data)
+
+
+SERIALIZERS = {
+    'orjson': OrjsonSerializer,
+    'msgspec': MsgspecSerializer,
+    'json': StdlibSerializer,
+}
+
+
+def get_serializer(name: str = None):
+    # The named backend, or the fastest one installed (in SERIALIZERS order)
+    if name is not None:
+        return SERIALIZERS[name]()
+    for serializer in SERIALIZERS.values():
+        try:
+            return serializer()
+        except ImportError:
+            continue
@@ -1,41 +1,315 @@
+import argparse
+import asyncio
+import json
 import logging
-import time
+import os
 
-from sensedata_api import SensedataAPI
-from stitch_api import StitchApi
+from commons import GzipCompression, TokenBucket, get_serializer
+from sensedata_api import ResponseCache, SensedataAPI
+from sinks import NdjsonFileSink, ParquetFileSink, SQLiteSink, StitchSink
+from stitch_api import CustomFieldsSchema, DeadLetterFile, StitchApi, StitchBatcher
+from sync_engine import (AutoTuner, DedupCache, JsonLinesExporter, Metrics, PageCheckpoint, ParsePool,
+                         PrometheusTextExporter, Spool, SpoolSyncEngine, StreamingSyncEngine, SyncEngine, SyncState,
+                         TenantScheduler, load_tenants, run_tenants)
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
-if __name__ == '__main__':
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Syncs Sensedata entities into Stitch')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='number of concurrent Sensedata page fetches')
+    parser.add_argument('--prefetch', type=int, default=8,
+                        help='how many pages may be fetched ahead of the page being pushed')
+    parser.add_argument('--pool-size', type=int, default=10,
+                        help='keep-alive connections kept per API')
+    parser.add_argument('--page-limit', type=int, default=500,
+                        help='rows requested per Sensedata page')
+    parser.add_argument('--entity-page-limit', action='append', default=[], metavar='ENTITY=ROWS',
+                        help='rows per Sensedata page for ENTITY, overriding --page-limit, may be repeated')
+    parser.add_argument('--sensedata-rate', type=float, default=None,
+                        help='max Sensedata requests per second (default: only what the API asks for)')
+    parser.add_argument('--stitch-rate', type=float, default=None,
+                        help='max Stitch pushes per second (default: only what the API asks for)')
+    parser.add_argument('--gzip-level', type=int, default=None,
+                        help='gzip Stitch push bodies at this level, 1 (fastest) to 9 (smallest); off by default')
+    parser.add_argument('--gzip-threshold', type=int, default=1024,
+                        help='push bodies smaller than this many bytes are sent uncompressed')
+    parser.add_argument('--no-sensedata-compression', action='store_true',
+                        help='ask Sensedata for uncompressed responses')
+    parser.add_argument('--response-cache', default=None,
+                        help='directory caching Sensedata pages on disk, reused by later runs')
+    parser.add_argument('--response-cache-ttl', type=float, default=86400,
+                        help='seconds a cached page is used as is before it is revalidated or fetched again')
+    parser.add_argument('--response-cache-max-bytes', type=int, default=1024 * 1024 * 1024,
+                        help='least recently used pages are evicted past this size')
+    parser.add_argument('--offline', action='store_true',
+                        help='replay pages from --response-cache only, without requests to Sensedata')
+    parser.add_argument('--custom-fields', default=None,
+                        help='JSON file listing the customers custom fields to push; every customer gets exactly '
+                             'these columns and other fields are dropped')
+    parser.add_argument('--stable-custom-fields', action='store_true',
+                        help='give every customer a column for each custom field seen so far in the run')
+    parser.add_argument('--dead-letters', default=None,
+                        help='JSON lines file for records Stitch rejects; rejected batches are split to push the '
+                             'rest instead of failing the run')
+    parser.add_argument('--max-dead-letters', type=int, default=10,
+                        help='rejected records per batch after which the whole batch is taken as bad and the run fails')
+    parser.add_argument('--batch-bytes', type=int, default=4_000_000,
+                        help='max size of a Stitch push request body')
+    parser.add_argument('--batch-records', type=int, default=20_000,
+                        help='max records per Stitch push request')
+    parser.add_argument('--batch-wait', type=float, default=30.0,
+                        help='seconds a record may wait in the batch before it is pushed')
+    parser.add_argument('--state', default=None,
+                        help='state file with updated_at bookmarks; only changed rows are pushed when given')
+    parser.add_argument('--server-filter', action='append', default=[], metavar='ENTITY=PARAM',
+                        help='Sensedata query parameter filtering ENTITY by updated_at, may be repeated')
+    parser.add_argument('--sink', choices=['stitch', 'ndjson', 'parquet', 'sqlite'], default='stitch',
+                        help='where records go: the Stitch Import API, NDJSON or Parquet files (needs pyarrow) '
+                             'or an SQLite database (default engine only)')
+    parser.add_argument('--sink-path', default='export',
+                        help='directory of the NDJSON/Parquet files, or the SQLite database file')
+    parser.add_argument('--sink-gzip', action='store_true',
+                        help='gzip the NDJSON files')
+    parser.add_argument('--sink-rotate-bytes', type=int, default=256 * 1024 * 1024,
+                        help='start a new NDJSON file of a table after this many (uncompressed) bytes')
+    parser.add_argument('--sink-rotate-rows', type=int, default=500_000,
+                        help='rows per Parquet file')
+    parser.add_argument('--dedup-cache', default=None,
+                        help='SQLite file with the hash of every pushed record; unchanged records are skipped')
+    parser.add_argument('--dedup-max-age', type=float, default=30,
+                        help='days a record may go unseen before it is evicted from the dedup cache')
+    parser.add_argument('--checkpoint', default=None,
+                        help='file with the pages pushed so far; an interrupted run resumes after the last one')
+    parser.add_argument('--run-id', default=None,
+                        help='run to resume from --checkpoint (default: the unfinished run found there, '
+                             'or a new one)')
+    parser.add_argument('--autotune', default=None,
+                        help='tune pages in flight, page sizes and the batch size during the run and save them to '
+                             'this file as the starting point of the next run (default engine only)')
+    parser.add_argument('--autotune-max-workers', type=int, default=16,
+                        help='most Sensedata pages in flight the tuner may go up to')
+    parser.add_argument('--autotune-page-limits', type=int, nargs=2, default=[100, 5000], metavar=('MIN', 'MAX'),
+                        help='bounds of the page sizes the tuner may pick')
+    parser.add_argument('--stream', action='store_true',
+                        help='stream each page from Sensedata to Stitch with constant memory (no batching or dedup)')
+    parser.add_argument('--spool-dir', default=None,
+                        help='commit fetched pages to a durable spool in this directory and push them from it; '
+                             'an interrupted run resumes from the spool (no batching or dedup)')
+    parser.add_argument('--spool-segment-bytes', type=int, default=64 * 1024 * 1024,
+                        help='size at which a new spool segment file is started')
+    parser.add_argument('--spool-max-bytes', type=int, default=1024 * 1024 * 1024,
+                        help='fetching pauses while the spool holds more than this many bytes')
+    parser.add_argument('--metrics-jsonl', default=None,
+                        help='append one JSON line per fetch/parse/serialize/push event to this file')
+    parser.add_argument('--metrics-prom', default=None,
+                        help='write Prometheus text format metrics to this file at the end of the run')
+    parser.add_argument('--serializer', choices=['orjson', 'msgspec', 'json'], default=None,
+                        help='JSON backend (default: the fastest one installed)')
+    parser.add_argument('--parse-workers', type=int, default=0,
+                        help='parse pages on this many worker processes (1 parses raw pages in-process, '
+                             '0 keeps the default record pipeline)')
+    parser.add_argument('--tenants', default=None,
+                        help='JSON file listing several Sensedata/Stitch accounts to sync in parallel')
+    parser.add_argument('--state-dir', default=None,
+                        help='directory for one bookmarks state file per tenant with --tenants')
+    parser.add_argument('--tenant-workers', type=int, default=8,
+                        help='entity syncs allowed to run at once across all tenants with --tenants')
+    parser.add_argument('--max-per-tenant', type=int, default=2,
+                        help='entity syncs of one tenant allowed to run at once with --tenants')
+    parser.add_argument('--sensedata-concurrency', type=int, default=8,
+                        help='Sensedata requests in flight across all tenants with --tenants')
+    parser.add_argument('--stitch-concurrency', type=int, default=4,
+                        help='Stitch pushes in flight across all tenants with --tenants')
+    parser.add_argument('--asyncio', action='store_true',
+                        help='sync all entities concurrently on an asyncio event loop')
+    parser.add_argument('--max-concurrency', type=int, default=10,
+                        help='requests in flight across all entities when using --asyncio')
+    args = parser.parse_args()
+    if args.sink != 'stitch' and (args.stream or args.spool_dir or args.tenants or args.asyncio):
+        parser.error('--sink only applies to the default engine')
+    if args.offline and not args.response_cache:
+        parser.error('--offline needs --response-cache')
+    if args.offline and (args.stream or args.asyncio or args.tenants):
+        parser.error('--offline only replays whole pages, it cannot be used with --stream, --asyncio or --tenants')
+    if args.dead_letters and args.stream:
+        parser.error('--dead-letters cannot be used with --stream: streamed records are sent once and can\'t be '
+                     'split up again')
+    if args.checkpoint and (args.stream or args.spool_dir or args.tenants or args.asyncio):
+        parser.error('--checkpoint only applies to the default engine, not to --stream, --spool-dir, --tenants '
+                     'or --asyncio')
+    if args.spool_max_bytes <= args.spool_segment_bytes:
+        parser.error('--spool-max-bytes must be larger than --spool-segment-bytes')
+    return args
+
+
+def build_sink(args, stitch: StitchApi, serializer, metrics: Metrics):
+    if args.sink == 'ndjson':
+        return NdjsonFileSink(args.sink_path, rotate_bytes=args.sink_rotate_bytes, compress=args.sink_gzip,
+                              serializer=serializer, metrics=metrics)
+    if args.sink == 'parquet':
+        return ParquetFileSink(args.sink_path, rotate_rows=args.sink_rotate_rows, serializer=serializer,
+                               metrics=metrics)
+    if args.sink == 'sqlite':
+        return SQLiteSink(args.sink_path, serializer=serializer, metrics=metrics)
+    batcher = StitchBatcher(stitch=stitch, max_bytes=args.batch_bytes, max_records=args.batch_records,
+                            max_wait=args.batch_wait, metrics=metrics, serializer=serializer)
+    return StitchSink(stitch, batcher=batcher, metrics=metrics, serializer=serializer)
+
+
+def finish_run(metrics: Metrics, dead_letters: DeadLetterFile = None, response_cache: ResponseCache = None):
+    metrics.close()
+    logger.info(f'run summary:\n{metrics.summary_table()}')
+    if response_cache is not None:
+        logger.info(f'response cache: {response_cache.stats()}')
+        response_cache.close()
+    if dead_letters is not None:
+        dead_letters.close()
+        if dead_letters.count:
+            logger.warning(f'{dead_letters.count} records rejected by stitch, see {dead_letters.path}')
+
+
+def run_threaded(args, entities: list):
+    serializer = get_serializer(args.serializer)
+    logger.info(f'serializing with {serializer.name}')
+
     # Starts Sensedata API services
-    sense_data_api = SensedataAPI()
+    limits = {entity: int(limit) for entity, limit in
+              (entity_limit.split('=', 1) for entity_limit in args.entity_page_limit)}
+    response_cache = None
+    if args.response_cache:
+        response_cache = ResponseCache(args.response_cache, ttl=args.response_cache_ttl,
+                                       max_bytes=args.response_cache_max_bytes, offline=args.offline)
+    sense_data_api = SensedataAPI(pool_size=max(args.pool_size, args.workers), limit=args.page_limit, limits=limits,
+                                  rate_limiter=TokenBucket(rate=args.sensedata_rate), serializer=serializer,
+                                  compressed_responses=not args.no_sensedata_compression,
+                                  response_cache=response_cache)
 
     # Starts Stitch API services
-    stitch = StitchApi()
+    compression = None
+    if args.gzip_level is not None:
+        compression = GzipCompression(level=args.gzip_level, threshold=args.gzip_threshold)
+    custom_fields = None
+    if args.custom_fields:
+        with open(args.custom_fields) as custom_fields_file:
+            custom_fields = json.load(custom_fields_file)
+    dead_letters = DeadLetterFile(args.dead_letters) if args.dead_letters else None
+    stitch = StitchApi(pool_size=args.pool_size, rate_limiter=TokenBucket(rate=args.stitch_rate),
+                       serializer=serializer, compression=compression,
+                       custom_fields_schema=CustomFieldsSchema(declared=custom_fields,
+                                                               stable=args.stable_custom_fields),
+                       dead_letters=dead_letters, max_dead_letters=args.max_dead_letters)
+
+    hooks = []
+    if args.metrics_jsonl:
+        hooks.append(JsonLinesExporter(args.metrics_jsonl))
+    if args.metrics_prom:
+        hooks.append(PrometheusTextExporter(args.metrics_prom))
+    tuner = None
+    if args.autotune:
+        tuner = AutoTuner(args.autotune, fetch_concurrency=args.workers,
+                          max_fetch_concurrency=args.autotune_max_workers,
+                          min_page_size=args.autotune_page_limits[0], max_page_size=args.autotune_page_limits[1],
+                          batch_bytes=args.batch_bytes, max_batch_bytes=args.batch_bytes)
+        hooks.append(tuner)
+    metrics = Metrics(hooks=hooks)
+
+    state = SyncState(args.state) if args.state else None
+    server_filters = dict(server_filter.split('=', 1) for server_filter in args.server_filter)
+    if args.stream:
+        engine = StreamingSyncEngine(sense_data_api=sense_data_api, stitch=stitch,
+                                     state=state, server_filters=server_filters, metrics=metrics)
+        with sense_data_api, stitch:
+            engine.run(entities=entities)
+        finish_run(metrics, dead_letters, response_cache)
+        return
+
+    if args.spool_dir:
+        spool = Spool(args.spool_dir, segment_bytes=args.spool_segment_bytes, max_bytes=args.spool_max_bytes)
+        engine = SpoolSyncEngine(sense_data_api=sense_data_api, stitch=stitch, spool=spool,
+                                 workers=args.workers, prefetch=args.prefetch, state=state,
+                                 server_filters=server_filters, metrics=metrics, serializer=serializer)
+        with sense_data_api, stitch:
+            try:
+                engine.run(entities=entities)
+            finally:
+                spool.close()
+        finish_run(metrics, dead_letters, response_cache)
+        return
+
+    sink = build_sink(args, stitch, serializer, metrics)
+    batcher = sink.batcher if isinstance(sink, StitchSink) else None
+    dedup = DedupCache(args.dedup_cache, max_age_days=args.dedup_max_age) if args.dedup_cache else None
+    parse_pool = None
+    if args.parse_workers:
+        parse_pool = ParsePool(client_id=stitch.client_id, serializer_name=serializer.name,
+                               workers=args.parse_workers, custom_fields=custom_fields,
+                               stable_custom_fields=args.stable_custom_fields)
+    checkpoint = PageCheckpoint(args.checkpoint, run_id=args.run_id) if args.checkpoint else None
+    engine = SyncEngine(sense_data_api=sense_data_api, stitch=stitch,
+                        workers=args.workers, prefetch=args.prefetch, batcher=batcher,
+                        state=state, server_filters=server_filters, dedup=dedup, metrics=metrics,
+                        serializer=serializer, parse_pool=parse_pool, checkpoint=checkpoint, tuner=tuner,
+                        sink=sink)
+    with sense_data_api, stitch:
+        engine.run(entities=entities)
+        if tuner is not None:
+            tuner.save()
+        sink.close()
+        if batcher is not None:
+            logger.info(f'stitch pushes: {batcher.pushes}, records: {batcher.records_pushed}')
+            logger.info(f'stitch connections: {stitch.connection_stats()}')
+        else:
+            logger.info(f'{sink.records_written} records written to {args.sink_path}')
+        logger.info(f'sensedata connections: {sense_data_api.connection_stats()}')
+    if dedup is not None:
+        dedup.close()
+    if parse_pool is not None:
+        parse_pool.close()
+    finish_run(metrics, dead_letters, response_cache)
 
-    # List with all Sensedata entities that
-    # must sync with sticth
-    entities = ['contacts', 'customers', 'nps', 'tasks']
 
-    for entity in entities:
+def run_tenants_threaded(args, entities: list):
+    scheduler = TenantScheduler(tenants=load_tenants(args.tenants), entities=entities,
+                                max_workers=args.tenant_workers, max_per_tenant=args.max_per_tenant,
+                                page_workers=args.workers,
+                                sensedata_concurrency=args.sensedata_concurrency,
+                                stitch_concurrency=args.stitch_concurrency, prefetch=args.prefetch,
+                                state_dir=args.state_dir)
+    report = scheduler.run()
+    for name, tenant_report in report.items():
+        logger.info(f"{name}: {tenant_report['status']}, {tenant_report['rows']} rows "
+                    f"in {tenant_report['seconds']:.1f}s")
+        for entity_name, result in tenant_report['entities'].items():
+            logger.info(f"  {entity_name}: {result['rows']} rows in {result['seconds']:.1f}s"
+                        + (f", error: {result['error']}" if result['error'] else ''))
 
-        for page_number in range(1, 500):
-            temp_data = sense_data_api.get_entity_data(entity_name=entity, page=page_number)
 
-            # Count is 0 when pagination ends
-            if temp_data['count'] == 0:
-                break
+def run_asyncio(args, entities: list):
+    tenant = {
+        'name': 'default',
+        'sensedata_token': os.getenv('SENSEDATA_TOKEN'),
+        'stitch_integration_token': os.getenv('STITCH_INTEGRATION_TOKEN'),
+        'stitch_client_id': os.getenv('STITCH_CLIENT_ID'),
+    }
+    asyncio.run(run_tenants(tenants=[tenant], entities=entities,
+                            max_concurrency=args.max_concurrency, prefetch=args.prefetch))
 
-            # logs the page end result len
-            logger.info(f'page: {page_number}, rows= {len(temp_data[entity])}')
 
-            # makes json result as stitch object
-            object_as_str = stitch.paser_entity_data_to_stitch_standard(data=temp_data[entity],
-                                                                        entity_name=entity)
+if __name__ == '__main__':
+    args = parse_args()
+
+    # List with all Sensedata entities that
+    # must sync with sticth
+    entities = ['contacts', 'customers', 'nps', 'tasks']
 
-            # Pushes data to stitch server
-            stitch.push_data_to_stitch(data=object_as_str)
-            time.sleep(3)
+    if args.tenants:
+        run_tenants_threaded(args, entities)
+    elif args.asyncio:
+        run_asyncio(args, entities)
+    else:
+        run_threaded(args, entities)
 
     logger.info("sync has been finished")
@@ -1,5 +1,10 @@
+from .async_sensedata_api import AsyncSensedataAPI
+from .response_cache import ResponseCache, ResponseCacheMiss
 from .sensedata_api import SensedataAPI
 
 __all__: [
+    'AsyncSensedataAPI',
+    'ResponseCache',
+    'ResponseCacheMiss',
     'SensedataAPI'
-]
\ No newline at end of file
+]
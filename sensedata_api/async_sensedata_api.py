@@ -0,0 +1,39 @@
+from commons import async_request_with_retry, build_async_session
+
+from .sensedata_api import SensedataAPI
+
+
+class AsyncSensedataAPI(SensedataAPI):
+    # asyncio counterpart of SensedataAPI backed by aiohttp. The aiohttp
+    # session is created lazily because it must belong to a running loop.
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _build_session(self):
+        return None
+
+    def _get_session(self):
+        if self.session is None:
+            self.session = build_async_session(headers=self.headers, pool_size=self.pool_size,
+                                               timeout=self.timeout)
+        return self.session
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def connection_stats(self) -> dict:
+        return {}
+
+    async def get_entity_data(self, entity_name: str, page: int, filters: dict = None) -> dict:
+        async def read(response) -> dict:
+            response.raise_for_status()
+            return self.serializer.loads(await response.read())
+
+        endpoint = self._entity_endpoint(entity_name, page, filters)
+        return await async_request_with_retry(lambda: self._get_session().get(endpoint), read,
+                                              rate_limiter=self.rate_limiter, retry_policy=self.retry_policy)
@@ -0,0 +1,150 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+CachedResponse = namedtuple('CachedResponse', 'body etag last_modified fresh')
+
+
+class ResponseCacheMiss(LookupError):
+    pass
+
+
+class ResponseCache:
+    # On-disk cache of Sensedata response bodies, decompressed, keyed by the
+    # request URL (entity, page, limit and filters) and the token it was made
+    # with. Bodies are files under `directory`; an SQLite index keeps their
+    # size, validators and when they were stored and last used.
+    #
+    # Entries younger than ttl seconds are served as they are. Older ones are
+    # revalidated with If-None-Match/If-Modified-Since when the response had
+    # an ETag or Last-Modified, and fetched again otherwise. Past max_bytes
+    # the least recently used entries are evicted.
+    #
+    # In offline mode every cached entry is served whatever its age and a
+    # page that isn't cached raises ResponseCacheMiss, no request is made.
+    def __init__(self, directory: str, ttl: float = 86400, max_bytes: int = 1024 * 1024 * 1024,
+                 offline: bool = False, clock=time.time):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        # Pages are fetched from several threads, every use holds the lock
+        self.connection = sqlite3.connect(os.path.join(directory, 'index.db'), check_same_thread=False)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            ' key TEXT PRIMARY KEY,'
+            ' size INTEGER NOT NULL,'
+            ' etag TEXT,'
+            ' last_modified TEXT,'
+            ' stored_at REAL NOT NULL,'
+            ' used_at REAL NOT NULL)'
+        )
+        self.connection.execute('CREATE INDEX IF NOT EXISTS responses_used_at ON responses (used_at)')
+        self._size = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    @staticmethod
+    def key(url: str, scope: str = '') -> str:
+        return hashlib.sha256(f'{scope}\n{url}'.encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key: str) -> CachedResponse:
+        # None when the key isn't cached
+        now = self.clock()
+        with self._lock:
+            row = self.connection.execute('SELECT etag, last_modified, stored_at FROM responses WHERE key = ?',
+                                          (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            try:
+                with open(self._path(key), 'rb') as body_file:
+                    body = body_file.read()
+            except FileNotFoundError:
+                # Removed from under the index
+                self._delete(key)
+                self.misses += 1
+                return None
+            with self.connection:
+                self.connection.execute('UPDATE responses SET used_at = ? WHERE key = ?', (now, key))
+            etag, last_modified, stored_at = row
+            fresh = now - stored_at < self.ttl
+            if fresh or self.offline:
+                self.hits += 1
+            return CachedResponse(body, etag, last_modified, fresh)
+
+    def revalidated(self, key: str):
+        # The server answered 304, the entry is fresh again
+        with self._lock, self.connection:
+            self.connection.execute('UPDATE responses SET stored_at = ? WHERE key = ?', (self.clock(), key))
+            self.revalidations += 1
+
+    def put(self, key: str, body: bytes, etag: str = None, last_modified: str = None):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as body_file:
+            body_file.write(body)
+        os.replace(tmp_path, path)
+
+        now = self.clock()
+        with self._lock:
+            previous = self.connection.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            with self.connection:
+                self.connection.execute(
+                    'INSERT OR REPLACE INTO responses (key, size, etag, last_modified, stored_at, used_at)'
+                    ' VALUES (?, ?, ?, ?, ?, ?)', (key, len(body), etag, last_modified, now, now))
+            self._size += len(body) - (previous[0] if previous else 0)
+            self._evict()
+
+    def _evict(self):
+        if self._size <= self.max_bytes:
+            return
+        for key, size in self.connection.execute('SELECT key, size FROM responses ORDER BY used_at').fetchall():
+            if self._size <= self.max_bytes:
+                break
+            self._delete(key)
+            self.evictions += 1
+
+    def _delete(self, key: str):
+        row = self.connection.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return
+        with self.connection:
+            self.connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+        self._size -= row[0]
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'revalidations': self.revalidations,
+                'evictions': self.evictions, 'bytes': self._size}
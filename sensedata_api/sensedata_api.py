@@ -1,20 +1,182 @@
 import json
+import math
 import os
+from urllib.parse import urlencode
 
-import requests
+from commons import (ACCEPT_ENCODING, RetryPolicy, TokenBucket, build_session, connection_stats, count_transfer,
+                     get_serializer, iter_array_items, iter_counted, iter_decompressed, request_with_retry)
 
+from .response_cache import ResponseCache, ResponseCacheMiss
 
-class SensedataAPI:
-    def __init__(self):
-        self.base_url = 'https://api.sensedata.io'
-        self.token = os.getenv('SENSEDATA_TOKEN')
 
-    def get_entity_data(self, entity_name: str, page: int) -> json:
-        endpoint = f"{self.base_url}/v2/{entity_name}?page={page}&limit=500"
-        headers = {
+class SensedataAPI:
+    # `limit` is the page size, `limits` overrides it per entity.
+    #
+    # With compressed_responses, gzip/deflate responses are asked for and
+    # decompressed here as they stream in rather than by urllib3, so the
+    # bytes on the wire can be counted (see commons.thread_transfer).
+    #
+    # With a response_cache, whole pages (get_entity_page_bytes and
+    # get_entity_data) are served from and stored in it; streamed rows
+    # (iter_entity_rows) always come from the API.
+    def __init__(self, base_url: str = 'https://api.sensedata.io', token: str = None, limit: int = 500,
+                 pool_size: int = 10, timeout: tuple = (10, 60), rate_limiter: TokenBucket = None,
+                 retry_policy: RetryPolicy = None, serializer=None, concurrency_limiter=None, limits: dict = None,
+                 compressed_responses: bool = True, response_cache: ResponseCache = None):
+        self.base_url = base_url
+        self.token = token or os.getenv('SENSEDATA_TOKEN')
+        self.limit = limit
+        self.limits = limits or {}
+        self._full_page_limits = {}  # entity -> limits the server returned full pages for
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter or TokenBucket()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.serializer = serializer or get_serializer()
+        # Semaphore shared with other clients of the same API, see TenantScheduler
+        self.concurrency_limiter = concurrency_limiter
+        self.response_cache = response_cache
+        self.headers = {
             'Authorization': self.token,
             'Content-Type': 'application/json',
+            'Accept-Encoding': ACCEPT_ENCODING if compressed_responses else 'identity',
         }
-        response = requests.get(url=endpoint, headers=headers)
+        self.session = self._build_session()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _build_session(self):
+        return build_session(headers=self.headers, pool_size=self.pool_size)
+
+    def close(self):
+        self.session.close()
+
+    def connection_stats(self) -> dict:
+        return connection_stats(self.session)
+
+    def page_limit(self, entity_name: str) -> int:
+        return self.limits.get(entity_name, self.limit)
+
+    def is_last_short_page(self, entity_name: str, count: int) -> bool:
+        # A page shorter than the limit is the last one, but only once a full
+        # page at that limit was seen: a server that caps the page size
+        # returns short pages all the way through
+        limit = self.page_limit(entity_name)
+        if count >= limit:
+            self._full_page_limits.setdefault(entity_name, set()).add(limit)
+            return False
+        return limit in self._full_page_limits.get(entity_name, ())
+
+    def last_page(self, entity_name: str, page: int, data: dict) -> int:
+        # The last page of the entity as far as `page` tells, None while unknown.
+        # A short page ends the entity as told by is_last_short_page; otherwise
+        # pagination metadata in the response (at the top level or under
+        # "pagination") may give the total or say there is no next page.
+        if self.is_last_short_page(entity_name, data['count']):
+            return page
+        limit = self.page_limit(entity_name)
+        pagination = data.get('pagination') or data
+        if pagination.get('total_pages') is not None:
+            return int(pagination['total_pages'])
+        if pagination.get('total') is not None and limit in self._full_page_limits.get(entity_name, ()):
+            return math.ceil(int(pagination['total']) / limit)
+        if pagination.get('has_more') is False:
+            return page
+        for key in ('next_page', 'next'):
+            if key in pagination and not pagination[key]:
+                return page
+        return None
+
+    def iter_pages(self, entity_name: str, first_page: int = 1, filters: dict = None):
+        # Yields (page number, page data) until the last page, see last_page;
+        # PagePipeline does the same with pages fetched in parallel
+        page = first_page
+        while True:
+            data = self.get_entity_data(entity_name=entity_name, page=page, filters=filters)
+            if data['count'] == 0:
+                return
+            yield page, data
+            last_page = self.last_page(entity_name, page, data)
+            if last_page is not None and page >= last_page:
+                return
+            page += 1
+
+    def _entity_endpoint(self, entity_name: str, page: int, filters: dict = None) -> str:
+        endpoint = f"{self.base_url}/v2/{entity_name}?page={page}&limit={self.page_limit(entity_name)}"
+        if filters:
+            endpoint = f"{endpoint}&{urlencode(filters)}"
+        return endpoint
+
+    def get_entity_page_bytes(self, entity_name: str, page: int, filters: dict = None) -> bytes:
+        # The JSON response body, decompressed but not decoded, e.g. to hand it to another process
+        endpoint = self._entity_endpoint(entity_name, page, filters)
+        if self.response_cache is not None:
+            return self._cached_page_bytes(endpoint)
+        return self._read_body(self._get(endpoint))
+
+    def _cached_page_bytes(self, endpoint: str) -> bytes:
+        cache = self.response_cache
+        key = cache.key(endpoint, scope=self.token or '')
+        cached = cache.get(key)
+        if cached is not None and (cached.fresh or cache.offline):
+            return cached.body
+        if cache.offline:
+            raise ResponseCacheMiss(f'{endpoint} is not in the response cache')
+
+        headers = {}
+        if cached is not None and cached.etag:
+            headers['If-None-Match'] = cached.etag
+        if cached is not None and cached.last_modified:
+            headers['If-Modified-Since'] = cached.last_modified
+        response = self._get(endpoint, headers=headers or None)
+        if response.status_code == 304 and cached is not None:
+            response.close()
+            cache.revalidated(key)
+            return cached.body
+        body = self._read_body(response)
+        cache.put(key, body, etag=response.headers.get('ETag'), last_modified=response.headers.get('Last-Modified'))
+        return body
+
+    def _get(self, endpoint: str, headers: dict = None):
+        return request_with_retry(lambda: self.session.get(url=endpoint, timeout=self.timeout, stream=True,
+                                                           headers=headers),
+                                  rate_limiter=self.rate_limiter, retry_policy=self.retry_policy,
+                                  limiter=self.concurrency_limiter)
+
+    def _read_body(self, response) -> bytes:
         response.raise_for_status()
-        return response.json()
+        if not response.headers.get('Content-Encoding'):
+            body = response.content
+            count_transfer('received', len(body), len(body))
+            return body
+        return b''.join(self._iter_body(response))
+
+    def _iter_body(self, response, chunk_size: int = 65536):
+        encoding = response.headers.get('Content-Encoding')
+        if not encoding:
+            yield from iter_counted(response.iter_content(chunk_size=chunk_size), 'received')
+            return
+        wire = iter_counted(response.raw.stream(chunk_size, decode_content=False), 'received', raw=False)
+        yield from iter_counted(iter_decompressed(wire, encoding), 'received', wire=False)
+        # Fully read, so the connection can go back to the pool
+        response.raw.release_conn()
+
+    def get_entity_data(self, entity_name: str, page: int, filters: dict = None) -> json:
+        return self.serializer.loads(self.get_entity_page_bytes(entity_name, page, filters))
+
+    def iter_entity_rows(self, entity_name: str, page: int, filters: dict = None, chunk_size: int = 65536):
+        # Streams the rows of one page as they arrive instead of loading the
+        # whole response; an empty iterator means pagination has ended.
+        endpoint = self._entity_endpoint(entity_name, page, filters)
+        response = request_with_retry(lambda: self.session.get(url=endpoint, timeout=self.timeout, stream=True),
+                                      rate_limiter=self.rate_limiter, retry_policy=self.retry_policy,
+                                      limiter=self.concurrency_limiter)
+        try:
+            response.raise_for_status()
+            yield from iter_array_items(self._iter_body(response, chunk_size), entity_name)
+        finally:
+            response.close()
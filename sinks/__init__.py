@@ -0,0 +1,11 @@
+from .base import Sink, StitchSink
+from .files import NdjsonFileSink, ParquetFileSink
+from .sqlite import SQLiteSink
+
+__all__: [
+    'NdjsonFileSink',
+    'ParquetFileSink',
+    'SQLiteSink',
+    'Sink',
+    'StitchSink',
+]
@@ -0,0 +1,116 @@
+import abc
+from contextlib import nullcontext
+
+from commons import get_serializer
+from stitch_api import RecordPage
+from stitch_api.batcher import push_with_metrics
+
+
+def record_data(records) -> list:
+    # The data of each record, from a list of Stitch records or a RecordPage
+    if isinstance(records, RecordPage):
+        return list(records.iter_data())
+    return [record['data'] for record in records]
+
+
+def record_key_names(records) -> list:
+    if isinstance(records, RecordPage):
+        return records.key_names
+    return records[0]['key_names']
+
+
+def encode_records(records, serializer) -> list:
+    # Each record serialized on its own, from a list of Stitch records or a RecordPage
+    if isinstance(records, RecordPage):
+        return records.encode(serializer)
+    return [serializer.dumps(record) for record in records]
+
+
+class Sink(abc.ABC):
+    # Destination of the parsed records of a sync. write() gets the records
+    # of one page of `table_name`, a list of Stitch records or a RecordPage,
+    # and calls on_written once they are safely stored, which may be later
+    # (e.g. when a batch is pushed or a file is complete). write_encoded() is
+    # the same for records already serialized one by one, e.g. by a
+    # ParsePool; by default they are decoded with `serializer` and written.
+    # flush() stores whatever is still buffered and close() releases the sink.
+    serializer = None
+    # sync_engine.Metrics, optional so a sink can be used on its own
+    metrics = None
+
+    @abc.abstractmethod
+    def write(self, table_name: str, records, on_written=None):
+        pass
+
+    def write_encoded(self, table_name: str, encoded_records: list, on_written=None):
+        loads = self.serializer.loads
+        self.write(table_name, [loads(encoded) for encoded in encoded_records], on_written=on_written)
+
+    def _timed(self, table_name: str, rows: int):
+        # A push event for one write, values of which may be added to
+        if self.metrics is None:
+            return nullcontext({})
+        return self.metrics.timer('push', table_name, rows=rows)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class StitchSink(Sink):
+    # The Stitch Import API. With a StitchBatcher, records of several pages
+    # and tables are pushed together as the batch limits allow; without one
+    # every write is pushed on its own.
+    def __init__(self, stitch, batcher=None, metrics=None, serializer=None):
+        self.stitch = stitch
+        self.batcher = batcher
+        self.metrics = metrics
+        self.serializer = serializer or get_serializer()
+        self.records_written = 0
+
+    def write(self, table_name: str, records, on_written=None):
+        self.records_written += len(records)
+        if self.batcher is not None:
+            self.batcher.add(records, on_pushed=on_written)
+            return
+        if self.metrics is None:
+            data = self._dumps(records)
+        else:
+            with self.metrics.timer('serialize', table_name, rows=len(records)) as values:
+                data = self._dumps(records)
+                values['bytes'] = len(data)
+        self._push(table_name, len(records), data, on_written)
+
+    def _dumps(self, records) -> bytes:
+        if isinstance(records, RecordPage):
+            return records.dumps(self.serializer)
+        return self.serializer.dumps(records)
+
+    def write_encoded(self, table_name: str, encoded_records: list, on_written=None):
+        self.records_written += len(encoded_records)
+        if self.batcher is not None:
+            self.batcher.add_encoded(table_name, encoded_records, on_pushed=on_written)
+            return
+        self._push(table_name, len(encoded_records), b'[' + b','.join(encoded_records) + b']', on_written)
+
+    def _push(self, table_name: str, rows: int, data: bytes, on_written):
+        push_with_metrics(self.stitch, data, metrics=self.metrics, entity=table_name, rows=rows)
+        if on_written is not None:
+            on_written()
+
+    def flush(self):
+        if self.batcher is not None:
+            self.batcher.flush()
+
+    def close(self):
+        self.flush()
+        if self.batcher is not None:
+            self.batcher.close()
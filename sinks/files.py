@@ -0,0 +1,191 @@
+import gzip
+import json
+import logging
+import os
+import re
+import threading
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover - optional dependency
+    pyarrow = None
+
+from commons import get_serializer
+
+from .base import Sink, encode_records, record_data
+
+logger = logging.getLogger(__name__)
+
+
+class _FileSink(Sink):
+    # Files of a table are <directory>/<table>/<table>-000001<suffix>, ...
+    # numbered on from whatever is there, so nothing is ever overwritten.
+    # A file is written as <name>.part and renamed once complete, so bulk
+    # loaders can take every file without the suffix. Parts left by an
+    # interrupted run are removed: their pages were never reported written.
+    suffix = ''
+
+    def __init__(self, directory: str, serializer=None, metrics=None):
+        self.directory = directory
+        self.serializer = serializer or get_serializer()
+        self.metrics = metrics
+        self.files_written = 0
+        self.records_written = 0
+        self._indexes = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _next_path(self, table_name: str) -> str:
+        table_directory = os.path.join(self.directory, table_name)
+        if table_name not in self._indexes:
+            os.makedirs(table_directory, exist_ok=True)
+            pattern = re.compile(rf'{re.escape(table_name)}-(\d+){re.escape(self.suffix)}(\.part)?$')
+            index = 0
+            for name in os.listdir(table_directory):
+                match = pattern.match(name)
+                if match is None:
+                    continue
+                if match.group(2):
+                    logger.warning(f'removing {name}, left incomplete by an earlier run')
+                    os.remove(os.path.join(table_directory, name))
+                else:
+                    index = max(index, int(match.group(1)))
+            self._indexes[table_name] = index
+        self._indexes[table_name] += 1
+        return os.path.join(table_directory, f'{table_name}-{self._indexes[table_name]:06d}{self.suffix}')
+
+    def _completed(self, path: str, records: int, callbacks: list):
+        os.replace(f'{path}.part', path)
+        self.files_written += 1
+        logger.info(f'wrote {records} records to {path}')
+        for callback in callbacks:
+            callback()
+
+
+class NdjsonFileSink(_FileSink):
+    # One Stitch record per line, appended through a buffer of buffer_bytes.
+    # A table's file is completed and the next one started once rotate_bytes
+    # (uncompressed) were written to it. With compress, files are gzipped.
+    def __init__(self, directory: str, rotate_bytes: int = 256 * 1024 * 1024, compress: bool = False,
+                 compress_level: int = 6, buffer_bytes: int = 1024 * 1024, serializer=None, metrics=None):
+        self.suffix = '.ndjson.gz' if compress else '.ndjson'
+        super().__init__(directory, serializer=serializer, metrics=metrics)
+        self.rotate_bytes = rotate_bytes
+        self.compress = compress
+        self.compress_level = compress_level
+        self.buffer_bytes = buffer_bytes
+        # table name -> [path, file, bytes, records, callbacks]
+        self._open = {}
+
+    def _open_file(self, table_name: str) -> list:
+        path = self._next_path(table_name)
+        raw = open(f'{path}.part', 'ab', buffering=self.buffer_bytes)
+        if self.compress:
+            # gzip buffers its input on its own; the raw file buffers its output
+            output = gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=self.compress_level)
+            return [path, output, 0, 0, [], raw]
+        return [path, raw, 0, 0, [], None]
+
+    def write(self, table_name: str, records, on_written=None):
+        self.write_encoded(table_name, encode_records(records, self.serializer), on_written=on_written)
+
+    def write_encoded(self, table_name: str, encoded_records: list, on_written=None):
+        if not encoded_records:
+            if on_written is not None:
+                on_written()
+            return
+        with self._timed(table_name, len(encoded_records)) as values:
+            values['bytes'] = sum(map(len, encoded_records))
+            self._write_lines(table_name, encoded_records, on_written)
+
+    def _write_lines(self, table_name: str, encoded_records: list, on_written):
+        with self._lock:
+            current = self._open.get(table_name)
+            if current is None:
+                current = self._open[table_name] = self._open_file(table_name)
+            current[1].write(b'\n'.join(encoded_records) + b'\n')
+            current[2] += sum(map(len, encoded_records)) + len(encoded_records)
+            current[3] += len(encoded_records)
+            self.records_written += len(encoded_records)
+            if on_written is not None:
+                current[4].append(on_written)
+            if current[2] >= self.rotate_bytes:
+                self._close_file(self._open.pop(table_name))
+
+    def _close_file(self, current: list):
+        path, output, _, records, callbacks, raw = current
+        output.close()
+        if raw is not None:
+            raw.close()
+        self._completed(path, records, callbacks)
+
+    def flush(self):
+        # Completes every open file
+        with self._lock:
+            for table_name in list(self._open):
+                self._close_file(self._open.pop(table_name))
+
+
+class ParquetFileSink(_FileSink):
+    # The `data` of the records, one Parquet file per rotate_rows rows of a
+    # table. Parquet files can't be appended to, so rows are buffered until
+    # then; rotate_rows bounds the memory used. Needs pyarrow.
+    #
+    # A file has a column for every field of any of its rows (rows often
+    # differ in their custom fields), null where a row doesn't have it, and
+    # each column's type is inferred from all of its values. A column whose
+    # values have no common type (custom fields may hold text, numbers and
+    # booleans) is written as strings, JSON-encoded unless already text.
+    suffix = '.parquet'
+
+    def __init__(self, directory: str, rotate_rows: int = 500_000, compression: str = 'zstd', serializer=None,
+                 metrics=None):
+        if pyarrow is None:
+            raise ImportError('pyarrow is not installed')
+        super().__init__(directory, serializer=serializer, metrics=metrics)
+        self.rotate_rows = rotate_rows
+        self.compression = compression
+        # table name -> [rows, callbacks]
+        self._buffers = {}
+
+    def write(self, table_name: str, records, on_written=None):
+        rows = record_data(records)
+        with self._timed(table_name, len(rows)), self._lock:
+            buffer = self._buffers.setdefault(table_name, [[], []])
+            buffer[0].extend(rows)
+            self.records_written += len(rows)
+            if on_written is not None:
+                buffer[1].append(on_written)
+            if len(buffer[0]) >= self.rotate_rows:
+                self._write_file(table_name, self._buffers.pop(table_name))
+
+    def _write_file(self, table_name: str, buffer: list):
+        rows, callbacks = buffer
+        if not rows:
+            for callback in callbacks:
+                callback()
+            return
+        path = self._next_path(table_name)
+        pyarrow.parquet.write_table(self._table(rows), f'{path}.part', compression=self.compression)
+        self._completed(path, len(rows), callbacks)
+
+    @classmethod
+    def _table(cls, rows: list):
+        columns = list(dict.fromkeys(column for row in rows for column in row))
+        arrays = [cls._array([row.get(column) for row in rows]) for column in columns]
+        schema = pyarrow.schema([(column, array.type) for column, array in zip(columns, arrays)])
+        return pyarrow.Table.from_arrays(arrays, schema=schema)
+
+    @staticmethod
+    def _array(values: list):
+        try:
+            return pyarrow.array(values)
+        except (pyarrow.ArrowTypeError, pyarrow.ArrowInvalid):
+            return pyarrow.array([value if value is None or isinstance(value, str) else json.dumps(value)
+                                  for value in values], type=pyarrow.string())
+
+    def flush(self):
+        with self._lock:
+            for table_name in list(self._buffers):
+                self._write_file(table_name, self._buffers.pop(table_name))
@@ -0,0 +1,72 @@
+import json
+import sqlite3
+import threading
+
+from commons import get_serializer
+
+from .base import Sink, record_data, record_key_names
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _column_value(value):
+    # Nested objects and lists are kept as JSON text
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+
+class SQLiteSink(Sink):
+    # Local stand-in for a warehouse bulk load: one table per Stitch table,
+    # with a column per data field (added as new fields show up) and the
+    # record key_names as primary key, so a record replaces the earlier
+    # version of the same row like a Stitch upsert does. Each write is one
+    # executemany in one transaction; on_written is called once committed.
+    def __init__(self, path: str, serializer=None, metrics=None):
+        self.path = path
+        self.serializer = serializer or get_serializer()
+        self.metrics = metrics
+        self.records_written = 0
+        self._columns = {}
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+
+    def _ensure_table(self, table_name: str, key_names: list, columns: list):
+        known = self._columns.get(table_name)
+        if known is None:
+            known = [row[1] for row in self.connection.execute(f'PRAGMA table_info({_quote(table_name)})')]
+            if not known:
+                definitions = ', '.join(_quote(column) for column in columns)
+                keys = ', '.join(_quote(key) for key in key_names)
+                self.connection.execute(f'CREATE TABLE {_quote(table_name)} ({definitions}, PRIMARY KEY ({keys}))')
+                known = list(columns)
+            self._columns[table_name] = known
+        for column in columns:
+            if column not in known:
+                self.connection.execute(f'ALTER TABLE {_quote(table_name)} ADD COLUMN {_quote(column)}')
+                known.append(column)
+        return known
+
+    def write(self, table_name: str, records, on_written=None):
+        rows = record_data(records)
+        if rows:
+            with self._timed(table_name, len(rows)):
+                self._upsert(table_name, record_key_names(records), rows)
+        if on_written is not None:
+            on_written()
+
+    def _upsert(self, table_name: str, key_names: list, rows: list):
+        columns = list(dict.fromkeys(column for row in rows for column in row))
+        with self._lock, self.connection:
+            known = self._ensure_table(table_name, key_names, columns)
+            placeholders = ', '.join('?' * len(known))
+            self.connection.executemany(
+                f'INSERT OR REPLACE INTO {_quote(table_name)} ({", ".join(map(_quote, known))}) '
+                f'VALUES ({placeholders})',
+                [[_column_value(row.get(column)) for column in known] for row in rows])
+        self.records_written += len(rows)
+
+    def close(self):
+        self.connection.close()
@@ -1,5 +1,16 @@
+from .async_stitch_api import AsyncStitchApi
+from .batcher import RecordTooLargeError, StitchBatcher
+from .custom_fields import CustomFieldsSchema
+from .dead_letters import DeadLetterFile
+from .records import RecordPage
 from .stitch_api import StitchApi
 
 __all__: [
-    'StitchApi'
+    'AsyncStitchApi',
+    'CustomFieldsSchema',
+    'DeadLetterFile',
+    'RecordPage',
+    'RecordTooLargeError',
+    'StitchApi',
+    'StitchBatcher'
 ]
@@ -0,0 +1,43 @@
+from commons import async_request_with_retry, build_async_session
+
+from .stitch_api import StitchApi
+
+
+class AsyncStitchApi(StitchApi):
+    # asyncio counterpart of StitchApi. Parsing is inherited unchanged, only
+    # the push goes through aiohttp.
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _build_session(self):
+        return None
+
+    def _get_session(self):
+        if self.session is None:
+            self.session = build_async_session(headers=self.headers, pool_size=self.pool_size,
+                                               timeout=self.timeout)
+        return self.session
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def connection_stats(self) -> dict:
+        return {}
+
+    async def push_data_to_stitch(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        body, headers = self._compress(data)
+
+        async def read(response):
+            await response.read()
+            response.raise_for_status()
+
+        await async_request_with_retry(lambda: self._get_session().post(self.push_endpoint, data=body,
+                                                                        headers=headers),
+                                       read, rate_limiter=self.rate_limiter, retry_policy=self.retry_policy)
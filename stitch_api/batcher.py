@@ -0,0 +1,196 @@
+import logging
+import threading
+import time
+
+from commons import add_transfer, get_serializer, thread_retries, thread_throttles, thread_transfer
+
+from .records import RecordPage
+
+logger = logging.getLogger(__name__)
+
+# Limits of the Stitch Import API push endpoint
+MAX_BATCH_BYTES = 4_000_000
+MAX_BATCH_RECORDS = 20_000
+
+
+class RecordTooLargeError(ValueError):
+    pass
+
+
+def push_with_metrics(stitch, data: bytes, metrics=None, entity: str = None, **values):
+    # Pushes data to Stitch; with metrics (a sync_engine.Metrics) as a push
+    # event with the retries, 429s and bytes sent it took, plus `values`
+    if metrics is None:
+        stitch.push_data_to_stitch(data=data)
+        return
+    retries = thread_retries()
+    throttles = thread_throttles()
+    transfer = thread_transfer()
+    with metrics.timer('push', entity, bytes=len(data), **values) as event:
+        stitch.push_data_to_stitch(data=data)
+        event['retries'] = thread_retries() - retries
+        event['throttled'] = thread_throttles() - throttles
+        add_transfer(event, transfer, 'sent')
+
+
+class StitchBatcher:
+    # Accumulates parsed Stitch records, across pages and entities, and pushes
+    # them as one POST when the next record would exceed max_bytes or
+    # max_records, or when the oldest buffered record is older than max_wait.
+    # max_wait is kept by a timer thread, started with each batch, so a
+    # batch is pushed on time even when no further records come (e.g. while
+    # a slow page is fetched); it ends once the batch is pushed. A push the
+    # timer failed is raised by the next add/add_encoded/flush, and the
+    # records stay buffered. close() stops the timer.
+    #
+    # add takes a list of Stitch records or a RecordPage. `on_pushed`
+    # callbacks given to add/add_encoded are called once the push holding the
+    # last of those records succeeded.
+    def __init__(self, stitch, max_bytes: int = MAX_BATCH_BYTES, max_records: int = MAX_BATCH_RECORDS,
+                 max_wait: float = 30.0, clock=time.monotonic, metrics=None, serializer=None):
+        self.stitch = stitch
+        self.serializer = serializer or get_serializer()
+        # sync_engine.Metrics, optional so the batcher can be used on its own
+        self.metrics = metrics
+        self.max_bytes = max_bytes
+        self.max_records = max_records
+        self.max_wait = max_wait
+        self.clock = clock
+        self.pushes = 0
+        self.records_pushed = 0
+        self._encoded = []
+        self._size = 2  # the enclosing brackets
+        self._started = None
+        self._tables = set()
+        self._callbacks = []
+        self._lock = threading.Lock()
+        # Notified whenever a batch is pushed, and on close
+        self._batch_done = threading.Condition(self._lock)
+        self._timer = None
+        self._timer_error = None
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        # Don't push a partial batch on top of an error
+        if exc_type is None:
+            self.flush()
+        self.close()
+
+    def add(self, records: list, on_pushed=None):
+        if self.metrics is None:
+            return self._add(records, on_pushed)
+        if isinstance(records, RecordPage):
+            entity = records.table_name
+        else:
+            entity = records[0]['table_name'] if records else None
+        with self.metrics.timer('serialize', entity, rows=len(records)):
+            self._add(records, on_pushed)
+
+    def add_encoded(self, table_name: str, encoded_records: list, on_pushed=None):
+        # Same as add for records already serialized one by one, e.g. by a ParsePool
+        with self._lock:
+            self._raise_timer_error()
+            for encoded in encoded_records:
+                self._append(encoded, table_name, f'{table_name} record')
+            self._add_callback(on_pushed)
+            self._flush_if_expired()
+
+    def _add(self, records: list, on_pushed):
+        if isinstance(records, RecordPage):
+            return self.add_encoded(records.table_name, records.encode(self.serializer), on_pushed=on_pushed)
+        with self._lock:
+            self._raise_timer_error()
+            for record in records:
+                table_name = record.get('table_name')
+                self._append(self.serializer.dumps(record), table_name,
+                             f"{table_name} record {record.get('data', {}).get('id')}")
+            self._add_callback(on_pushed)
+            self._flush_if_expired()
+
+    def _add_callback(self, on_pushed):
+        if on_pushed is None:
+            return
+        if self._encoded:
+            self._callbacks.append(on_pushed)
+        else:
+            on_pushed()
+
+    def _append(self, encoded: bytes, table_name: str, description: str):
+        size = len(encoded) + 1  # plus the separating comma
+        if size + 2 > self.max_bytes:
+            raise RecordTooLargeError(f'{description} is {size} bytes, above the {self.max_bytes} bytes batch limit')
+
+        if self._size + size > self.max_bytes or len(self._encoded) >= self.max_records:
+            self._flush()
+
+        if self._started is None:
+            self._started = self.clock()
+            self._start_timer()
+        self._encoded.append(encoded)
+        self._size += size
+        self._tables.add(table_name)
+
+    def _flush_if_expired(self):
+        if self._started is not None and self.clock() - self._started >= self.max_wait:
+            self._flush()
+
+    def _start_timer(self):
+        if self._timer is None and not self._closed:
+            self._timer = threading.Thread(target=self._expire, name='stitch-batch-timer', daemon=True)
+            self._timer.start()
+
+    def _expire(self):
+        with self._lock:
+            while self._started is not None and not self._closed:
+                remaining = self._started + self.max_wait - self.clock()
+                if remaining > 0:
+                    self._batch_done.wait(remaining)
+                    continue
+                try:
+                    self._flush()
+                except Exception as error:
+                    logger.error(f'pushing a batch past its max_wait failed: {error}')
+                    self._timer_error = error
+                    break
+            self._timer = None
+
+    def _raise_timer_error(self):
+        if self._timer_error is not None:
+            error, self._timer_error = self._timer_error, None
+            raise error
+
+    def flush(self):
+        with self._lock:
+            self._raise_timer_error()
+            self._flush()
+
+    def close(self):
+        # Stops the timer; records still buffered are left unpushed
+        with self._lock:
+            self._closed = True
+            self._batch_done.notify_all()
+        timer = self._timer
+        if timer is not None:
+            timer.join()
+
+    def _flush(self):
+        if not self._encoded:
+            return
+        logger.info(f'pushing batch of {len(self._encoded)} records, {self._size} bytes')
+        data = b'[' + b','.join(self._encoded) + b']'
+        # A batch may hold several entities
+        entity = self._tables.pop() if len(self._tables) == 1 else 'mixed'
+        push_with_metrics(self.stitch, data, metrics=self.metrics, entity=entity, rows=len(self._encoded))
+        self.pushes += 1
+        self.records_pushed += len(self._encoded)
+        self._encoded = []
+        self._size = 2
+        self._started = None
+        self._tables = set()
+        self._batch_done.notify_all()
+        callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
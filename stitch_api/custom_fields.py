@@ -0,0 +1,67 @@
+import logging
+import sys
+
+logger = logging.getLogger(__name__)
+
+PREFIX = 'custom_fields_'
+
+
+class CustomFieldsSchema:
+    # Columns of the free-form customers custom_fields object. Column names
+    # are built and interned once per field for the whole run instead of
+    # being formatted again on every row; unseen fields are discovered when
+    # a row first carries them.
+    #
+    # With stable, every row gets every known column, None where the row has
+    # no value, so the column set doesn't change from row to row. A declared
+    # list of fields implies stable and fixes the columns: fields outside of
+    # it are dropped, with one warning each.
+    def __init__(self, declared: list = None, stable: bool = False):
+        self.declared = tuple(declared) if declared is not None else None
+        self.stable = stable or declared is not None
+        self._columns = {}
+        self._items = ()
+        self._dropped = set()
+        for field in self.declared or ():
+            self._columns[field] = sys.intern(f'{PREFIX}{field}')
+        self._items = tuple(self._columns.items())
+
+    @property
+    def columns(self) -> list:
+        return [column for _, column in self._items]
+
+    def _discover(self, custom_fields: dict):
+        for field in custom_fields:
+            if field in self._columns or field in self._dropped:
+                continue
+            if self.declared is not None:
+                logger.warning(f'custom field {field} is not in the declared schema, dropping it')
+                self._dropped.add(field)
+            else:
+                self._columns[field] = sys.intern(f'{PREFIX}{field}')
+        self._items = tuple(self._columns.items())
+
+    def fill(self, data: dict, custom_fields: dict):
+        columns = self._columns
+        if not self.stable:
+            try:
+                for field, entry in custom_fields.items():
+                    data[columns[field]] = entry['value']
+            except KeyError:
+                self._discover(custom_fields)
+                for field, entry in custom_fields.items():
+                    if field in columns:
+                        data[columns[field]] = entry['value']
+            return
+
+        matched = 0
+        for field, column in self._items:
+            entry = custom_fields.get(field)
+            if entry is None:
+                data[column] = None
+            else:
+                data[column] = entry['value']
+                matched += 1
+        if matched < len(custom_fields) and not custom_fields.keys() <= self._columns.keys() | self._dropped:
+            self._discover(custom_fields)
+            self.fill(data, custom_fields)
@@ -0,0 +1,38 @@
+import json
+import logging
+import threading
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+
+class DeadLetterFile:
+    # Records Stitch rejected, one JSON line each: {"record": {...},
+    # "status": 400, "error": "<Stitch response body>", "rejected_at": "..."}.
+    # Records are written as they were serialized for the push, so the line
+    # holds exactly what Stitch refused.
+    def __init__(self, path: str, max_error_length: int = 2000):
+        self.path = path
+        self.max_error_length = max_error_length
+        self.count = 0
+        self._file = open(path, 'ab')
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, encoded_record: bytes, status: int, error: str):
+        details = json.dumps({'status': status, 'error': error[:self.max_error_length],
+                              'rejected_at': datetime.now(timezone.utc).isoformat()})
+        line = b'{"record":' + encoded_record + b',' + details[1:].encode() + b'\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            self.count += 1
+        logger.warning(f'stitch rejected a record ({status}), written to {self.path}: {error[:200]}')
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,150 @@
+from types import MappingProxyType
+
+_EMPTY = MappingProxyType({})
+
+
+class EntityMapping:
+    # Declarative Sensedata -> Stitch mapping of one entity. `fields` is a
+    # list of (target column, dotted source path) pairs. Nested objects listed
+    # in `nullable` may be missing or null, in which case every column read
+    # through them is None instead of raising.
+    #
+    # The mapping is compiled once into a plain Python function that reads
+    # each nested object a single time and builds the data dict in one
+    # literal, so there is no per-row path walking. extract_values is the
+    # same as a tuple in `columns` order, see RecordPage.
+    def __init__(self, table_name: str, fields: list, nullable: tuple = (), key_names: tuple = ('id',),
+                 custom_fields: bool = False, extras: tuple = ()):
+        self.table_name = table_name
+        self.fields = fields
+        self.nullable = frozenset(nullable)
+        self.key_names = list(key_names)
+        # customers carry a free-form custom_fields object, see StitchApi._parse_custom_fields
+        self.custom_fields = custom_fields
+        # callables (row, data) for anything that isn't a plain path, e.g. lists
+        self.extras = extras
+        self.columns = tuple(target for target, _ in fields)
+        self.extract = self._compile('extract', '{', '}', '{target!r}: {getter}')
+        self.extract_values = self._compile('extract_values', '(', ')', '{getter}')
+
+    def _compile(self, name: str, opening: str, closing: str, item: str):
+        lines = [f'def {name}(row):']
+        objects = {(): ('row', False)}  # path -> (variable, lenient)
+        columns = []
+
+        def variable_for(path: tuple) -> tuple:
+            if path in objects:
+                return objects[path]
+            parent, lenient = variable_for(path[:-1])
+            name = f'_o{len(objects)}'
+            lenient = lenient or '.'.join(path) in self.nullable
+            if lenient:
+                lines.append(f'    {name} = {parent}.get({path[-1]!r}) or _EMPTY')
+            else:
+                lines.append(f'    {name} = {parent}[{path[-1]!r}]')
+            objects[path] = (name, lenient)
+            return objects[path]
+
+        for target, source in self.fields:
+            path = tuple(source.split('.'))
+            parent, lenient = variable_for(path[:-1])
+            getter = f'{parent}.get({path[-1]!r})' if lenient else f'{parent}[{path[-1]!r}]'
+            columns.append(f'        {item.format(target=target, getter=getter)},')
+
+        lines.append(f'    return {opening}')
+        lines.extend(columns)
+        lines.append(f'    {closing}')
+
+        namespace = {'_EMPTY': _EMPTY}
+        exec(compile('\n'.join(lines), f'<mapping {self.table_name}>', 'exec'), namespace)
+        return namespace[name]
+
+
+_USER_FIELDS = ('id', 'name', 'username', 'email', 'profile.name', 'profile.role', 'active', 'registered_on',
+                'created_at', 'updated_at')
+
+
+def _user_fields(source: str, separator: str) -> list:
+    # Sensedata embeds the same user object as cs, csm, owner and created_by
+    return [(f'{source}{separator}{field.replace(".", separator)}', f'{source}.{field}') for field in _USER_FIELDS]
+
+
+def _contact_types(row: dict, data: dict):
+    # Check field types
+    if row['types']:
+        data['types_id'] = row['types'][0]['id']
+        data['types_name'] = row['types'][0]['name']
+
+
+def _plain(*names: str) -> list:
+    return [(name, name) for name in names]
+
+
+CONTACTS = EntityMapping(
+    table_name='contacts',
+    fields=[
+        *_plain('id', 'id_legacy'),
+        ('customer_id', 'customer.id'),
+        ('customer_id_legacy', 'customer.id_legacy'),
+        ('customer_group', 'customer.group'),
+        ('customer_name_contract', 'customer.name_contract'),
+        ('customer_name', 'customer.name'),
+        ('customer_cnpj', 'customer.cnpj'),
+        *_plain('is_main_sponsor', 'is_active', 'name', 'nickname', 'email', 'occupation', 'phone', 'phone2',
+                'address', 'skype', 'email_unsubscribe', 'unsubscribe_reason', 'is_favorite', 'obs_info'),
+    ],
+    extras=(_contact_types,),
+)
+
+CUSTOMERS = EntityMapping(
+    table_name='customers',
+    fields=[
+        *_plain('id', 'id_legacy', 'group', 'name_contract', 'name', 'cnpj', 'state', 'city', 'size', 'stage',
+                'dt_stage', 'dt_register', 'industry', 'salesperson', 'sponsor', 'sponsor_phone', 'sponsor_email',
+                'dt_cancel', 'cancel_tag', 'cancel_description', 'created_at', 'updated_at'),
+        ('status.id', 'status.id'),
+        ('status.description', 'status.description'),
+        ('status.enabled', 'status.enabled'),
+        *_user_fields('cs', '.'),
+        *_user_fields('csm', '.'),
+    ],
+    nullable=('cs', 'csm'),
+    custom_fields=True,
+)
+
+NPS = EntityMapping(
+    table_name='nps',
+    fields=_plain('id', 'id_legacy', 'id_customer', 'ref_date', 'survey_date', 'medium', 'respondent', 'score',
+                  'role', 'stage', 'group', 'category', 'nps_status', 'comments', 'tags', 'created_at',
+                  'updated_at'),
+)
+
+TASKS = EntityMapping(
+    table_name='tasks',
+    fields=[
+        *_plain('id', 'id_legacy', 'id_customer', 'id_parent', 'id_contact', 'group', 'description', 'notes',
+                'start_date', 'due_date', 'end_date'),
+        ('type_id', 'type.id'),
+        ('type_description', 'type.description'),
+        ('type_caption', 'type.caption'),
+        ('type_enabled', 'type.enabled'),
+        ('type_is_default', 'type.is_default'),
+        ('status_id', 'status.id'),
+        ('status_description', 'status.description'),
+        ('priority_id', 'priority.id'),
+        ('priority_description', 'priority.description'),
+        *_user_fields('owner', '_'),
+        *_user_fields('created_by', '_'),
+        *_plain('hours_spent', 'hours_planned', 'progress', 'id_playbook', 'id_rule', 'tags', 'created_at',
+                'system_end_date', 'updated_at', 'custom_value', 'favorite'),
+    ],
+    nullable=('owner', 'created_by'),
+)
+
+# Sensedata entity name -> mapping. Syncing a new entity only needs an entry here.
+MAPPINGS = {
+    'contacts': CONTACTS,
+    'customers': CUSTOMERS,
+    'nps': NPS,
+    'tasks': TASKS,
+}
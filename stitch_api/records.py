@@ -0,0 +1,61 @@
+class RecordPage:
+    # The Stitch records of one page without a dict per record. What every
+    # record repeats (client_id, action, sequence, table_name, key_names) is
+    # kept once, the mapped columns once, and each row is a tuple of values
+    # in `columns` order. Columns a row adds beyond those (mapping extras and
+    # custom fields) go to its entry in `extras`, None when it has none.
+    #
+    # encode() writes each record's Stitch JSON straight from this, building
+    # only a short-lived data dict per row; records() rebuilds the usual
+    # record dicts for code that needs them and iter_data() only their data.
+    __slots__ = ('client_id', 'sequence', 'table_name', 'key_names', 'columns', 'rows', 'extras')
+
+    def __init__(self, client_id: str, sequence: int, table_name: str, key_names: list, columns: tuple,
+                 rows: list, extras: list = None):
+        self.client_id = client_id
+        self.sequence = sequence
+        self.table_name = table_name
+        self.key_names = key_names
+        self.columns = columns
+        self.rows = rows
+        self.extras = extras
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def iter_data(self):
+        # The data dict of each record, built as it is asked for
+        columns = self.columns
+        if self.extras is None:
+            for values in self.rows:
+                yield dict(zip(columns, values))
+            return
+        for values, extra in zip(self.rows, self.extras):
+            data = dict(zip(columns, values))
+            if extra:
+                data.update(extra)
+            yield data
+
+    def records(self) -> list:
+        return [{
+            'client_id': self.client_id,
+            'action': 'upsert',
+            'sequence': self.sequence,
+            'table_name': self.table_name,
+            'data': data,
+            'key_names': self.key_names,
+        } for data in self.iter_data()]
+
+    def encode(self, serializer) -> list:
+        # One serialized record per row, same JSON as serializer.dumps(record)
+        envelope = serializer.dumps({'client_id': self.client_id, 'action': 'upsert', 'sequence': self.sequence,
+                                     'table_name': self.table_name})
+        prefix = envelope[:-1] + b',"data":'
+        suffix = b',"key_names":' + serializer.dumps(self.key_names) + b'}'
+        ends = (prefix, suffix)
+        dumps = serializer.dumps
+        # One copy per record: the JSON of its data joins the two ends
+        return [dumps(data).join(ends) for data in self.iter_data()]
+
+    def dumps(self, serializer) -> bytes:
+        return b'[' + b','.join(self.encode(serializer)) + b']'
@@ -1,248 +1,241 @@
 import abc
-import json
+import logging
 import os
+from collections.abc import Iterator
 from datetime import datetime
 
 import requests
 
+from commons import (GzipCompression, RetryPolicy, TokenBucket, build_session, connection_stats, count_transfer,
+                     get_serializer, iter_array_bytes, iter_counted, request_with_retry)
 
-class StitchApi:
-    def __init__(self):
-        self.base_url = 'https://api.stitchdata.com'
-        self.api_token = os.getenv('STITCH_INTEGRATION_TOKEN')
-        self.client_id = os.getenv('STITCH_CLIENT_ID')
+from .custom_fields import CustomFieldsSchema
+from .dead_letters import DeadLetterFile
+from .mapping import CONTACTS, CUSTOMERS, MAPPINGS, NPS, TASKS, EntityMapping
+from .records import RecordPage
+
+logger = logging.getLogger(__name__)
+
+# Answers about the batch content, as opposed to auth, throttling or server
+# errors, which would fail any batch alike
+REJECTED_STATUSES = frozenset({400, 413, 422})
 
-    def push_data_to_stitch(self, data):
-        headers = {
+
+class StitchApi:
+    # With a compression, push bodies are gzipped (see GzipCompression); the
+    # bytes sent are counted raw and compressed in commons.thread_transfer.
+    #
+    # custom_fields_schema keeps the customers custom field columns for the
+    # lifetime of the client, by default discovering them as they appear.
+    #
+    # With dead_letters, a batch rejected with one of REJECTED_STATUSES is
+    # split in halves that are pushed on their own, recursively, until the
+    # rejected records are isolated and written to the DeadLetterFile; the
+    # rest of the batch still reaches Stitch. One bad record in n costs about
+    # 2 * log2(n) extra requests. Past max_dead_letters rejected records the
+    # batch is taken to be wrong as a whole and the error is raised.
+    def __init__(self, base_url: str = 'https://api.stitchdata.com', api_token: str = None, client_id: str = None,
+                 pool_size: int = 10, timeout: tuple = (10, 120), rate_limiter: TokenBucket = None,
+                 retry_policy: RetryPolicy = None, serializer=None, concurrency_limiter=None,
+                 compression: GzipCompression = None, custom_fields_schema: CustomFieldsSchema = None,
+                 dead_letters: DeadLetterFile = None, max_dead_letters: int = 10):
+        self.base_url = base_url
+        self.api_token = api_token or os.getenv('STITCH_INTEGRATION_TOKEN')
+        self.client_id = client_id or os.getenv('STITCH_CLIENT_ID')
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter or TokenBucket()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.serializer = serializer or get_serializer()
+        # Semaphore shared with other clients of the same API, see TenantScheduler
+        self.concurrency_limiter = concurrency_limiter
+        self.compression = compression
+        self.custom_fields_schema = custom_fields_schema or CustomFieldsSchema()
+        self.dead_letters = dead_letters
+        self.max_dead_letters = max_dead_letters
+        self.headers = {
             'Authorization': f'Bearer {self.api_token}',
             'Content-Type': 'application/json'
         }
-        endpoint = f"{self.base_url}/v2/import/push"
-        response = requests.request("POST", url=endpoint, headers=headers, data=data)
-        print(response.text)
+        self.session = self._build_session()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _build_session(self):
+        return build_session(headers=self.headers, pool_size=self.pool_size)
+
+    def close(self):
+        self.session.close()
+
+    def connection_stats(self) -> dict:
+        return connection_stats(self.session)
+
+    @property
+    def push_endpoint(self) -> str:
+        return f"{self.base_url}/v2/import/push"
+
+    def _compress(self, data: bytes) -> tuple:
+        if self.compression is None:
+            return data, {}
+        return self.compression.compress(data)
+
+    def push_data_to_stitch(self, data) -> int:
+        # Returns how many records went to the dead letters instead
+        if isinstance(data, str):
+            data = data.encode()
+        try:
+            self._post(data)
+            return 0
+        except requests.HTTPError as error:
+            if self.dead_letters is None or error.response.status_code not in REJECTED_STATUSES:
+                raise
+            # Only on this rare path is the batch split back into records
+            return self._dead_letter(self.serializer.loads(data), error)
+
+    def _dead_letter(self, records: list, error: requests.HTTPError) -> int:
+        # Pushes the records Stitch accepts of a batch it rejected with `error`
+        rejected = []
+        self._bisect([self.serializer.dumps(record) for record in records], error, rejected)
+        for encoded_record, status, text in rejected:
+            self.dead_letters.write(encoded_record, status, text)
+        return len(rejected)
+
+    def _bisect(self, encoded_records: list, error: requests.HTTPError, rejected: list):
+        # `encoded_records` were rejected together with `error`
+        if len(encoded_records) == 1:
+            rejected.append((encoded_records[0], error.response.status_code, error.response.text))
+            if len(rejected) > self.max_dead_letters:
+                raise error
+            return
+        middle = len(encoded_records) // 2
+        for half in (encoded_records[:middle], encoded_records[middle:]):
+            try:
+                self._post(b'[' + b','.join(half) + b']')
+            except requests.HTTPError as half_error:
+                if half_error.response.status_code not in REJECTED_STATUSES:
+                    raise
+                self._bisect(half, half_error, rejected)
+
+    def _post(self, data: bytes):
+        body, headers = self._compress(data)
+
+        def send():
+            return self.session.post(url=self.push_endpoint, data=body, headers=headers, timeout=self.timeout)
+
+        response = request_with_retry(send, rate_limiter=self.rate_limiter, retry_policy=self.retry_policy,
+                                      limiter=self.concurrency_limiter)
+        logger.debug(response.text)
         response.raise_for_status()
+        count_transfer('sent', len(body), len(data))
 
-    def paser_entity_data_to_stitch_standard(self, data: list, entity_name: str) -> str:
-        match entity_name:
-            case 'nps':
-                return self._parse_nps_to_stitch_standard(data=data)
-            case 'customers':
-                return self._parse_customer_to_stitch_standard(data=data)
-            case 'contacts':
-                return self._parse_contact_to_stitch_standard(data=data)
-            case 'tasks':
-                return self._parse_tasks_to_stitch_standard(data=data)
-
-    def _parse_contact_to_stitch_standard(self, data: list) -> str:
-        data_list = []
-        for row in data:
-            obj = {
-                'client_id': self.client_id,
-                'action': 'upsert',
-                'sequence': int(round(datetime.now().timestamp())),
-                'table_name': 'contacts',
-                'data': {
-                    'id': row['id'],
-                    'id_legacy': row['id_legacy'],
-                    'customer_id': row['customer']['id'],
-                    'customer_id_legacy': row['customer']['id_legacy'],
-                    'customer_group': row['customer']['group'],
-                    'customer_name_contract': row['customer']['name_contract'],
-                    'customer_name': row['customer']['name'],
-                    'customer_cnpj': row['customer']['cnpj'],
-                    'is_main_sponsor': row['is_main_sponsor'],
-                    'is_active': row['is_active'],
-                    'name': row['name'],
-                    'nickname': row['nickname'],
-                    'email': row['email'],
-                    'occupation': row['occupation'],
-                    'phone': row['phone'],
-                    'phone2': row['phone2'],
-                    'address': row['address'],
-                    'skype': row['skype'],
-                    'email_unsubscribe': row['email_unsubscribe'],
-                    'unsubscribe_reason': row['unsubscribe_reason'],
-                    'is_favorite': row['is_favorite'],
-                    'obs_info': row['obs_info'],
-                },
-                'key_names': [
-                    'id'
-                ]
-            }
+    def push_records_to_stitch(self, records) -> int:
+        # Streams the records as a chunked request body, so the payload is never
+        # held in memory as one string. A one-shot iterator can't be replayed,
+        # so it is sent without retries, nor split up for the dead letters;
+        # a list is, as in push_data_to_stitch.
+        retry_policy = self.retry_policy
+        if isinstance(records, Iterator):
+            retry_policy = RetryPolicy(max_retries=0)
+
+        def send():
+            body = iter_counted(iter_array_bytes(records, self.serializer.dumps), 'sent', wire=False)
+            headers = {}
+            if self.compression is not None:
+                body = self.compression.iter_compress(body)
+                headers = {'Content-Encoding': 'gzip'}
+            body = iter_counted(body, 'sent', raw=False)
+            return self.session.post(url=self.push_endpoint, data=body, headers=headers, timeout=self.timeout)
+
+        response = request_with_retry(send, rate_limiter=self.rate_limiter, retry_policy=retry_policy,
+                                      limiter=self.concurrency_limiter)
+        try:
+            response.raise_for_status()
+            return 0
+        except requests.HTTPError as error:
+            if (self.dead_letters is None or error.response.status_code not in REJECTED_STATUSES
+                    or isinstance(records, Iterator)):
+                raise
+            return self._dead_letter(records, error)
+
+    def serialize_records(self, records: list) -> bytes:
+        return self.serializer.dumps(records)
+
+    def paser_entity_data_to_stitch_standard(self, data: list, entity_name: str) -> bytes:
+        return self.serialize_records(self.parse_entity_data_to_stitch_records(data=data, entity_name=entity_name))
+
+    def parse_entity_data_to_stitch_records(self, data: list, entity_name: str) -> list:
+        if entity_name not in MAPPINGS:
+            raise ValueError(f'no stitch mapping for entity {entity_name}')
+        return self._build_records(mapping=MAPPINGS[entity_name], data=data)
+
+    def parse_entity_data_to_record_page(self, data: list, entity_name: str) -> RecordPage:
+        # Same records as parse_entity_data_to_stitch_records in compact form
+        if entity_name not in MAPPINGS:
+            raise ValueError(f'no stitch mapping for entity {entity_name}')
+        mapping = MAPPINGS[entity_name]
+        extract_values = mapping.extract_values
+        extras = None
+        if mapping.extras or mapping.custom_fields:
+            extras = [self._extra_columns(mapping, row) for row in data]
+        return RecordPage(client_id=self.client_id, sequence=int(round(datetime.now().timestamp())),
+                          table_name=mapping.table_name, key_names=mapping.key_names, columns=mapping.columns,
+                          rows=[extract_values(row) for row in data], extras=extras)
 
-            # Check field types
-            if row['types']:
-                obj['data']['types_id'] = row['types'][0]['id']
-                obj['data']['types_name'] = row['types'][0]['name']
+    def _extra_columns(self, mapping: EntityMapping, row: dict) -> dict:
+        extra = {}
+        for function in mapping.extras:
+            function(row, extra)
+        if mapping.custom_fields:
+            self.custom_fields_schema.fill(extra, row['custom_fields'])
+        return extra or None
 
-            data_list.append(obj)
-        return json.dumps(data_list)
+    def iter_stitch_records(self, rows, entity_name: str):
+        # Generator version of parse_entity_data_to_stitch_records for streamed rows
+        if entity_name not in MAPPINGS:
+            raise ValueError(f'no stitch mapping for entity {entity_name}')
+        return self._iter_records(mapping=MAPPINGS[entity_name], data=rows)
+
+    def _build_records(self, mapping: EntityMapping, data: list) -> list:
+        return list(self._iter_records(mapping=mapping, data=data))
+
+    def _iter_records(self, mapping: EntityMapping, data):
+        extract = mapping.extract
+        client_id = self.client_id
+        table_name = mapping.table_name
+        key_names = mapping.key_names
+        sequence = int(round(datetime.now().timestamp()))
 
-    def _parse_customer_to_stitch_standard(self, data: list) -> str:
-        data_list = []
         for row in data:
             obj = {
-                'client_id': self.client_id,
+                'client_id': client_id,
                 'action': 'upsert',
-                'sequence': int(round(datetime.now().timestamp())),
-                'table_name': 'customers',
-                'data': {
-                    'id': row['id'],
-                    'id_legacy': row['id_legacy'],
-                    'group': row['group'],
-                    'name_contract': row['name_contract'],
-                    'name': row['name'],
-                    'cnpj': row['cnpj'],
-                    'state': row['state'],
-                    'city': row['city'],
-                    'size': row['size'],
-                    'stage': row['stage'],
-                    'dt_stage': row['dt_stage'],
-                    'dt_register': row['dt_register'],
-                    'industry': row['industry'],
-                    'salesperson': row['salesperson'],
-                    'sponsor': row['sponsor'],
-                    'sponsor_phone': row['sponsor_phone'],
-                    'sponsor_email': row['sponsor_email'],
-                    'dt_cancel': row['dt_cancel'],
-                    'cancel_tag': row['cancel_tag'],
-                    'cancel_description': row['cancel_description'],
-                    'created_at': row['created_at'],
-                    'updated_at': row['updated_at'],
-                    'status.id': row['status']['id'],
-                    'status.description': row['status']['description'],
-                    'status.enabled': row['status']['enabled'],
-                    'cs.id': row['cs']['id'],
-                    'cs.name': row['cs']['name'],
-                    'cs.username': row['cs']['username'],
-                    'cs.email': row['cs']['email'],
-                    'cs.profile.name': row['cs']['profile']['name'],
-                    'cs.profile.role': row['cs']['profile']['role'],
-                    'cs.active': row['cs']['active'],
-                    'cs.registered_on': row['cs']['registered_on'],
-                    'cs.created_at': row['cs']['created_at'],
-                    'cs.updated_at': row['cs']['updated_at'],
-                    'csm.id': row['csm']['id'],
-                    'csm.name': row['csm']['name'],
-                    'csm.username': row['csm']['username'],
-                    'csm.email': row['csm']['email'],
-                    'csm.profile.name': row['csm']['profile']['name'],
-                    'csm.profile.role': row['csm']['profile']['role'],
-                    'csm.active': row['csm']['active'],
-                    'csm.registered_on': row['csm']['registered_on'],
-                    'csm.created_at': row['csm']['created_at'],
-                    'csm.updated_at': row['csm']['updated_at'],
-                },
-                'key_names': [
-                    'id'
-                ]
+                'sequence': sequence,
+                'table_name': table_name,
+                'data': extract(row),
+                'key_names': key_names,
             }
-            self._parse_custom_fields(obj=obj, row=row)
-            data_list.append(obj)
-        return json.dumps(data_list)
+            for extra in mapping.extras:
+                extra(row, obj['data'])
+            if mapping.custom_fields:
+                self._parse_custom_fields(obj=obj, row=row)
+            yield obj
 
-    def _parse_nps_to_stitch_standard(self, data: list) -> str:
-        data_list = []
-        for row in data:
-            data_list.append({
-                'client_id': self.client_id,
-                'action': 'upsert',
-                'sequence': int(round(datetime.now().timestamp())),
-                'table_name': 'nps',
-                'data': {
-                    'id': row['id'],
-                    'id_legacy': row['id_legacy'],
-                    'id_customer': row['id_customer'],
-                    'ref_date': row['ref_date'],
-                    'survey_date': row['survey_date'],
-                    'medium': row['medium'],
-                    'respondent': row['respondent'],
-                    'score': row['score'],
-                    'role': row['role'],
-                    'stage': row['stage'],
-                    'group': row['group'],
-                    'category': row['category'],
-                    'nps_status': row['nps_status'],
-                    'comments': row['comments'],
-                    'tags': row['tags'],
-                    'created_at': row['created_at'],
-                    'updated_at': row['updated_at'],
-                },
-                'key_names': [
-                    'id'
-                ]
-            })
-        return json.dumps(data_list)
-
-    def _parse_tasks_to_stitch_standard(self, data: list) -> str:
-        data_list = []
-        for row in data:
-            data_list.append({
-                'client_id': self.client_id,
-                'action': 'upsert',
-                'sequence': int(round(datetime.now().timestamp())),
-                'table_name': 'tasks',
-                'data': {
-                    'id': row['id'],
-                    'id_legacy': row['id_legacy'],
-                    'id_customer': row['id_customer'],
-                    'id_parent': row['id_parent'],
-                    'id_contact': row['id_contact'],
-                    'group': row['group'],
-                    'description': row['description'],
-                    'notes': row['notes'],
-                    'start_date': row['start_date'],
-                    'due_date': row['due_date'],
-                    'end_date': row['end_date'],
-                    'type_id': row['type']['id'],
-                    'type_description': row['type']['description'],
-                    'type_caption': row['type']['caption'],
-                    'type_enabled': row['type']['enabled'],
-                    'type_is_default': row['type']['is_default'],
-                    'status_id': row['status']['id'],
-                    'status_description': row['status']['description'],
-                    'priority_id': row['priority']['id'],
-                    'priority_description': row['priority']['description'],
-                    'owner_id': row['owner']['id'],
-                    'owner_name': row['owner']['name'],
-                    'owner_username': row['owner']['username'],
-                    'owner_email': row['owner']['email'],
-                    'owner_profile_name': row['owner']['profile']['name'],
-                    'owner_profile_role': row['owner']['profile']['role'],
-                    'owner_active': row['owner']['active'],
-                    'owner_registered_on': row['owner']['registered_on'],
-                    'owner_created_at': row['owner']['created_at'],
-                    'owner_updated_at': row['owner']['updated_at'],
-                    'created_by_id': row['created_by']['id'],
-                    'created_by_name': row['created_by']['name'],
-                    'created_by_username': row['created_by']['username'],
-                    'created_by_email': row['created_by']['email'],
-                    'created_by_profile_name': row['created_by']['profile']['name'],
-                    'created_by_profile_role': row['created_by']['profile']['role'],
-                    'created_by_active': row['created_by']['active'],
-                    'created_by_registered_on': row['created_by']['registered_on'],
-                    'created_by_created_at': row['created_by']['created_at'],
-                    'created_by_updated_at': row['created_by']['updated_at'],
-                    'hours_spent': row['hours_spent'],
-                    'hours_planned': row['hours_planned'],
-                    'progress': row['progress'],
-                    'id_playbook': row['id_playbook'],
-                    'id_rule': row['id_rule'],
-                    'tags': row['tags'],
-                    'created_at': row['created_at'],
-                    'system_end_date': row['system_end_date'],
-                    'updated_at': row['updated_at'],
-                    'custom_value': row['custom_value'],
-                    'favorite': row['favorite'],
-                },
-                'key_names': [
-                    'id'
-                ]
-            })
-        return json.dumps(data_list)
+    def _parse_contact_to_stitch_standard(self, data: list) -> bytes:
+        return self.serialize_records(self._build_records(mapping=CONTACTS, data=data))
+
+    def _parse_customer_to_stitch_standard(self, data: list) -> bytes:
+        return self.serialize_records(self._build_records(mapping=CUSTOMERS, data=data))
+
+    def _parse_nps_to_stitch_standard(self, data: list) -> bytes:
+        return self.serialize_records(self._build_records(mapping=NPS, data=data))
+
+    def _parse_tasks_to_stitch_standard(self, data: list) -> bytes:
+        return self.serialize_records(self._build_records(mapping=TASKS, data=data))
 
     @abc.abstractmethod
     def _parse_custom_fields(self, obj: dict, row: dict):
-        for field in row['custom_fields']:
-            new_key = f'custom_fields_{field}'
-            obj['data'][new_key] = row['custom_fields'][field]['value']
+        self.custom_fields_schema.fill(obj['data'], row['custom_fields'])
@@ -0,0 +1,32 @@
+from .async_sync import AsyncSyncEngine, run_tenants
+from .autotune import AutoTuner
+from .checkpoint import PageCheckpoint
+from .dedup import DedupCache
+from .metrics import JsonLinesExporter, Metrics, MetricsHook, PrometheusTextExporter
+from .parse_pool import ParsePool
+from .pipeline import PagePipeline, SyncEngine
+from .scheduler import TenantScheduler, load_tenants
+from .spool import Spool, SpoolSyncEngine
+from .state import SyncState
+from .streaming import StreamingSyncEngine
+
+__all__: [
+    'AsyncSyncEngine',
+    'AutoTuner',
+    'DedupCache',
+    'JsonLinesExporter',
+    'Metrics',
+    'MetricsHook',
+    'PageCheckpoint',
+    'PagePipeline',
+    'ParsePool',
+    'PrometheusTextExporter',
+    'Spool',
+    'SpoolSyncEngine',
+    'StreamingSyncEngine',
+    'SyncEngine',
+    'SyncState',
+    'TenantScheduler',
+    'load_tenants',
+    'run_tenants',
+]
@@ -0,0 +1,92 @@
+import asyncio
+import logging
+from collections import deque
+
+from sensedata_api import AsyncSensedataAPI
+from stitch_api import AsyncStitchApi
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncSyncEngine:
+    # asyncio version of SyncEngine. Every fetch and push holds the shared
+    # `limiter` semaphore, so many engines (entities and tenants) can run in
+    # one loop under a single global concurrency limit.
+    def __init__(self, sense_data_api, stitch, limiter: asyncio.Semaphore, prefetch: int = 8):
+        self.sense_data_api = sense_data_api
+        self.stitch = stitch
+        self.limiter = limiter
+        self.prefetch = prefetch
+
+    async def _fetch(self, entity_name: str, page: int) -> dict:
+        async with self.limiter:
+            return await self.sense_data_api.get_entity_data(entity_name=entity_name, page=page)
+
+    async def _push(self, data: str):
+        async with self.limiter:
+            await self.stitch.push_data_to_stitch(data=data)
+
+    async def iter_pages(self, entity_name: str, first_page: int = 1, last_page: int = None):
+        # Same pagination as PagePipeline.iter_pages
+        pending = deque()
+        next_page = first_page
+        try:
+            while True:
+                while len(pending) < self.prefetch and (last_page is None or next_page <= last_page):
+                    pending.append((next_page, asyncio.ensure_future(self._fetch(entity_name, next_page))))
+                    next_page += 1
+
+                if not pending:
+                    return
+
+                page_number, task = pending.popleft()
+                data = await task
+
+                # Count is 0 when pagination ends
+                if data['count'] == 0:
+                    return
+
+                end = self.sense_data_api.last_page(entity_name, page_number, data)
+                if end is not None and (last_page is None or end < last_page):
+                    last_page = end
+                    while pending and pending[-1][0] > last_page:
+                        pending.pop()[1].cancel()
+
+                yield page_number, data
+        finally:
+            for _, task in pending:
+                task.cancel()
+
+    async def sync_entity(self, entity_name: str) -> int:
+        rows = 0
+        async for page_number, temp_data in self.iter_pages(entity_name=entity_name):
+            logger.info(f'{entity_name} page: {page_number}, rows= {len(temp_data[entity_name])}')
+            object_as_str = self.stitch.paser_entity_data_to_stitch_standard(data=temp_data[entity_name],
+                                                                             entity_name=entity_name)
+            await self._push(data=object_as_str)
+            rows += len(temp_data[entity_name])
+        return rows
+
+    async def run(self, entities: list) -> dict:
+        results = await asyncio.gather(*(self.sync_entity(entity_name=entity) for entity in entities))
+        return dict(zip(entities, results))
+
+
+async def run_tenants(tenants: list, entities: list, max_concurrency: int = 10, prefetch: int = 4,
+                      sensedata_url: str = 'https://api.sensedata.io',
+                      stitch_url: str = 'https://api.stitchdata.com') -> dict:
+    # Syncs every entity of every tenant concurrently. Each tenant is a dict
+    # with name, sensedata_token, stitch_integration_token and stitch_client_id.
+    limiter = asyncio.Semaphore(max_concurrency)
+
+    async def run_tenant(tenant: dict) -> dict:
+        async with AsyncSensedataAPI(base_url=sensedata_url, token=tenant['sensedata_token'],
+                                     pool_size=max_concurrency) as sense_data_api, \
+                AsyncStitchApi(base_url=stitch_url, api_token=tenant['stitch_integration_token'],
+                               client_id=tenant['stitch_client_id'], pool_size=max_concurrency) as stitch:
+            engine = AsyncSyncEngine(sense_data_api=sense_data_api, stitch=stitch,
+                                     limiter=limiter, prefetch=prefetch)
+            return await engine.run(entities=entities)
+
+    results = await asyncio.gather(*(run_tenant(tenant) for tenant in tenants))
+    return {tenant['name']: result for tenant, result in zip(tenants, results)}
@@ -0,0 +1,224 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+
+from commons import write_json_atomic
+from stitch_api.batcher import MAX_BATCH_BYTES
+
+from .metrics import MetricsHook
+
+logger = logging.getLogger(__name__)
+
+
+class AimdSetting:
+    # One tuned value within [minimum, maximum]: it grows by `step` after
+    # `window` good observations in a row (by default as many as the value,
+    # about one round of requests) and is cut by `factor` on congestion.
+    # Congestion seen by a request started before the last cut was caused by
+    # the old value and already acted on, so it doesn't cut again.
+    def __init__(self, name: str, value: int, minimum: int, maximum: int, step: int = 1, factor: float = 0.5,
+                 window: int = None, on_change=None):
+        self.name = name
+        self.minimum = minimum
+        self.maximum = maximum
+        self.step = step
+        self.factor = factor
+        self.window = window
+        self.on_change = on_change
+        self.value = self._clamp(value)
+        self._good = 0
+        self._decreased_at = float('-inf')
+
+    def _clamp(self, value: int) -> int:
+        return max(self.minimum, min(self.maximum, int(value)))
+
+    def good(self):
+        self._good += 1
+        if self._good >= (self.window or self.value):
+            self._good = 0
+            self._set(self.value + self.step, 'increase')
+
+    def congested(self, started: float, now: float):
+        self._good = 0
+        if started < self._decreased_at:
+            return
+        self._decreased_at = now
+        self._set(self.value * self.factor, 'decrease')
+
+    def cap(self, maximum: int, reason: str):
+        # Lowers the maximum, and the value with it
+        self.maximum = max(self.minimum, min(self.maximum, maximum))
+        self._set(self.value, reason)
+
+    def _set(self, value: int, reason: str):
+        value = self._clamp(value)
+        if value == self.value:
+            return
+        logger.info(f'autotune: {self.name} {self.value} -> {value} ({reason})')
+        self.value = value
+        if self.on_change is not None:
+            self.on_change(value)
+
+
+class AutoTuner(MetricsHook):
+    # Tunes a SyncEngine from its own metrics events, AIMD style:
+    #  - Sensedata pages in flight go up by one per round of good fetches and
+    #    are halved on a 429, a retry, a failed fetch or one slower than
+    #    fetch_seconds (applied to the PagePipeline window live).
+    #  - The Stitch batch size goes up by batch_bytes_step per few good
+    #    pushes and is halved on the same signals for pushes (applied to the
+    #    StitchBatcher live).
+    #  - The page size of each entity is settled once its sync is over:
+    #    halved if any of its fetches was congested or above max_page_bytes,
+    #    raised by page_size_step if all full pages were fast. The last short
+    #    page and empty pages past the end say nothing about the size; more
+    #    than one short page means the server caps the page size, and the
+    #    size is capped at the largest page it returned. Pages are addressed
+    #    by number, so a new size only applies from the entity's next sync,
+    #    never halfway through one.
+    #
+    # With a path, the settings are loaded from it as the starting point and
+    # written back by save(), only after a successful run so a resumed run
+    # pages with the same sizes as the one it resumes.
+    def __init__(self, path: str = None, fetch_concurrency: int = 4, max_fetch_concurrency: int = 16,
+                 min_page_size: int = 100, max_page_size: int = 5000, page_size_step: int = 250,
+                 batch_bytes: int = MAX_BATCH_BYTES, min_batch_bytes: int = 250_000,
+                 max_batch_bytes: int = MAX_BATCH_BYTES, batch_bytes_step: int = 250_000,
+                 fetch_seconds: float = 5.0, push_seconds: float = 10.0, max_page_bytes: int = 8_000_000,
+                 clock=time.monotonic):
+        self.path = path
+        self.fetch_seconds = fetch_seconds
+        self.push_seconds = push_seconds
+        self.max_page_bytes = max_page_bytes
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._pipelines = []
+        self._batchers = []
+
+        stored = {}
+        if path and os.path.exists(path):
+            with open(path) as tuning_file:
+                stored = json.load(tuning_file)
+            logger.info(f'autotune: starting from {stored}')
+
+        self.fetch_concurrency = AimdSetting('fetch concurrency', stored.get('fetch_concurrency', fetch_concurrency),
+                                             minimum=1, maximum=max_fetch_concurrency,
+                                             on_change=self._apply_fetch_concurrency)
+        self.batch_bytes = AimdSetting('batch bytes', stored.get('batch_bytes', batch_bytes),
+                                       minimum=min_batch_bytes, maximum=max_batch_bytes, step=batch_bytes_step,
+                                       window=4, on_change=self._apply_batch_bytes)
+        self._page_size_bounds = (min_page_size, max_page_size, page_size_step)
+        self.page_sizes = {}
+        for entity_name, page_size in stored.get('page_sizes', {}).items():
+            self._page_size(entity_name, page_size)
+        # Per entity: [full pages, short pages, congested, largest page rows]
+        self._page_stats = defaultdict(lambda: [0, 0, False, 0])
+
+    def _page_size(self, entity_name: str, default: int) -> AimdSetting:
+        if entity_name not in self.page_sizes:
+            minimum, maximum, step = self._page_size_bounds
+            self.page_sizes[entity_name] = AimdSetting(f'{entity_name} page size', default, minimum=minimum,
+                                                       maximum=maximum, step=step, window=1)
+        return self.page_sizes[entity_name]
+
+    def attach(self, pipeline=None, batcher=None):
+        # The pipeline needs a worker for every page the window may allow
+        with self._lock:
+            if pipeline is not None:
+                pipeline.workers = max(pipeline.workers, self.fetch_concurrency.maximum)
+                pipeline.prefetch = self.fetch_concurrency.value
+                self._pipelines.append(pipeline)
+            if batcher is not None:
+                batcher.max_bytes = self.batch_bytes.value
+                self._batchers.append(batcher)
+
+    def _apply_fetch_concurrency(self, value: int):
+        for pipeline in self._pipelines:
+            pipeline.prefetch = value
+
+    def _apply_batch_bytes(self, value: int):
+        for batcher in self._batchers:
+            batcher.max_bytes = value
+
+    def page_size(self, entity_name: str, default: int) -> int:
+        # Page size to sync the entity with, `default` when it has no history
+        with self._lock:
+            self._settle_page_size(entity_name)
+            return self._page_size(entity_name, default).value
+
+    def _settle_page_size(self, entity_name: str):
+        if entity_name not in self._page_stats:
+            return
+        full, short, congested, largest = self._page_stats.pop(entity_name)
+        setting = self.page_sizes.get(entity_name)
+        if setting is None:
+            return
+        now = self.clock()
+        if congested:
+            setting.congested(now, now)
+        elif short > 1:
+            setting.cap(largest, 'server page size')
+        elif full:
+            setting.good()
+
+    @staticmethod
+    def _is_congested(event: dict, target_seconds: float) -> bool:
+        if event.get('errors') or event.get('throttled') or event.get('retries'):
+            return True
+        return event['seconds'] > target_seconds
+
+    def on_event(self, event: dict):
+        if event['stage'] not in ('fetch', 'push'):
+            return
+        now = self.clock()
+        started = now - event['seconds']
+        with self._lock:
+            if event['stage'] == 'fetch':
+                self._on_fetch(event, started, now)
+            else:
+                self._on_push(event, started, now)
+
+    def _on_fetch(self, event: dict, started: float, now: float):
+        congested = self._is_congested(event, self.fetch_seconds)
+        if congested:
+            self.fetch_concurrency.congested(started, now)
+        else:
+            self.fetch_concurrency.good()
+
+        stats = self._page_stats[event['entity']]
+        setting = self.page_sizes.get(event['entity'])
+        rows = event.get('rows', 0)
+        stats[3] = max(stats[3], rows)
+        if congested or event.get('bytes', 0) > self.max_page_bytes:
+            stats[2] = True
+        elif setting is not None and rows >= setting.value:
+            stats[0] += 1
+        elif setting is not None and rows:
+            stats[1] += 1
+
+    def _on_push(self, event: dict, started: float, now: float):
+        if self._is_congested(event, self.push_seconds):
+            self.batch_bytes.congested(started, now)
+        elif event.get('bytes', 0) * 2 >= self.batch_bytes.value:
+            # Only batches filled near the limit say anything about it
+            self.batch_bytes.good()
+
+    def settings(self) -> dict:
+        with self._lock:
+            for entity_name in list(self._page_stats):
+                self._settle_page_size(entity_name)
+            return {
+                'fetch_concurrency': self.fetch_concurrency.value,
+                'batch_bytes': self.batch_bytes.value,
+                'page_sizes': {entity_name: setting.value for entity_name, setting in sorted(self.page_sizes.items())},
+            }
+
+    def save(self):
+        settings = self.settings()
+        logger.info(f'autotune: settings for the next run {settings}')
+        if not self.path:
+            return
+        write_json_atomic(self.path, settings, indent=2, sort_keys=True)
@@ -0,0 +1,87 @@
+import json
+import logging
+import os
+import threading
+import uuid
+
+from commons import write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+
+class PageCheckpoint:
+    # Page-level progress of a run: {"run_id": "...", "entities": {"tasks":
+    # {"watermark": 180, "pages": [182, 183], "limit": 500}}}. Pages may be
+    # committed in any order; the watermark is the last page up to which
+    # every page has been pushed and pages above it are kept until the gap
+    # closes. A run resumes each entity at watermark + 1.
+    #
+    # Pages are numbered for the page size ("limit") they were fetched with.
+    # Resumed with another page size, the watermark is converted to the page
+    # holding the first row not yet pushed, so some rows may be pushed again
+    # (they are upserts) but none are skipped; pages above it are dropped.
+    #
+    # Without a run_id the unfinished run found in the file is resumed, or a
+    # new one is started. A different run_id discards the stored progress.
+    def __init__(self, path: str, run_id: str = None):
+        self.path = path
+        self._lock = threading.Lock()
+        stored = {}
+        if os.path.exists(path):
+            with open(path) as checkpoint_file:
+                stored = json.load(checkpoint_file)
+
+        if stored and run_id in (None, stored['run_id']):
+            self.run_id = stored['run_id']
+            logger.info(f'resuming run {self.run_id}')
+            self._entities = {entity_name: {'watermark': progress['watermark'], 'pages': set(progress['pages']),
+                                            'limit': progress.get('limit')}
+                              for entity_name, progress in stored['entities'].items()}
+        else:
+            self.run_id = run_id or uuid.uuid4().hex
+            self._entities = {}
+
+    def resume_page(self, entity_name: str, limit: int = None) -> int:
+        # The page to start entity_name at when fetching pages of `limit` rows
+        with self._lock:
+            progress = self._entities.get(entity_name)
+            if progress is None:
+                if limit is not None:
+                    self._entities[entity_name] = {'watermark': 0, 'pages': set(), 'limit': limit}
+                return 1
+            if limit is not None and progress['limit'] not in (None, limit):
+                watermark = progress['watermark'] * progress['limit'] // limit
+                logger.warning(f"{entity_name} was checkpointed with pages of {progress['limit']} rows, resuming "
+                               f"with {limit}: from row {watermark * limit + 1} "
+                               f"instead of {progress['watermark'] * progress['limit'] + 1}")
+                progress.update(watermark=watermark, pages=set())
+            if limit is not None and progress['limit'] != limit:
+                progress['limit'] = limit
+                self._save()
+            return progress['watermark'] + 1
+
+    def commit(self, entity_name: str, page: int):
+        with self._lock:
+            progress = self._entities.setdefault(entity_name, {'watermark': 0, 'pages': set(), 'limit': None})
+            if page <= progress['watermark']:
+                return
+            progress['pages'].add(page)
+            while progress['watermark'] + 1 in progress['pages']:
+                progress['watermark'] += 1
+                progress['pages'].remove(progress['watermark'])
+            self._save()
+
+    def _save(self):
+        write_json_atomic(self.path, {'run_id': self.run_id,
+                                      'entities': {entity_name: {'watermark': progress['watermark'],
+                                                                 'pages': sorted(progress['pages']),
+                                                                 'limit': progress['limit']}
+                                                   for entity_name, progress in self._entities.items()}},
+                          indent=2, sort_keys=True)
+
+    def finish(self):
+        # A completed run leaves nothing to resume
+        with self._lock:
+            self._entities = {}
+            if os.path.exists(self.path):
+                os.remove(self.path)
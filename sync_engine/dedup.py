@@ -0,0 +1,95 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def record_hash(record: dict) -> str:
+    # Only `data` counts, `sequence` changes on every parse
+    encoded = json.dumps(record['data'], sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha1(encoded.encode()).hexdigest()
+
+
+class DedupCache:
+    # SQLite store of the hash of every record pushed, keyed by
+    # (table_name, id). Records whose hash did not change since they were
+    # last pushed are dropped before they reach Stitch. New hashes are only
+    # written on commit(), once the records are known to be pushed.
+    def __init__(self, path: str, max_age_days: float = 30, clock=time.time):
+        self.max_age = max_age_days * 86400
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._pending = {}
+        self._seen = []
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS record_hashes ('
+            ' table_name TEXT NOT NULL,'
+            ' id TEXT NOT NULL,'
+            ' hash TEXT NOT NULL,'
+            ' last_seen REAL NOT NULL,'
+            ' PRIMARY KEY (table_name, id))'
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def filter_records(self, records: list) -> list:
+        if not records:
+            return records
+        table_name = records[0]['table_name']
+        ids = [str(record['data']['id']) for record in records]
+        known = {}
+        # Stays well below SQLite's bound parameter limit
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            known.update(self.connection.execute(
+                f'SELECT id, hash FROM record_hashes WHERE table_name = ? AND id IN ({placeholders})',
+                [table_name, *chunk]).fetchall())
+
+        changed = []
+        for record_id, record in zip(ids, records):
+            digest = record_hash(record)
+            if known.get(record_id) == digest:
+                self.hits += 1
+                self._seen.append((table_name, record_id))
+            else:
+                self.misses += 1
+                self._pending[(table_name, record_id)] = digest
+                changed.append(record)
+        return changed
+
+    def commit(self):
+        now = self.clock()
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO record_hashes (table_name, id, hash, last_seen) VALUES (?, ?, ?, ?)',
+                [(table_name, record_id, digest, now) for (table_name, record_id), digest in self._pending.items()])
+            self.connection.executemany(
+                'UPDATE record_hashes SET last_seen = ? WHERE table_name = ? AND id = ?',
+                [(now, table_name, record_id) for table_name, record_id in self._seen])
+        self._pending = {}
+        self._seen = []
+
+    def compact(self) -> int:
+        # Forgets records not seen for max_age_days, e.g. deleted upstream
+        with self.connection:
+            evicted = self.connection.execute('DELETE FROM record_hashes WHERE last_seen < ?',
+                                              (self.clock() - self.max_age,)).rowcount
+        self.connection.execute('VACUUM')
+        return evicted
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_ratio': self.hits / total if total else 0.0}
@@ -0,0 +1,152 @@
+import json
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+STAGES = ('fetch', 'parse', 'serialize', 'push')
+
+
+class MetricsHook:
+    # Receives every metrics event, a flat dict with at least stage, entity
+    # and seconds, plus page, rows, bytes... when they apply. `bytes` is the
+    # uncompressed payload size and `wire_bytes` what actually went over the
+    # network, when the client reported it. `throttled` counts the retries
+    # answering a 429 and `errors` is 1 when the step raised.
+    def on_event(self, event: dict):
+        pass
+
+    def close(self):
+        pass
+
+
+class JsonLinesExporter(MetricsHook):
+    def __init__(self, path: str):
+        self._file = open(path, 'a')
+        self._lock = threading.Lock()
+
+    def on_event(self, event: dict):
+        with self._lock:
+            self._file.write(json.dumps(event) + '\n')
+
+    def close(self):
+        self._file.close()
+
+
+class PrometheusTextExporter(MetricsHook):
+    # Aggregates events and writes them in the Prometheus text format on
+    # close, e.g. for the node_exporter textfile collector.
+    def __init__(self, path: str = None, prefix: str = 'sensedata_sync'):
+        self.path = path
+        self.prefix = prefix
+        self._seconds = defaultdict(float)
+        self._counts = defaultdict(int)
+        self._totals = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def on_event(self, event: dict):
+        labels = (event['stage'], event['entity'])
+        with self._lock:
+            self._seconds[labels] += event['seconds']
+            self._counts[labels] += 1
+            for name in ('rows', 'bytes', 'wire_bytes', 'retries'):
+                if event.get(name):
+                    self._totals[(name, *labels)] += event[name]
+
+    def render(self) -> str:
+        lines = [f'# TYPE {self.prefix}_stage_seconds summary']
+        with self._lock:
+            for (stage, entity), seconds in sorted(self._seconds.items()):
+                labels = f'stage="{stage}",entity="{entity}"'
+                lines.append(f'{self.prefix}_stage_seconds_sum{{{labels}}} {seconds:.6f}')
+                lines.append(f'{self.prefix}_stage_seconds_count{{{labels}}} {self._counts[(stage, entity)]}')
+            for name in ('rows', 'bytes', 'wire_bytes', 'retries'):
+                totals = sorted((labels, value) for (total, *labels), value in self._totals.items() if total == name)
+                if totals:
+                    lines.append(f'# TYPE {self.prefix}_{name}_total counter')
+                for (stage, entity), value in totals:
+                    lines.append(f'{self.prefix}_{name}_total{{stage="{stage}",entity="{entity}"}} {value:g}')
+        return '\n'.join(lines) + '\n'
+
+    def close(self):
+        if self.path:
+            with open(self.path, 'w') as metrics_file:
+                metrics_file.write(self.render())
+
+
+class Metrics:
+    # Per-stage timings and sizes of a sync run. Every event goes to the
+    # hooks as it happens and is folded into the end-of-run summary, where an
+    # entity's rows/s is over its active time, from the start of its first
+    # event to the end of its last, so entities synced one after the other
+    # aren't measured against the whole run.
+    def __init__(self, hooks: list = (), clock=time.perf_counter):
+        self.hooks = list(hooks)
+        self.clock = clock
+        self._summary = defaultdict(lambda: defaultdict(float))
+        # entity -> [start of its first event, end of its last]
+        self._spans = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, entity: str, seconds: float, **values):
+        event = {'stage': stage, 'entity': entity, 'seconds': seconds, **values}
+        end = self.clock()
+        with self._lock:
+            span = self._spans.setdefault(entity, [end - seconds, end])
+            span[0] = min(span[0], end - seconds)
+            span[1] = end
+            totals = self._summary[entity]
+            totals[f'{stage}_seconds'] += seconds
+            totals[f'{stage}_count'] += 1
+            for name, value in values.items():
+                if isinstance(value, (int, float)) and name != 'page':
+                    totals[f'{stage}_{name}'] += value
+        for hook in self.hooks:
+            hook.on_event(event)
+
+    @contextmanager
+    def timer(self, stage: str, entity: str, **values):
+        # `values` may be updated inside the block, e.g. with the payload size
+        start = self.clock()
+        try:
+            yield values
+        except Exception:
+            values['errors'] = 1
+            raise
+        finally:
+            self.record(stage, entity, self.clock() - start, **values)
+
+    def summary(self) -> dict:
+        with self._lock:
+            summary = {entity: dict(totals) for entity, totals in self._summary.items()}
+            spans = {entity: span[1] - span[0] for entity, span in self._spans.items()}
+        for entity, totals in summary.items():
+            # Streaming runs have no separate parse stage
+            rows = totals.get('parse_rows') or totals.get('push_rows', 0)
+            totals['rows'] = rows
+            totals['active_seconds'] = spans[entity]
+            totals['rows_per_second'] = rows / spans[entity] if spans[entity] else 0.0
+        return summary
+
+    def summary_table(self) -> str:
+        columns = ('pages', 'rows', 'fetch s', 'parse s', 'serialize s', 'push s', 'pushes', 'bytes', 'wire bytes',
+                   'retries', 'rows/s')
+        rows = [('entity', *columns)]
+        for entity, totals in sorted(self.summary().items()):
+            rows.append((
+                entity,
+                f"{totals.get('fetch_count', 0):.0f}",
+                f"{totals['rows']:.0f}",
+                *(f"{totals.get(f'{stage}_seconds', 0):.2f}" for stage in STAGES),
+                f"{totals.get('push_count', 0):.0f}",
+                f"{totals.get('push_bytes', 0):.0f}",
+                f"{totals.get('push_wire_bytes', totals.get('push_bytes', 0)):.0f}",
+                f"{totals.get('fetch_retries', 0) + totals.get('push_retries', 0):.0f}",
+                f"{totals['rows_per_second']:.1f}",
+            ))
+        widths = [max(len(row[index]) for row in rows) for index in range(len(rows[0]))]
+        return '\n'.join('  '.join(value.rjust(width) for value, width in zip(row, widths)) for row in rows)
+
+    def close(self):
+        for hook in self.hooks:
+            hook.close()
@@ -0,0 +1,76 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from commons import get_serializer
+from stitch_api import CustomFieldsSchema, StitchApi
+
+from .state import filter_changed_rows, parse_timestamp, row_timestamp
+
+# Per worker process, set up once by _init_worker
+_stitch = None
+
+
+def _build_stitch(client_id: str, serializer_name: str, custom_fields: list, stable_custom_fields: bool):
+    return StitchApi(client_id=client_id, serializer=get_serializer(serializer_name),
+                     custom_fields_schema=CustomFieldsSchema(declared=custom_fields, stable=stable_custom_fields))
+
+
+def _init_worker(*stitch_args):
+    global _stitch
+    _stitch = _build_stitch(*stitch_args)
+
+
+def _parse_page(entity_name: str, body: bytes, since: str, stitch: StitchApi = None) -> dict:
+    # Raw Sensedata page in, one serialized Stitch record per changed row out
+    stitch = stitch or _stitch
+    serializer = stitch.serializer
+    page = serializer.loads(body)
+    rows = page.pop(entity_name)
+    changed = filter_changed_rows(rows, parse_timestamp(since))
+    records = stitch.parse_entity_data_to_record_page(data=changed, entity_name=entity_name)
+    timestamps = [timestamp for timestamp in map(row_timestamp, changed) if timestamp is not None]
+    # The rest of the page, e.g. pagination metadata, is passed along
+    return {
+        **page,
+        'count': len(rows),
+        'encoded': records.encode(serializer),
+        'high_water_mark': max(timestamps).isoformat() if timestamps else None,
+    }
+
+
+class ParsePool:
+    # Turns raw Sensedata page bodies into serialized Stitch records on a pool
+    # of worker processes, so parsing isn't bound by the GIL. Only bytes cross
+    # the process boundary: the response body in and the encoded records out.
+    # With workers <= 1 pages are parsed in the calling process instead.
+    #
+    # custom_fields/stable_custom_fields set up each worker's
+    # CustomFieldsSchema. Workers discover custom fields independently, so a
+    # stable column set across workers needs the declared list.
+    def __init__(self, client_id: str, serializer_name: str, workers: int = 2, custom_fields: list = None,
+                 stable_custom_fields: bool = False):
+        self.workers = workers
+        self._executor = None
+        self._stitch = None
+        stitch_args = (client_id, serializer_name, custom_fields, stable_custom_fields)
+        if workers > 1:
+            self._executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                                 initargs=stitch_args)
+        else:
+            self._stitch = _build_stitch(*stitch_args)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def parse(self, entity_name: str, body: bytes, since: str = None) -> dict:
+        if self._executor is None:
+            return _parse_page(entity_name, body, since, stitch=self._stitch)
+        return self._executor.submit(_parse_page, entity_name, body, since).result()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+        if self._stitch is not None:
+            self._stitch.close()
@@ -0,0 +1,273 @@
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from commons import add_transfer, get_serializer, thread_retries, thread_throttles, thread_transfer
+from sinks import StitchSink
+from stitch_api.batcher import push_with_metrics
+
+from .metrics import Metrics
+from .state import filter_changed_rows, parse_timestamp, row_timestamp
+
+logger = logging.getLogger(__name__)
+
+
+class PagePipeline:
+    # Prefetches Sensedata pages with a bounded pool of workers while the
+    # caller is still busy with earlier pages. Pages are always yielded in
+    # order. Iteration stops at the first page with count == 0 or at the last
+    # page as told by SensedataAPI.last_page; once that is known no page past
+    # it is requested, and pages already in flight beyond it are dropped.
+    #
+    # `fetch(entity_name, page, filters)` replaces the default page fetch; it
+    # runs on the workers and must return a dict with the page row count.
+    def __init__(self, sense_data_api, workers: int = 4, prefetch: int = 8, metrics: Metrics = None, fetch=None):
+        if workers < 1:
+            raise ValueError('workers must be at least 1')
+        self.sense_data_api = sense_data_api
+        self.metrics = metrics or Metrics()
+        self.fetch = fetch or self._fetch
+        self.workers = workers
+        # Never keep fewer pages in flight than there are workers
+        self.prefetch = max(prefetch, workers)
+
+    def iter_pages(self, entity_name: str, first_page: int = 1, last_page: int = None, filters: dict = None):
+        pending = deque()
+        next_page = first_page
+        with ThreadPoolExecutor(max_workers=self.workers,
+                                thread_name_prefix=f'sensedata-{entity_name}') as executor:
+            try:
+                while True:
+                    while len(pending) < self.prefetch and (last_page is None or next_page <= last_page):
+                        future = executor.submit(self.fetch, entity_name, next_page, filters)
+                        pending.append((next_page, future))
+                        next_page += 1
+
+                    if not pending:
+                        return
+
+                    page_number, future = pending.popleft()
+                    data = future.result()
+
+                    # Count is 0 when pagination ends
+                    if data['count'] == 0:
+                        return
+
+                    end = self.sense_data_api.last_page(entity_name, page_number, data)
+                    if end is not None and (last_page is None or end < last_page):
+                        last_page = end
+                        while pending and pending[-1][0] > last_page:
+                            pending.pop()[1].cancel()
+
+                    yield page_number, data
+            finally:
+                # Pages fetched past the end (or after an error) are discarded
+                for _, future in pending:
+                    future.cancel()
+
+    def _fetch(self, entity_name: str, page: int, filters: dict) -> dict:
+        retries = thread_retries()
+        throttles = thread_throttles()
+        transfer = thread_transfer()
+        with self.metrics.timer('fetch', entity_name, page=page) as values:
+            data = self.sense_data_api.get_entity_data(entity_name=entity_name, page=page, filters=filters)
+            values['rows'] = data['count']
+            values['retries'] = thread_retries() - retries
+            values['throttled'] = thread_throttles() - throttles
+            add_transfer(values, transfer, 'received')
+        return data
+
+
+class SyncEngine:
+    # With a batcher, parsed records of every page and entity are handed to
+    # it and pushed in as few POSTs as the Stitch limits allow; without one
+    # each page is pushed on its own.
+    #
+    # With a state, only rows changed since the entity bookmark are pushed.
+    # server_filters maps an entity to the Sensedata query parameter that
+    # filters on updated_at, for entities where the API supports one; other
+    # entities are still fully paged and filtered here.
+    #
+    # Pages are parsed into a RecordPage (see stitch_api.RecordPage). With a
+    # dedup cache they are parsed into a dict per record instead, and records
+    # identical to what was last pushed are dropped after parsing.
+    #
+    # With a parse pool, pages are fetched as raw bytes and parsed and
+    # serialized on worker processes right after the fetch, still in page order.
+    #
+    # With a checkpoint, every page is committed once its records were pushed
+    # (or it had none to push) and an interrupted run resumes each entity
+    # after its last contiguously committed page.
+    #
+    # With a tuner (an AutoTuner, which must also be one of the metrics
+    # hooks), the pages in flight and the batch size follow its settings and
+    # every entity is paged with the page size it picks.
+    #
+    # Records go to a sink (see sinks.Sink), by default a StitchSink pushing
+    # them to Stitch through the batcher, if any; with another sink stitch
+    # is only used to parse them.
+    def __init__(self, sense_data_api, stitch, workers: int = 4, prefetch: int = 8, batcher=None,
+                 state=None, server_filters: dict = None, dedup=None, metrics: Metrics = None, serializer=None,
+                 parse_pool=None, checkpoint=None, tuner=None, sink=None):
+        if parse_pool is not None and dedup is not None:
+            raise ValueError('the dedup cache needs parsed records and cannot be used with a parse pool')
+        self.parse_pool = parse_pool
+        self.metrics = metrics or Metrics()
+        self.serializer = serializer or get_serializer()
+        self.sense_data_api = sense_data_api
+        self.stitch = stitch
+        self.batcher = batcher
+        if sink is None:
+            sink = StitchSink(stitch, batcher=batcher, metrics=self.metrics, serializer=self.serializer)
+        self.sink = sink
+        self.dedup = dedup
+        self.state = state
+        self.checkpoint = checkpoint
+        self.server_filters = server_filters or {}
+        self.pipeline = PagePipeline(sense_data_api=sense_data_api, workers=workers, prefetch=prefetch,
+                                     metrics=self.metrics,
+                                     fetch=self._fetch_and_parse if parse_pool is not None else None)
+        self.tuner = tuner
+        if tuner is not None:
+            tuner.attach(pipeline=self.pipeline, batcher=batcher)
+        self._high_water_marks = {}
+        self._bookmarks = {}
+
+    def _incremental_filters(self, entity_name: str, since) -> dict:
+        if since is None or entity_name not in self.server_filters:
+            return None
+        return {self.server_filters[entity_name]: since.isoformat()}
+
+    def _fetch_and_parse(self, entity_name: str, page: int, filters: dict) -> dict:
+        # The fetch event is recorded once the page is parsed, as it carries
+        # the page's row count (the AutoTuner sizes pages by it)
+        retries = thread_retries()
+        throttles = thread_throttles()
+        transfer = thread_transfer()
+        start = self.metrics.clock()
+        try:
+            body = self.sense_data_api.get_entity_page_bytes(entity_name=entity_name, page=page, filters=filters)
+        except Exception:
+            self.metrics.record('fetch', entity_name, self.metrics.clock() - start, page=page, errors=1)
+            raise
+        fetch = {'page': page, 'bytes': len(body), 'retries': thread_retries() - retries,
+                 'throttled': thread_throttles() - throttles}
+        fetch_seconds = self.metrics.clock() - start
+        add_transfer(fetch, transfer, 'received')
+
+        since = self._bookmarks.get(entity_name)
+        try:
+            with self.metrics.timer('parse', entity_name, page=page) as values:
+                parsed = self.parse_pool.parse(entity_name, body, since.isoformat() if since else None)
+                values['rows'] = len(parsed['encoded'])
+            fetch['rows'] = parsed['count']
+        finally:
+            self.metrics.record('fetch', entity_name, fetch_seconds, **fetch)
+        return parsed
+
+    def _first_page(self, entity_name: str) -> int:
+        if self.checkpoint is None:
+            return 1
+        first_page = self.checkpoint.resume_page(entity_name, limit=self.sense_data_api.page_limit(entity_name))
+        if first_page > 1:
+            logger.info(f'{entity_name} resuming from page {first_page}')
+        return first_page
+
+    def _commit_page(self, entity_name: str, page_number: int):
+        if self.checkpoint is not None:
+            self.checkpoint.commit(entity_name, page_number)
+
+    def _tune_page_size(self, entity_name: str):
+        if self.tuner is not None:
+            self.sense_data_api.limits[entity_name] = self.tuner.page_size(
+                entity_name, default=self.sense_data_api.page_limit(entity_name))
+
+    def sync_entity(self, entity_name: str) -> int:
+        since = self.state.get_bookmark(entity_name) if self.state is not None else None
+        filters = self._incremental_filters(entity_name, since)
+        # Tuned first: the checkpoint converts its pages to the page size used
+        self._tune_page_size(entity_name)
+        first_page = self._first_page(entity_name)
+        if self.parse_pool is not None:
+            self._bookmarks[entity_name] = since
+            return self._sync_parsed_entity(entity_name, filters, first_page)
+
+        rows = 0
+        for page_number, temp_data in self.pipeline.iter_pages(entity_name=entity_name, first_page=first_page,
+                                                               filters=filters):
+            page_rows = filter_changed_rows(temp_data[entity_name], since)
+
+            # logs the page end result len
+            logger.info(f'{entity_name} page: {page_number}, rows= {len(temp_data[entity_name])}, '
+                        f'changed= {len(page_rows)}')
+            if not page_rows:
+                self._commit_page(entity_name, page_number)
+                continue
+
+            self._track_high_water_mark(entity_name, page_rows)
+
+            # makes the rows stitch records
+            with self.metrics.timer('parse', entity_name, page=page_number, rows=len(page_rows)):
+                if self.dedup is not None:
+                    records = self.dedup.filter_records(
+                        self.stitch.parse_entity_data_to_stitch_records(data=page_rows, entity_name=entity_name))
+                else:
+                    records = self.stitch.parse_entity_data_to_record_page(data=page_rows, entity_name=entity_name)
+            if not records:
+                self._commit_page(entity_name, page_number)
+                continue
+
+            table_name = records[0]['table_name'] if self.dedup is not None else records.table_name
+            self.sink.write(table_name, records, on_written=partial(self._commit_page, entity_name, page_number))
+            rows += len(records)
+        return rows
+
+    def _sync_parsed_entity(self, entity_name: str, filters: dict, first_page: int = 1) -> int:
+        rows = 0
+        for page_number, parsed in self.pipeline.iter_pages(entity_name=entity_name, first_page=first_page,
+                                                            filters=filters):
+            encoded = parsed['encoded']
+            logger.info(f'{entity_name} page: {page_number}, rows= {parsed["count"]}, changed= {len(encoded)}')
+            if parsed['high_water_mark']:
+                self._advance_high_water_mark(entity_name, parse_timestamp(parsed['high_water_mark']))
+            if not encoded:
+                self._commit_page(entity_name, page_number)
+                continue
+
+            self.sink.write_encoded(entity_name, encoded,
+                                    on_written=partial(self._commit_page, entity_name, page_number))
+            rows += len(encoded)
+        return rows
+
+    def _push_data(self, entity_name: str, page_number: int, rows: int, data: bytes):
+        # Pushes data to stitch server
+        push_with_metrics(self.stitch, data, metrics=self.metrics, entity=entity_name, page=page_number, rows=rows)
+
+    def _track_high_water_mark(self, entity_name: str, rows: list):
+        timestamps = [timestamp for timestamp in map(row_timestamp, rows) if timestamp is not None]
+        if timestamps:
+            self._advance_high_water_mark(entity_name, max(timestamps))
+
+    def _advance_high_water_mark(self, entity_name: str, timestamp):
+        current = self._high_water_marks.get(entity_name)
+        if current is None or timestamp > current:
+            self._high_water_marks[entity_name] = timestamp
+
+    def run(self, entities: list) -> dict:
+        results = {entity: self.sync_entity(entity_name=entity) for entity in entities}
+        self.sink.flush()
+
+        # Bookmarks only move once everything up to them has been pushed
+        if self.state is not None:
+            for entity_name, updated_at in self._high_water_marks.items():
+                self.state.set_bookmark(entity_name, updated_at)
+            self.state.save()
+
+        if self.dedup is not None:
+            self.dedup.commit()
+            logger.info(f'dedup cache: {self.dedup.stats()}, evicted {self.dedup.compact()} stale records')
+
+        if self.checkpoint is not None:
+            self.checkpoint.finish()
+        return results
@@ -0,0 +1,150 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from sensedata_api import SensedataAPI
+from stitch_api import CustomFieldsSchema, StitchApi, StitchBatcher
+
+from .pipeline import SyncEngine
+from .state import SyncState
+
+logger = logging.getLogger(__name__)
+
+
+def load_tenants(path: str) -> list:
+    # A JSON list of {"name", "sensedata_token", "stitch_integration_token",
+    # "stitch_client_id"} objects, optionally with their own "entities",
+    # "page_limits" ({entity: page size}) and declared "custom_fields"
+    with open(path) as tenants_file:
+        tenants = json.load(tenants_file)
+    for tenant in tenants:
+        missing = {'name', 'sensedata_token', 'stitch_integration_token', 'stitch_client_id'} - set(tenant)
+        if missing:
+            raise ValueError(f"tenant {tenant.get('name')} is missing {', '.join(sorted(missing))}")
+    return tenants
+
+
+class TenantScheduler:
+    # Runs the (tenant, entity) syncs of many Sensedata accounts in parallel.
+    # At most max_workers syncs run at once and at most max_per_tenant of them
+    # belong to the same tenant; free slots go round-robin to the next tenant
+    # with work left, so a tenant with huge entities can't starve the others.
+    # All clients of an API share a semaphore capping its requests in flight.
+    def __init__(self, tenants: list, entities: list, max_workers: int = 8, max_per_tenant: int = 2,
+                 sensedata_concurrency: int = 8, stitch_concurrency: int = 4, page_workers: int = 2,
+                 prefetch: int = 4, sensedata_url: str = 'https://api.sensedata.io',
+                 stitch_url: str = 'https://api.stitchdata.com', state_dir: str = None):
+        self.tenants = {tenant['name']: tenant for tenant in tenants}
+        self.entities = entities
+        self.max_workers = max_workers
+        self.max_per_tenant = max_per_tenant
+        self.page_workers = page_workers
+        self.prefetch = prefetch
+        self.sensedata_url = sensedata_url
+        self.stitch_url = stitch_url
+        self.state_dir = state_dir
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+        self.sensedata_limiter = threading.BoundedSemaphore(sensedata_concurrency)
+        self.stitch_limiter = threading.BoundedSemaphore(stitch_concurrency)
+        self._clients = {}
+        self._clients_lock = threading.Lock()
+
+    def _tenant_clients(self, tenant: dict) -> tuple:
+        # Built once per tenant and shared by its entity syncs
+        with self._clients_lock:
+            return self._build_tenant_clients(tenant)
+
+    def _build_tenant_clients(self, tenant: dict) -> tuple:
+        if tenant['name'] not in self._clients:
+            sense_data_api = SensedataAPI(base_url=self.sensedata_url, token=tenant['sensedata_token'],
+                                          pool_size=self.max_per_tenant * self.page_workers,
+                                          concurrency_limiter=self.sensedata_limiter,
+                                          limits=tenant.get('page_limits'))
+            stitch = StitchApi(base_url=self.stitch_url, api_token=tenant['stitch_integration_token'],
+                               client_id=tenant['stitch_client_id'], pool_size=self.max_per_tenant,
+                               concurrency_limiter=self.stitch_limiter,
+                               custom_fields_schema=CustomFieldsSchema(declared=tenant.get('custom_fields')))
+            state = None
+            if self.state_dir:
+                state = SyncState(os.path.join(self.state_dir, f"{tenant['name']}.json"))
+            self._clients[tenant['name']] = (sense_data_api, stitch, state)
+        return self._clients[tenant['name']]
+
+    def run_job(self, tenant: dict, entity_name: str) -> int:
+        sense_data_api, stitch, state = self._tenant_clients(tenant)
+        with StitchBatcher(stitch=stitch) as batcher:
+            engine = SyncEngine(sense_data_api=sense_data_api, stitch=stitch, workers=self.page_workers,
+                                prefetch=self.prefetch, batcher=batcher, state=state)
+            return engine.run(entities=[entity_name])[entity_name]
+
+    def _timed_job(self, tenant: dict, entity_name: str) -> dict:
+        start = time.monotonic()
+        result = {'rows': 0, 'error': None}
+        try:
+            result['rows'] = self.run_job(tenant, entity_name)
+        except Exception as error:
+            # One failing sync must not take the other tenants down
+            logger.exception(f"{tenant['name']} {entity_name} sync failed")
+            result['error'] = f'{error.__class__.__name__}: {error}'
+        result['seconds'] = time.monotonic() - start
+        return result
+
+    def run(self) -> dict:
+        pending = {name: deque(tenant.get('entities') or self.entities) for name, tenant in self.tenants.items()}
+        rotation = deque(self.tenants)
+        running = defaultdict(int)
+        report = {name: {'entities': {}, 'started': None, 'finished': None} for name in self.tenants}
+        condition = threading.Condition()
+
+        def next_job():
+            # Round-robin over tenants that have work left and a free slot
+            for _ in range(len(rotation)):
+                name = rotation[0]
+                rotation.rotate(-1)
+                if pending[name] and running[name] < self.max_per_tenant:
+                    return name, pending[name].popleft()
+            return None
+
+        def job_done(name: str, entity_name: str, future):
+            with condition:
+                running[name] -= 1
+                report[name]['entities'][entity_name] = future.result()
+                report[name]['finished'] = time.monotonic()
+                condition.notify_all()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='tenant-sync') as executor:
+            with condition:
+                while any(pending.values()) or any(running.values()):
+                    job = next_job() if sum(running.values()) < self.max_workers else None
+                    if job is None:
+                        condition.wait()
+                        continue
+
+                    name, entity_name = job
+                    running[name] += 1
+                    if report[name]['started'] is None:
+                        report[name]['started'] = time.monotonic()
+                    future = executor.submit(self._timed_job, self.tenants[name], entity_name)
+                    future.add_done_callback(lambda done, name=name, entity_name=entity_name:
+                                             job_done(name, entity_name, done))
+
+        for sense_data_api, stitch, _ in self._clients.values():
+            sense_data_api.close()
+            stitch.close()
+        return {name: self._tenant_report(tenant_report) for name, tenant_report in report.items()}
+
+    @staticmethod
+    def _tenant_report(tenant_report: dict) -> dict:
+        entities = tenant_report['entities']
+        started, finished = tenant_report['started'], tenant_report['finished']
+        return {
+            'status': 'failed' if any(result['error'] for result in entities.values()) else 'ok',
+            'rows': sum(result['rows'] for result in entities.values()),
+            'seconds': finished - started if started is not None and finished is not None else 0.0,
+            'entities': entities,
+        }
@@ -0,0 +1,334 @@
+import json
+import logging
+import os
+import threading
+from collections import namedtuple
+
+from commons import write_json_atomic
+
+from .metrics import Metrics
+from .pipeline import SyncEngine
+from .state import filter_changed_rows
+
+logger = logging.getLogger(__name__)
+
+SpoolEntry = namedtuple('SpoolEntry', ['seq', 'entity', 'page', 'rows', 'segment', 'offset', 'length'])
+
+
+class SpoolAborted(Exception):
+    pass
+
+
+class Spool:
+    # Durable write-ahead queue between fetch and push. Every serialized page
+    # is appended to the current segment file as a JSON header line followed
+    # by the payload, and the sequence number is written to the ack log once
+    # Stitch has accepted it. Segments rotate at segment_bytes and are
+    # deleted once fully acknowledged; appends block while the spool holds
+    # more than max_bytes, which bounds how far fetching may run ahead.
+    # max_bytes has to leave room for more than one segment, and a blocked
+    # append closes the open segment once all of it is acknowledged so its
+    # bytes stop counting.
+    #
+    # progress.json records, per entity, the last page handed to the spool
+    # and whether the entity was fetched to the end, so a restarted run
+    # pushes what is left in the spool and resumes fetching after that page.
+    def __init__(self, directory: str, segment_bytes: int = 64 * 1024 * 1024, max_bytes: int = 1024 * 1024 * 1024,
+                 fsync: bool = True):
+        if max_bytes <= segment_bytes:
+            raise ValueError(f'spool max_bytes ({max_bytes}) must be larger than segment_bytes ({segment_bytes})')
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+
+        self._condition = threading.Condition()
+        self._entries = {}
+        self._unacked = {}  # segment -> unacknowledged entries
+        self._segment_sizes = {}
+        self._input_closed = False
+        self._aborted = False
+        self._progress = self._load_progress()
+        self._acked = self._load_acks()
+        # Acknowledged segments are deleted, but their sequence numbers stay
+        # in the ack log until finish(), so new pages have to come after them
+        self._next_seq = max(self._acked, default=0) + 1
+        self._segment = 0
+        self._writer = None
+        self._load_segments()
+        self._segment = max(self._segment_sizes, default=0)
+        self._acks_file = open(self._path('acks.log'), 'a')
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _segment_path(self, segment: int) -> str:
+        return self._path(f'{segment:06d}.seg')
+
+    def _load_progress(self) -> dict:
+        if not os.path.exists(self._path('progress.json')):
+            return {'fetched': {}, 'complete': []}
+        with open(self._path('progress.json')) as progress_file:
+            return json.load(progress_file)
+
+    def _save_progress(self):
+        write_json_atomic(self._path('progress.json'), self._progress, fsync=self.fsync)
+
+    def _load_acks(self) -> set:
+        if not os.path.exists(self._path('acks.log')):
+            return set()
+        with open(self._path('acks.log')) as acks_file:
+            return {int(line) for line in acks_file if line.strip()}
+
+    def _load_segments(self):
+        segments = sorted(int(name[:-4]) for name in os.listdir(self.directory) if name.endswith('.seg'))
+        for segment in segments:
+            path = self._segment_path(segment)
+            offset = 0
+            with open(path, 'rb') as segment_file:
+                while True:
+                    header = segment_file.readline()
+                    payload = segment_file.readline()
+                    if not payload.endswith(b'\n'):
+                        break
+                    entry = json.loads(header)
+                    self._add_entry(SpoolEntry(entry['seq'], entry['entity'], entry['page'], entry['rows'], segment,
+                                               offset + len(header), len(payload) - 1))
+                    offset += len(header) + len(payload)
+            # Drop a record half written before a crash
+            if os.path.getsize(path) != offset:
+                logger.warning(f'truncating partial spool record at {path}:{offset}')
+                os.truncate(path, offset)
+            self._segment_sizes[segment] = offset
+            self._cleanup(segment)
+
+    def _add_entry(self, entry: SpoolEntry):
+        self._next_seq = max(self._next_seq, entry.seq + 1)
+        if entry.seq in self._acked:
+            self._unacked.setdefault(entry.segment, 0)
+            return
+        self._entries[entry.seq] = entry
+        self._unacked[entry.segment] = self._unacked.get(entry.segment, 0) + 1
+
+    @property
+    def size(self) -> int:
+        return sum(self._segment_sizes.values())
+
+    def last_fetched_page(self, entity_name: str) -> int:
+        with self._condition:
+            return self._progress['fetched'].get(entity_name, 0)
+
+    def is_complete(self, entity_name: str) -> bool:
+        with self._condition:
+            return entity_name in self._progress['complete']
+
+    def mark_complete(self, entity_name: str):
+        with self._condition:
+            self._progress['complete'].append(entity_name)
+            self._save_progress()
+
+    def append(self, entity_name: str, page: int, payload: bytes, rows: int):
+        # Pages without rows only move the fetch progress
+        with self._condition:
+            while self.size >= self.max_bytes and not self._aborted:
+                self._close_acked_segment()
+                if self.size < self.max_bytes:
+                    break
+                self._condition.wait()
+            if self._aborted:
+                raise SpoolAborted()
+
+            if rows:
+                self._write(entity_name, page, payload, rows)
+            self._progress['fetched'][entity_name] = page
+            self._save_progress()
+            self._condition.notify_all()
+
+    def _close_acked_segment(self):
+        # The next write starts a new segment
+        if self._writer is None or self._unacked.get(self._segment):
+            return
+        self._writer.close()
+        self._writer = None
+        self._cleanup(self._segment)
+
+    def _write(self, entity_name: str, page: int, payload: bytes, rows: int):
+        if self._writer is None or self._segment_sizes.get(self._segment, 0) >= self.segment_bytes:
+            if self._writer is not None:
+                self._writer.close()
+                self._cleanup(self._segment)
+            self._segment += 1
+            self._writer = open(self._segment_path(self._segment), 'ab')
+            self._segment_sizes[self._segment] = 0
+            self._unacked[self._segment] = 0
+
+        seq = self._next_seq
+        self._next_seq += 1
+        header = json.dumps({'seq': seq, 'entity': entity_name, 'page': page, 'rows': rows}).encode() + b'\n'
+        self._writer.write(header + payload + b'\n')
+        self._writer.flush()
+        if self.fsync:
+            os.fsync(self._writer.fileno())
+
+        offset = self._segment_sizes[self._segment]
+        self._segment_sizes[self._segment] += len(header) + len(payload) + 1
+        self._entries[seq] = SpoolEntry(seq, entity_name, page, rows, self._segment, offset + len(header),
+                                        len(payload))
+        self._unacked[self._segment] += 1
+
+    def read(self, entry: SpoolEntry) -> bytes:
+        with open(self._segment_path(entry.segment), 'rb') as segment_file:
+            segment_file.seek(entry.offset)
+            return segment_file.read(entry.length)
+
+    def ack(self, entry: SpoolEntry):
+        with self._condition:
+            self._acks_file.write(f'{entry.seq}\n')
+            self._acks_file.flush()
+            if self.fsync:
+                os.fsync(self._acks_file.fileno())
+            self._acked.add(entry.seq)
+            del self._entries[entry.seq]
+            self._unacked[entry.segment] -= 1
+            self._cleanup(entry.segment)
+            self._condition.notify_all()
+
+    def _cleanup(self, segment: int):
+        # The segment being written to is kept until it rotates
+        if self._unacked.get(segment) or (segment == self._segment and self._writer is not None):
+            return
+        os.remove(self._segment_path(segment))
+        self._segment_sizes.pop(segment, None)
+        self._unacked.pop(segment, None)
+
+    def iter_pending(self):
+        # Yields unacknowledged entries in order, waiting for new ones until
+        # close_input() is called and everything was handed out
+        handed_out = set()
+        while True:
+            with self._condition:
+                while True:
+                    if self._aborted:
+                        return
+                    entries = sorted(seq for seq in self._entries if seq not in handed_out)
+                    if entries or self._input_closed:
+                        break
+                    self._condition.wait()
+                if not entries:
+                    return
+                entry = self._entries[entries[0]]
+            handed_out.add(entry.seq)
+            yield entry
+
+    def pending(self) -> list:
+        with self._condition:
+            return [self._entries[seq] for seq in sorted(self._entries)]
+
+    def close_input(self):
+        with self._condition:
+            self._input_closed = True
+            self._condition.notify_all()
+
+    def abort(self):
+        with self._condition:
+            self._aborted = True
+            self._condition.notify_all()
+
+    def close(self):
+        with self._condition:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            self._acks_file.close()
+
+    def finish(self):
+        # Once a run is fully fetched and pushed the spool starts over empty
+        self.close()
+        for name in os.listdir(self.directory):
+            if name.endswith('.seg') or name in ('acks.log', 'progress.json'):
+                os.remove(self._path(name))
+
+
+class SpoolSyncEngine(SyncEngine):
+    # Fetching and pushing are decoupled through a Spool: pages are parsed,
+    # serialized and committed to the spool on the calling thread while a
+    # pusher thread drains it into Stitch and acknowledges every accepted
+    # page. A run interrupted at any point resumes with the pages left in
+    # the spool and continues fetching after the last spooled page.
+    #
+    # Each spooled page becomes one push; batching and dedup don't apply.
+    def __init__(self, sense_data_api, stitch, spool: Spool, workers: int = 4, prefetch: int = 8, state=None,
+                 server_filters: dict = None, metrics: Metrics = None, serializer=None):
+        super().__init__(sense_data_api=sense_data_api, stitch=stitch, workers=workers, prefetch=prefetch,
+                         state=state, server_filters=server_filters, metrics=metrics, serializer=serializer)
+        self.spool = spool
+        self._push_error = None
+
+    def sync_entity(self, entity_name: str) -> int:
+        if self.spool.is_complete(entity_name):
+            logger.info(f'{entity_name} already fetched into the spool')
+            return 0
+
+        since = self.state.get_bookmark(entity_name) if self.state is not None else None
+        filters = self._incremental_filters(entity_name, since)
+        first_page = self.spool.last_fetched_page(entity_name) + 1
+        if first_page > 1:
+            logger.info(f'{entity_name} resuming from page {first_page}')
+
+        rows = 0
+        for page_number, temp_data in self.pipeline.iter_pages(entity_name=entity_name, first_page=first_page,
+                                                               filters=filters):
+            page_rows = filter_changed_rows(temp_data[entity_name], since)
+            logger.info(f'{entity_name} page: {page_number}, rows= {len(temp_data[entity_name])}, '
+                        f'changed= {len(page_rows)}')
+            self._track_high_water_mark(entity_name, page_rows)
+
+            with self.metrics.timer('parse', entity_name, page=page_number, rows=len(page_rows)):
+                records = self.stitch.parse_entity_data_to_record_page(data=page_rows, entity_name=entity_name)
+            with self.metrics.timer('serialize', entity_name, page=page_number, rows=len(records)) as values:
+                data = records.dumps(self.serializer) if records else b''
+                values['bytes'] = len(data)
+            self.spool.append(entity_name, page_number, data, rows=len(records))
+            rows += len(records)
+
+        self.spool.mark_complete(entity_name)
+        return rows
+
+    def _drain_spool(self):
+        try:
+            for entry in self.spool.iter_pending():
+                self._push_data(entry.entity, entry.page, entry.rows, self.spool.read(entry))
+                self.spool.ack(entry)
+        except Exception as error:
+            self._push_error = error
+            # Unblocks a fetch waiting for spool space
+            self.spool.abort()
+
+    def run(self, entities: list) -> dict:
+        pending = len(self.spool.pending())
+        if pending:
+            logger.info(f'{pending} spooled pages left from a previous run')
+
+        self._push_error = None
+        pusher = threading.Thread(target=self._drain_spool, name='spool-pusher', daemon=True)
+        pusher.start()
+        try:
+            results = {entity: self.sync_entity(entity_name=entity) for entity in entities}
+        except SpoolAborted:
+            results = None
+        finally:
+            self.spool.close_input()
+            pusher.join()
+        if self._push_error is not None:
+            raise self._push_error
+
+        # Pages fetched before a restart never reach the high water marks,
+        # so a resumed run may leave a bookmark lower than it could be
+        if self.state is not None:
+            for entity_name, updated_at in self._high_water_marks.items():
+                self.state.set_bookmark(entity_name, updated_at)
+            self.state.save()
+
+        self.spool.finish()
+        return results
@@ -0,0 +1,61 @@
+import json
+import os
+import threading
+from datetime import datetime, timezone
+
+from commons import write_json_atomic
+
+
+def parse_timestamp(value) -> datetime:
+    # Sensedata mixes dates, naive and Z-suffixed datetimes and empty strings
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def row_timestamp(row: dict) -> datetime:
+    return parse_timestamp(row.get('updated_at')) or parse_timestamp(row.get('created_at'))
+
+
+def filter_changed_rows(rows: list, since: datetime) -> list:
+    # Rows without a usable timestamp are kept, we can't tell they are unchanged
+    if since is None:
+        return rows
+    changed = []
+    for row in rows:
+        timestamp = row_timestamp(row)
+        if timestamp is None or timestamp > since:
+            changed.append(row)
+    return changed
+
+
+class SyncState:
+    # Singer-style state file: {"bookmarks": {"tasks": {"updated_at": "..."}}}
+    # holding the highest updated_at pushed per entity.
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.state = {'bookmarks': {}}
+        if os.path.exists(path):
+            with open(path) as state_file:
+                self.state = json.load(state_file)
+            self.state.setdefault('bookmarks', {})
+
+    def get_bookmark(self, entity_name: str) -> datetime:
+        return parse_timestamp(self.state['bookmarks'].get(entity_name, {}).get('updated_at'))
+
+    def set_bookmark(self, entity_name: str, updated_at: datetime):
+        with self._lock:
+            current = self.get_bookmark(entity_name)
+            if current is None or updated_at > current:
+                self.state['bookmarks'][entity_name] = {'updated_at': updated_at.isoformat()}
+
+    def save(self):
+        with self._lock:
+            write_json_atomic(self.path, self.state, indent=2, sort_keys=True)
@@ -0,0 +1,83 @@
+import logging
+from itertools import chain, count
+
+from commons import add_transfer, thread_retries, thread_transfer
+
+from .metrics import Metrics
+from .pipeline import SyncEngine
+from .state import row_timestamp
+
+logger = logging.getLogger(__name__)
+
+
+class StreamingSyncEngine(SyncEngine):
+    # Moves one page at a time with constant memory: rows are decoded from
+    # the Sensedata response as it arrives, parsed one by one and written
+    # into a chunked Stitch request. Pages are not prefetched and batching
+    # and dedup don't apply, since neither can work on a stream.
+    #
+    # Fetch, parse, serialize and push overlap here, so the metrics only have
+    # a fetch event (until the first row) and a push event (the rest) per page.
+    #
+    # Pagination metadata isn't read from a stream, so paging stops at an
+    # empty page, a short page once the limit is known to be honored (see
+    # SensedataAPI.is_last_short_page) or at last_page, if given.
+    def __init__(self, sense_data_api, stitch, state=None, server_filters: dict = None, last_page: int = None,
+                 metrics: Metrics = None):
+        super().__init__(sense_data_api=sense_data_api, stitch=stitch, state=state, server_filters=server_filters,
+                         metrics=metrics)
+        self.last_page = last_page
+
+    def _changed_rows(self, entity_name: str, rows, since, counter: list):
+        high_water_mark = self._high_water_marks.get(entity_name)
+        try:
+            for row in rows:
+                counter[1] += 1
+                timestamp = row_timestamp(row)
+                if since is not None and timestamp is not None and timestamp <= since:
+                    continue
+                if timestamp is not None and (high_water_mark is None or timestamp > high_water_mark):
+                    high_water_mark = timestamp
+                counter[0] += 1
+                yield row
+        finally:
+            if high_water_mark is not None:
+                self._high_water_marks[entity_name] = high_water_mark
+
+    def sync_entity(self, entity_name: str) -> int:
+        since = self.state.get_bookmark(entity_name) if self.state is not None else None
+        filters = self._incremental_filters(entity_name, since)
+
+        rows = 0
+        for page_number in count(1):
+            if self.last_page is not None and page_number > self.last_page:
+                break
+            with self.metrics.timer('fetch', entity_name, page=page_number):
+                page_rows = self.sense_data_api.iter_entity_rows(entity_name=entity_name, page=page_number,
+                                                                 filters=filters)
+                # An empty page ends pagination
+                first = next(page_rows, None)
+            if first is None:
+                break
+
+            counter = [0, 0]  # changed rows, rows
+            changed = self._changed_rows(entity_name, chain([first], page_rows), since, counter)
+            first_changed = next(changed, None)
+            if first_changed is None:
+                if self.sense_data_api.is_last_short_page(entity_name, counter[1]):
+                    break
+                continue
+
+            records = self.stitch.iter_stitch_records(chain([first_changed], changed), entity_name=entity_name)
+            retries = thread_retries()
+            transfer = thread_transfer()
+            with self.metrics.timer('push', entity_name, page=page_number) as values:
+                self.stitch.push_records_to_stitch(records)
+                values['rows'] = counter[0]
+                values['retries'] = thread_retries() - retries
+                add_transfer(values, transfer, 'sent')
+            logger.info(f'{entity_name} page: {page_number}, rows= {counter[0]}')
+            rows += counter[0]
+            if self.sense_data_api.is_last_short_page(entity_name, counter[1]):
+                break
+        return rows
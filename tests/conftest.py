@@ -0,0 +1,98 @@
+import json
+import threading
+import time
+from unittest.mock import Mock
+
+import pytest
+
+from sensedata_api import SensedataAPI
+from stitch_api import StitchApi
+from stitch_api.mapping import MAPPINGS, EntityMapping
+
+
+def pytest_collection_modifyitems(config, items):
+    # Tests timed by pytest-benchmark fail below a wall-clock budget, which
+    # depends on the machine: they only run with --benchmark-only
+    if config.getoption('benchmark_only', default=False):
+        return
+    timed = [item for item in items if 'benchmark' in getattr(item, 'fixturenames', ())]
+    if timed:
+        config.hook.pytest_deselected(items=timed)
+        items[:] = [item for item in items if item not in timed]
+
+
+class FakeSensedataAPI(SensedataAPI):
+    # SensedataAPI serving `rows` rows per entity from memory instead of the
+    # API: a list of rows, or a count of rows built by row_factory(entity_name,
+    # index), by default {'id': index + 1}. Pages hold page_limit rows and
+    # paging ends as it does with the real API (see SensedataAPI.last_page).
+    # Page p answers after delay / p seconds, so later pages come back first.
+    #
+    # requested keeps the (page, limit) of every request and filters their
+    # filters; max_in_flight is the most requests seen at the same time.
+    def __init__(self, rows, limit: int = 500, delay: float = 0.0, row_factory=None):
+        super().__init__(token='token', limit=limit)
+        self.rows = rows
+        self.delay = delay
+        self.row_factory = row_factory or (lambda entity_name, index: {'id': index + 1})
+        self.requested = []
+        self.filters = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def page_rows(self, entity_name: str, page: int) -> list:
+        limit = self.page_limit(entity_name)
+        start = (page - 1) * limit
+        if isinstance(self.rows, list):
+            return self.rows[start:start + limit]
+        return [self.row_factory(entity_name, index) for index in range(start, min(start + limit, self.rows))]
+
+    def get_entity_data(self, entity_name: str, page: int, filters: dict = None) -> dict:
+        with self._lock:
+            self.requested.append((page, self.page_limit(entity_name)))
+            self.filters.append(filters)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay / page)
+        with self._lock:
+            self.in_flight -= 1
+        rows = self.page_rows(entity_name, page)
+        return {'count': len(rows), entity_name: rows}
+
+    def get_entity_page_bytes(self, entity_name: str, page: int, filters: dict = None) -> bytes:
+        return json.dumps(self.get_entity_data(entity_name, page, filters=filters)).encode()
+
+
+class FakeClock:
+    # Stands in for time.monotonic/time.time and time.sleep: time only moves
+    # when a test sets or advances `now`, or something sleeps
+    def __init__(self, now: float = 0.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def fake_sensedata_api():
+    return FakeSensedataAPI
+
+
+@pytest.fixture
+def recording_stitch(monkeypatch):
+    # A StitchApi mapping only the id of customers, nps and tasks, whose
+    # pushes are recorded by a Mock instead of being sent
+    for entity_name in ('customers', 'nps', 'tasks'):
+        monkeypatch.setitem(MAPPINGS, entity_name, EntityMapping(table_name=entity_name, fields=[('id', 'id')]))
+    stitch = StitchApi(client_id='1')
+    stitch.push_data_to_stitch = Mock()
+    return stitch
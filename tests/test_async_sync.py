@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip('aiohttp')
+
+from benchmarks.fake_servers import FakeSensedataServer, FakeStitchServer  # noqa: E402
+from commons import GzipCompression  # noqa: E402
+from sensedata_api import AsyncSensedataAPI  # noqa: E402
+from stitch_api import AsyncStitchApi  # noqa: E402
+from sync_engine import run_tenants  # noqa: E402
+
+
+class TestAsyncClients:
+    def test_get_entity_data(self):
+        async def fetch(base_url):
+            async with AsyncSensedataAPI(base_url=base_url, token='token', limit=10) as api:
+                return await api.get_entity_data(entity_name='nps', page=2)
+
+        with FakeSensedataServer(rows=15, latency=0) as server:
+            data = asyncio.run(fetch(server.base_url))
+        assert data['count'] == 5
+        assert data['nps'][0]['id'] == 10
+
+    def test_push_data_to_stitch(self):
+        async def push(base_url):
+            async with AsyncStitchApi(base_url=base_url, api_token='token', client_id='1') as api:
+                await api.push_data_to_stitch(data='[{"id": 1}]')
+
+        with FakeStitchServer() as server:
+            asyncio.run(push(server.base_url))
+        assert server.batches == [[{'id': 1}]]
+
+    def test_push_gzips_text_data(self):
+        async def push(base_url):
+            async with AsyncStitchApi(base_url=base_url, api_token='token', client_id='1',
+                                      compression=GzipCompression(threshold=0)) as api:
+                await api.push_data_to_stitch(data='[{"id": 1}]')
+
+        with FakeStitchServer() as server:
+            asyncio.run(push(server.base_url))
+        assert server.batches == [[{'id': 1}]]
+
+
+class TestRunTenants:
+    def test_syncs_every_entity_of_every_tenant(self, monkeypatch):
+        # The fake rows only carry an id, so skip the real parsers
+        monkeypatch.setattr(AsyncStitchApi, 'paser_entity_data_to_stitch_standard',
+                            lambda self, data, entity_name: '[' + ','.join('{}' for _ in data) + ']')
+        tenants = [
+            {'name': name, 'sensedata_token': name, 'stitch_integration_token': name, 'stitch_client_id': name}
+            for name in ('first', 'second')
+        ]
+        with FakeSensedataServer(rows=1200, latency=0) as sensedata, FakeStitchServer() as stitch:
+            report = asyncio.run(run_tenants(tenants=tenants, entities=['nps', 'tasks'], max_concurrency=3,
+                                             sensedata_url=sensedata.base_url, stitch_url=stitch.base_url))
+
+        assert report == {'first': {'nps': 1200, 'tasks': 1200}, 'second': {'nps': 1200, 'tasks': 1200}}
+        assert stitch.rows == 4800
@@ -0,0 +1,112 @@
+import json
+from unittest.mock import Mock
+
+from sync_engine import AutoTuner, Metrics, SyncEngine
+from sync_engine.autotune import AimdSetting
+
+
+def fetch(entity: str = 'tasks', seconds: float = 0.1, **values) -> dict:
+    return {'stage': 'fetch', 'entity': entity, 'seconds': seconds, **values}
+
+
+class TestAimdSetting:
+    def test_increases_after_a_window_of_good_observations(self):
+        setting = AimdSetting('workers', 2, minimum=1, maximum=3)
+        setting.good()
+        assert setting.value == 2
+        setting.good()
+        assert setting.value == 3
+        for _ in range(10):
+            setting.good()
+        assert setting.value == 3
+
+    def test_decreases_once_per_round_of_requests(self):
+        setting = AimdSetting('workers', 8, minimum=1, maximum=16)
+        setting.congested(started=9.0, now=10.0)
+        assert setting.value == 4
+        # Started before the cut, so already accounted for
+        setting.congested(started=9.5, now=10.5)
+        assert setting.value == 4
+        setting.congested(started=11.0, now=12.0)
+        assert setting.value == 2
+
+
+class TestAutoTuner:
+    def test_throttled_fetches_halve_the_pages_in_flight(self, clock):
+        tuner = AutoTuner(fetch_concurrency=8, clock=clock)
+        pipeline = Mock(workers=4, prefetch=8)
+        tuner.attach(pipeline=pipeline)
+        assert pipeline.workers == 16 and pipeline.prefetch == 8
+
+        tuner.on_event(fetch(throttled=1, retries=1))
+        assert pipeline.prefetch == 4
+        for _ in range(4):
+            clock.now += 1
+            tuner.on_event(fetch(rows=500))
+        assert pipeline.prefetch == 5
+
+    def test_slow_pushes_shrink_the_batch(self, clock):
+        tuner = AutoTuner(batch_bytes=4_000_000, push_seconds=1.0, clock=clock)
+        batcher = Mock(max_bytes=4_000_000)
+        tuner.attach(batcher=batcher)
+        tuner.on_event({'stage': 'push', 'entity': 'tasks', 'seconds': 3.0, 'bytes': 3_900_000})
+        assert batcher.max_bytes == 2_000_000
+
+    def test_page_size_grows_after_fast_full_pages_and_is_saved(self, clock, tmp_path):
+        path = str(tmp_path / 'tuning.json')
+        tuner = AutoTuner(path, page_size_step=250, clock=clock)
+        assert tuner.page_size('tasks', default=500) == 500
+        tuner.on_event(fetch(rows=500))
+        tuner.on_event(fetch(rows=500))
+        assert tuner.page_size('tasks', default=500) == 750
+        tuner.save()
+
+        with open(path) as tuning_file:
+            assert json.load(tuning_file)['page_sizes'] == {'tasks': 750}
+        assert AutoTuner(path).page_size('tasks', default=500) == 750
+
+    def test_the_last_short_page_and_empty_pages_do_not_stop_growth(self, clock):
+        tuner = AutoTuner(page_size_step=250, clock=clock)
+        tuner.page_size('tasks', default=500)
+        for rows in (500, 500, 120, 0, 0):
+            tuner.on_event(fetch(rows=rows))
+        assert tuner.page_size('tasks', default=500) == 750
+
+    def test_page_size_is_capped_at_what_the_server_returns(self, clock):
+        tuner = AutoTuner(page_size_step=250, clock=clock)
+        tuner.page_size('tasks', default=750)
+        for rows in (500, 500, 500, 0):
+            tuner.on_event(fetch(rows=rows))
+        assert tuner.page_size('tasks', default=750) == 500
+        tuner.on_event(fetch(rows=500))
+        assert tuner.page_size('tasks', default=750) == 500
+
+    def test_failed_or_large_pages_halve_the_page_size(self, clock):
+        tuner = AutoTuner(max_page_bytes=1000, clock=clock)
+        tuner.page_size('tasks', default=1000)
+        tuner.page_size('nps', default=1000)
+        tuner.on_event(fetch('tasks', rows=1000, errors=1))
+        tuner.on_event(fetch('nps', rows=1000, bytes=5000))
+        assert tuner.settings()['page_sizes'] == {'nps': 500, 'tasks': 500}
+
+    def test_sync_engine_pages_with_the_tuned_size(self, tmp_path, fake_sensedata_api, recording_stitch):
+        path = str(tmp_path / 'tuning.json')
+        with open(path, 'w') as tuning_file:
+            json.dump({'page_sizes': {'tasks': 200}}, tuning_file)
+        tuner = AutoTuner(path)
+        api = fake_sensedata_api(rows=450)
+        stitch = recording_stitch
+        engine = SyncEngine(sense_data_api=api, stitch=stitch, workers=1, prefetch=1,
+                            metrics=Metrics(hooks=[tuner]), tuner=tuner)
+        assert engine.run(entities=['tasks']) == {'tasks': 450}
+        assert {limit for _, limit in api.requested} == {200}
+
+    def test_sync_engine_grows_the_page_size_across_runs(self, fake_sensedata_api, recording_stitch):
+        tuner = AutoTuner(page_size_step=250)
+        api = fake_sensedata_api(rows=1200)
+        stitch = recording_stitch
+        engine = SyncEngine(sense_data_api=api, stitch=stitch, workers=2, prefetch=2,
+                            metrics=Metrics(hooks=[tuner]), tuner=tuner)
+        assert engine.run(entities=['tasks']) == {'tasks': 1200}
+        assert engine.run(entities=['tasks']) == {'tasks': 1200}
+        assert tuner.settings()['page_sizes'] == {'tasks': 1000}
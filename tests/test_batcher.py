@@ -0,0 +1,82 @@
+import json
+import threading
+import time
+from unittest.mock import Mock
+
+import pytest
+
+from stitch_api import RecordTooLargeError, StitchBatcher
+
+
+def record(record_id: int, payload: str = '') -> dict:
+    return {'table_name': 'tasks', 'action': 'upsert', 'data': {'id': record_id, 'payload': payload}}
+
+
+def pushed(stitch: Mock) -> list:
+    return [json.loads(call.kwargs['data']) for call in stitch.push_data_to_stitch.call_args_list]
+
+
+class TestStitchBatcher:
+    def test_flushes_on_record_count(self):
+        stitch = Mock()
+        with StitchBatcher(stitch=stitch, max_records=3) as batcher:
+            batcher.add([record(i) for i in range(4)])
+            batcher.add([record(i) for i in range(4, 7)])
+        assert [len(batch) for batch in pushed(stitch)] == [3, 3, 1]
+        assert batcher.records_pushed == 7
+
+    def test_flushes_before_exceeding_bytes(self):
+        stitch = Mock()
+        max_bytes = 300
+        with StitchBatcher(stitch=stitch, max_bytes=max_bytes) as batcher:
+            batcher.add([record(i, 'x' * 50) for i in range(10)])
+        for call in stitch.push_data_to_stitch.call_args_list:
+            assert len(call.kwargs['data']) <= max_bytes
+        assert sum(len(batch) for batch in pushed(stitch)) == 10
+
+    def test_flushes_on_time_limit(self, clock):
+        stitch = Mock()
+        batcher = StitchBatcher(stitch=stitch, max_wait=10, clock=clock)
+        batcher.add([record(1)])
+        stitch.push_data_to_stitch.assert_not_called()
+        clock.now += 11
+        batcher.add([record(2)])
+        batcher.close()
+        # Pushed by the add, or by the timer thread if it saw the clock first
+        assert pushed(stitch) in ([[record(1), record(2)]], [[record(1)]])
+
+    def test_timer_pushes_without_further_records(self):
+        stitch = Mock()
+        pushed_event = threading.Event()
+        with StitchBatcher(stitch=stitch, max_wait=0.05) as batcher:
+            batcher.add([record(1)], on_pushed=pushed_event.set)
+            assert pushed_event.wait(5)
+            assert pushed(stitch) == [[record(1)]]
+        assert batcher.pushes == 1
+
+    def test_raises_timer_push_error_on_next_add(self):
+        stitch = Mock()
+        stitch.push_data_to_stitch.side_effect = [RuntimeError('stitch down'), None]
+        batcher = StitchBatcher(stitch=stitch, max_wait=0.01)
+        batcher.add([record(1)])
+        deadline = time.monotonic() + 5
+        while not stitch.push_data_to_stitch.called and time.monotonic() < deadline:
+            time.sleep(0.01)
+        with pytest.raises(RuntimeError, match='stitch down'):
+            batcher.add([record(2)])
+        batcher.flush()
+        batcher.close()
+        assert pushed(stitch)[-1] == [record(1)]
+
+    def test_rejects_oversized_record(self):
+        batcher = StitchBatcher(stitch=Mock(), max_bytes=100)
+        with pytest.raises(RecordTooLargeError, match='tasks record 1'):
+            batcher.add([record(1, 'x' * 200)])
+
+    def test_does_not_flush_on_error(self):
+        stitch = Mock()
+        with pytest.raises(RuntimeError):
+            with StitchBatcher(stitch=stitch) as batcher:
+                batcher.add([record(1)])
+                raise RuntimeError()
+        stitch.push_data_to_stitch.assert_not_called()
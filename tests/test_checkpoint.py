@@ -0,0 +1,110 @@
+import json
+
+import pytest
+
+from stitch_api import StitchBatcher
+from sync_engine import PageCheckpoint, SyncEngine
+
+
+def fail_push(stitch, fail_on_push: int):
+    pushes = []
+
+    def push_data_to_stitch(data):
+        pushes.append(data)
+        if len(pushes) == fail_on_push:
+            raise RuntimeError('push failed')
+    stitch.push_data_to_stitch.side_effect = push_data_to_stitch
+    return stitch
+
+
+class TestPageCheckpoint:
+    def test_watermark_waits_for_out_of_order_pages(self, tmp_path):
+        checkpoint = PageCheckpoint(str(tmp_path / 'checkpoint.json'))
+        for page in (2, 4, 1):
+            checkpoint.commit('customers', page)
+        assert checkpoint.resume_page('customers') == 3
+        checkpoint.commit('customers', 3)
+        assert checkpoint.resume_page('customers') == 5
+        assert checkpoint.resume_page('tasks') == 1
+
+    def test_resumes_the_stored_run(self, tmp_path):
+        path = str(tmp_path / 'checkpoint.json')
+        checkpoint = PageCheckpoint(path, run_id='first')
+        checkpoint.commit('customers', 1)
+        checkpoint.commit('customers', 3)
+
+        with open(path) as checkpoint_file:
+            assert json.load(checkpoint_file) == {
+                'run_id': 'first', 'entities': {'customers': {'watermark': 1, 'pages': [3], 'limit': None}}}
+        resumed = PageCheckpoint(path)
+        assert resumed.run_id == 'first'
+        resumed.commit('customers', 2)
+        assert resumed.resume_page('customers') == 4
+
+    def test_converts_pages_to_another_page_size(self, tmp_path):
+        path = str(tmp_path / 'checkpoint.json')
+        checkpoint = PageCheckpoint(path)
+        assert checkpoint.resume_page('customers', limit=2) == 1
+        for page in (1, 2, 3, 5):
+            checkpoint.commit('customers', page)
+        # Rows 1-6 were pushed: pages of 4 rows resume at the one holding row 5
+        assert PageCheckpoint(path).resume_page('customers', limit=4) == 2
+        assert PageCheckpoint(path).resume_page('customers', limit=4) == 2
+
+    def test_other_run_id_starts_over(self, tmp_path):
+        path = str(tmp_path / 'checkpoint.json')
+        PageCheckpoint(path, run_id='first').commit('customers', 1)
+        assert PageCheckpoint(path, run_id='second').resume_page('customers') == 1
+
+    def test_finish_removes_the_checkpoint(self, tmp_path):
+        path = tmp_path / 'checkpoint.json'
+        checkpoint = PageCheckpoint(str(path))
+        checkpoint.commit('customers', 1)
+        checkpoint.finish()
+        assert not path.exists()
+
+
+class TestCheckpointedSync:
+    def test_resumes_after_the_last_pushed_page(self, tmp_path, fake_sensedata_api, recording_stitch):
+        path = str(tmp_path / 'checkpoint.json')
+        engine = SyncEngine(sense_data_api=fake_sensedata_api(rows=5, limit=1),
+                            stitch=fail_push(recording_stitch, fail_on_push=3),
+                            workers=1, prefetch=1, checkpoint=PageCheckpoint(path))
+        with pytest.raises(RuntimeError):
+            engine.run(entities=['customers'])
+
+        sense_data_api = fake_sensedata_api(rows=5, limit=1)
+        stitch = fail_push(recording_stitch, fail_on_push=0)
+        engine = SyncEngine(sense_data_api=sense_data_api, stitch=stitch, workers=1, prefetch=1,
+                            checkpoint=PageCheckpoint(path))
+        assert engine.run(entities=['customers']) == {'customers': 3}
+        assert sense_data_api.requested[0] == (3, 1)
+        assert not (tmp_path / 'checkpoint.json').exists()
+
+    def test_batched_pages_are_committed_when_pushed(self, tmp_path, fake_sensedata_api, recording_stitch):
+        checkpoint = PageCheckpoint(str(tmp_path / 'checkpoint.json'))
+        stitch = fail_push(recording_stitch, fail_on_push=2)
+        batcher = StitchBatcher(stitch=stitch, max_records=2)
+        engine = SyncEngine(sense_data_api=fake_sensedata_api(rows=5, limit=1), stitch=stitch, workers=1, prefetch=1,
+                            batcher=batcher, checkpoint=checkpoint)
+        with pytest.raises(RuntimeError):
+            engine.run(entities=['customers'])
+        assert checkpoint.resume_page('customers') == 3
+
+    def test_resumes_with_another_page_size_without_skipping_rows(self, tmp_path, fake_sensedata_api,
+                                                                   recording_stitch):
+        path = str(tmp_path / 'checkpoint.json')
+        engine = SyncEngine(sense_data_api=fake_sensedata_api(rows=10, limit=2),
+                            stitch=fail_push(recording_stitch, fail_on_push=3),
+                            workers=1, prefetch=1, checkpoint=PageCheckpoint(path))
+        with pytest.raises(RuntimeError):
+            engine.run(entities=['customers'])
+
+        stitch = fail_push(recording_stitch, fail_on_push=0)
+        stitch.push_data_to_stitch.reset_mock()
+        engine = SyncEngine(sense_data_api=fake_sensedata_api(rows=10, limit=4), stitch=stitch, workers=1,
+                            prefetch=1, checkpoint=PageCheckpoint(path))
+        engine.run(entities=['customers'])
+        pushed = [record['data']['id'] for call in stitch.push_data_to_stitch.call_args_list
+                  for record in json.loads(call.kwargs['data'])]
+        assert pushed == [5, 6, 7, 8, 9, 10]
@@ -0,0 +1,82 @@
+import gzip
+import zlib
+
+import pytest
+
+from benchmarks.fake_servers import FakeSensedataServer, FakeStitchServer
+from commons import GzipCompression, iter_decompressed, thread_transfer, transfer_since
+from sensedata_api import SensedataAPI
+from stitch_api import StitchApi
+
+BODY = b'[' + b','.join(b'{"id": %d, "custom_fields_plan": "enterprise"}' % i for i in range(500)) + b']'
+
+
+def chunked(data: bytes, size: int = 100) -> list:
+    return [data[index:index + size] for index in range(0, len(data), size)]
+
+
+class TestGzipCompression:
+    def test_compresses_bodies_above_the_threshold(self):
+        body, headers = GzipCompression(level=9, threshold=100).compress(BODY)
+        assert headers == {'Content-Encoding': 'gzip'}
+        assert len(body) < len(BODY) / 5
+        assert gzip.decompress(body) == BODY
+
+    def test_small_bodies_are_sent_as_they_are(self):
+        assert GzipCompression(threshold=100).compress(b'[]') == (b'[]', {})
+
+    def test_iter_compress(self):
+        assert gzip.decompress(b''.join(GzipCompression().iter_compress(chunked(BODY)))) == BODY
+
+    def test_invalid_level(self):
+        with pytest.raises(ValueError):
+            GzipCompression(level=10)
+
+
+class TestIterDecompressed:
+    @pytest.mark.parametrize("encoding, compressed", [
+        ('gzip', gzip.compress(BODY)),
+        ('deflate', zlib.compress(BODY)),
+        ('deflate', zlib.compress(BODY)[2:-4]),  # raw deflate, no zlib header
+        ('identity', BODY),
+        (None, BODY),
+    ])
+    def test_decompresses_chunk_by_chunk(self, encoding, compressed):
+        assert b''.join(iter_decompressed(chunked(compressed), encoding)) == BODY
+
+    def test_unsupported_encoding(self):
+        with pytest.raises(ValueError):
+            list(iter_decompressed([BODY], 'br'))
+
+
+class TestCompressedTransfers:
+    def test_sensedata_pages_are_decompressed_and_counted(self):
+        with FakeSensedataServer(rows=600, latency=0, compress=True) as server:
+            with SensedataAPI(base_url=server.base_url, token='token') as api:
+                before = thread_transfer()
+                assert len(api.get_entity_data('tasks', page=1)['tasks']) == 500
+                assert [row['id'] for row in api.iter_entity_rows('tasks', page=2)] == list(range(500, 600))
+                transfer = transfer_since(before, 'received')
+                assert 0 < transfer['wire_bytes'] < transfer['bytes'] / 5
+                # The connection was reused for the second page
+                assert [stats['connections'] for stats in api.connection_stats().values()] == [1]
+
+    def test_identity_when_compression_is_disabled(self):
+        with FakeSensedataServer(rows=10, latency=0, compress=True) as server:
+            with SensedataAPI(base_url=server.base_url, token='token', compressed_responses=False) as api:
+                before = thread_transfer()
+                api.get_entity_data('tasks', page=1)
+                transfer = transfer_since(before, 'received')
+                assert transfer['wire_bytes'] == transfer['bytes']
+
+    def test_stitch_pushes_are_gzipped(self):
+        with FakeStitchServer() as server:
+            with StitchApi(base_url=server.base_url, api_token='token', client_id='1',
+                           compression=GzipCompression(threshold=100)) as stitch:
+                before = thread_transfer()
+                stitch.push_data_to_stitch(BODY)
+                stitch.push_records_to_stitch(iter([{'id': 1}, {'id': 2}]))
+                transfer = transfer_since(before, 'sent')
+        assert server.batches[0][499] == {'id': 499, 'custom_fields_plan': 'enterprise'}
+        assert server.batches[1] == [{'id': 1}, {'id': 2}]
+        assert transfer['wire_bytes'] < transfer['bytes'] / 4
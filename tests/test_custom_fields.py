@@ -0,0 +1,47 @@
+import logging
+
+from stitch_api import CustomFieldsSchema, StitchApi
+
+
+def custom_fields(**values) -> dict:
+    return {field: {'value': value} for field, value in values.items()}
+
+
+class TestCustomFieldsSchema:
+    def test_discovers_fields_as_they_appear(self):
+        schema = CustomFieldsSchema()
+        first, second = {}, {}
+        schema.fill(first, custom_fields(etapa='Ongoing'))
+        schema.fill(second, custom_fields(etapa='Done', trial='yes'))
+        assert first == {'custom_fields_etapa': 'Ongoing'}
+        assert second == {'custom_fields_etapa': 'Done', 'custom_fields_trial': 'yes'}
+        assert schema.columns == ['custom_fields_etapa', 'custom_fields_trial']
+
+    def test_column_names_are_built_once(self):
+        schema = CustomFieldsSchema()
+        first, second = {}, {}
+        schema.fill(first, custom_fields(etapa='Ongoing'))
+        schema.fill(second, custom_fields(etapa='Done'))
+        assert next(iter(first)) is next(iter(second))
+
+    def test_stable_rows_get_every_known_column(self):
+        schema = CustomFieldsSchema(stable=True)
+        schema.fill({}, custom_fields(etapa='Ongoing', trial='yes'))
+        data = {}
+        schema.fill(data, custom_fields(trial='no'))
+        assert data == {'custom_fields_etapa': None, 'custom_fields_trial': 'no'}
+
+    def test_declared_schema_drops_other_fields(self, caplog):
+        schema = CustomFieldsSchema(declared=['etapa', 'plano'])
+        with caplog.at_level(logging.WARNING):
+            for _ in range(2):
+                data = {}
+                schema.fill(data, custom_fields(etapa='Ongoing', trial='yes'))
+        assert data == {'custom_fields_etapa': 'Ongoing', 'custom_fields_plano': None}
+        assert len([record for record in caplog.records if 'trial' in record.getMessage()]) == 1
+
+    def test_stitch_api_uses_its_schema(self):
+        api = StitchApi(client_id='1', custom_fields_schema=CustomFieldsSchema(declared=['etapa']))
+        obj = {'data': {'id': 1}}
+        api._parse_custom_fields(obj=obj, row={'custom_fields': custom_fields(trial='yes')})
+        assert obj['data'] == {'id': 1, 'custom_fields_etapa': None}
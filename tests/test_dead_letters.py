@@ -0,0 +1,77 @@
+import json
+import math
+
+import pytest
+from requests import HTTPError
+
+from benchmarks.fake_servers import FakeStitchServer
+from stitch_api import DeadLetterFile, StitchApi
+
+
+def bad_value(record: dict):
+    return 'invalid value for column score' if record['data']['score'] < 0 else None
+
+
+def records(count: int, bad: tuple = ()) -> bytes:
+    return json.dumps([{'table_name': 'nps', 'data': {'id': index, 'score': -1 if index in bad else 9}}
+                       for index in range(count)]).encode()
+
+
+def pushed_ids(server: FakeStitchServer) -> list:
+    return sorted(record['data']['id'] for batch in server.batches for record in batch)
+
+
+class TestBisection:
+    def test_isolates_one_bad_record_in_log_requests(self, tmp_path):
+        path = str(tmp_path / 'dead.jsonl')
+        with FakeStitchServer(reject=bad_value) as server, DeadLetterFile(path) as dead_letters:
+            api = StitchApi(base_url=server.base_url, api_token='token', client_id='1', dead_letters=dead_letters)
+            assert api.push_data_to_stitch(data=records(64, bad=(37,))) == 1
+
+        assert pushed_ids(server) == [index for index in range(64) if index != 37]
+        assert server.requests <= 1 + 2 * math.log2(64)
+        with open(path) as dead_letter_file:
+            dead_letter, = [json.loads(line) for line in dead_letter_file]
+        assert dead_letter['record']['data'] == {'id': 37, 'score': -1}
+        assert dead_letter['status'] == 400
+        assert 'invalid value for column score' in dead_letter['error']
+
+    def test_several_bad_records(self, tmp_path):
+        with FakeStitchServer(reject=bad_value) as server, \
+                DeadLetterFile(str(tmp_path / 'dead.jsonl')) as dead_letters:
+            api = StitchApi(base_url=server.base_url, api_token='token', client_id='1', dead_letters=dead_letters)
+            assert api.push_data_to_stitch(data=records(20, bad=(0, 7, 19))) == 3
+        assert pushed_ids(server) == [index for index in range(20) if index not in (0, 7, 19)]
+        assert dead_letters.count == 3
+
+    def test_streamed_record_list_is_bisected(self, tmp_path):
+        with FakeStitchServer(reject=bad_value) as server, \
+                DeadLetterFile(str(tmp_path / 'dead.jsonl')) as dead_letters:
+            api = StitchApi(base_url=server.base_url, api_token='token', client_id='1', dead_letters=dead_letters)
+            assert api.push_records_to_stitch(json.loads(records(16, bad=(5,)))) == 1
+            with pytest.raises(HTTPError):
+                api.push_records_to_stitch(iter(json.loads(records(4, bad=(1,)))))
+        assert pushed_ids(server) == [index for index in range(16) if index != 5]
+
+    def test_gives_up_when_the_whole_batch_is_bad(self, tmp_path):
+        with FakeStitchServer(reject=bad_value) as server, \
+                DeadLetterFile(str(tmp_path / 'dead.jsonl')) as dead_letters:
+            api = StitchApi(base_url=server.base_url, api_token='token', client_id='1', dead_letters=dead_letters,
+                            max_dead_letters=2)
+            with pytest.raises(HTTPError):
+                api.push_data_to_stitch(data=records(8, bad=tuple(range(8))))
+
+    def test_other_errors_are_not_bisected(self, tmp_path):
+        with FakeStitchServer() as server, DeadLetterFile(str(tmp_path / 'dead.jsonl')) as dead_letters:
+            server.inject_errors((401, {}))
+            api = StitchApi(base_url=server.base_url, api_token='token', client_id='1', dead_letters=dead_letters)
+            with pytest.raises(HTTPError):
+                api.push_data_to_stitch(data=records(4))
+        assert server.requests == 1
+
+    def test_rejections_raise_without_dead_letters(self):
+        with FakeStitchServer(reject=bad_value) as server:
+            api = StitchApi(base_url=server.base_url, api_token='token', client_id='1')
+            with pytest.raises(HTTPError):
+                api.push_data_to_stitch(data=records(4, bad=(1,)))
+        assert server.batches == []
@@ -0,0 +1,51 @@
+from unittest.mock import Mock
+
+from sync_engine import DedupCache, SyncEngine
+
+
+def record(record_id: int, name: str, sequence: int = 1) -> dict:
+    return {'table_name': 'customers', 'sequence': sequence, 'data': {'id': record_id, 'name': name}}
+
+
+class TestDedupCache:
+    def test_skips_unchanged_records_after_commit(self, tmp_path):
+        with DedupCache(str(tmp_path / 'dedup.db')) as cache:
+            assert len(cache.filter_records([record(1, 'a'), record(2, 'b')])) == 2
+            cache.commit()
+
+            changed = cache.filter_records([record(1, 'a', sequence=2), record(2, 'c')])
+            assert changed == [record(2, 'c')]
+            assert cache.stats() == {'hits': 1, 'misses': 3, 'hit_ratio': 0.25}
+
+    def test_uncommitted_records_are_pushed_again(self, tmp_path):
+        with DedupCache(str(tmp_path / 'dedup.db')) as cache:
+            cache.filter_records([record(1, 'a')])
+            assert cache.filter_records([record(1, 'a')]) == [record(1, 'a')]
+
+    def test_compact_evicts_stale_records(self, tmp_path):
+        clock = Mock(return_value=0)
+        with DedupCache(str(tmp_path / 'dedup.db'), max_age_days=1, clock=clock) as cache:
+            cache.filter_records([record(1, 'a'), record(2, 'b')])
+            cache.commit()
+
+            clock.return_value = 86400
+            cache.filter_records([record(1, 'a')])
+            cache.commit()
+
+            clock.return_value = 86400 + 3600
+            assert cache.compact() == 1
+            assert cache.filter_records([record(1, 'a'), record(2, 'b')]) == [record(2, 'b')]
+
+    def test_sync_engine_pushes_only_changed_records(self, tmp_path, fake_sensedata_api):
+        path = str(tmp_path / 'dedup.db')
+        stitch = Mock()
+        stitch.parse_entity_data_to_stitch_records.side_effect = \
+            lambda data, entity_name: [record(row['id'], row['name']) for row in data]
+
+        rows = [{'id': 1, 'name': 'a'}, {'id': 2, 'name': 'b'}]
+        with DedupCache(path) as cache:
+            assert SyncEngine(fake_sensedata_api(rows), stitch, dedup=cache).run(['customers']) == {'customers': 2}
+
+        rows[1]['name'] = 'c'
+        with DedupCache(path) as cache:
+            assert SyncEngine(fake_sensedata_api(rows), stitch, dedup=cache).run(['customers']) == {'customers': 1}
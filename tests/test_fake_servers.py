@@ -0,0 +1,21 @@
+import requests
+
+from benchmarks.fake_servers import FakeSensedataServer
+
+
+class TestFakeServers:
+    def test_rate_limit_answers_429_with_retry_after(self):
+        with FakeSensedataServer(rows=10, latency=0, rate_limit=2) as server:
+            with requests.Session() as session:
+                responses = [session.get(f'{server.base_url}/v2/tasks') for _ in range(10)]
+        throttled = [response for response in responses if response.status_code == 429]
+        # Ten quick requests span at most two one second windows
+        assert len(throttled) == server.throttled >= 6
+        assert all(0 <= float(response.headers['Retry-After']) <= 1 for response in throttled)
+
+    def test_error_rate(self):
+        with FakeSensedataServer(rows=10, latency=0, error_rate=0.5, seed=1) as server:
+            with requests.Session() as session:
+                statuses = [session.get(f'{server.base_url}/v2/tasks').status_code for _ in range(40)]
+        assert statuses.count(503) == server.errors
+        assert 5 < server.errors < 35
@@ -0,0 +1,14 @@
+import json
+import os
+
+from commons import write_json_atomic
+
+
+class TestWriteJsonAtomic:
+    def test_replaces_the_file_without_leaving_the_temporary_one(self, tmp_path):
+        path = str(tmp_path / 'state.json')
+        write_json_atomic(path, {'a': 1})
+        write_json_atomic(path, {'b': [2]}, fsync=False, indent=2)
+        with open(path) as json_file:
+            assert json.load(json_file) == {'b': [2]}
+        assert os.listdir(tmp_path) == ['state.json']
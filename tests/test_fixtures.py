@@ -0,0 +1,22 @@
+import pytest
+
+from benchmarks.fixtures import ENTITIES, generate_page, generate_row
+from stitch_api import StitchApi
+
+
+class TestFixtures:
+    @pytest.mark.parametrize("entity_name", ENTITIES)
+    def test_pages_parse_with_the_real_mappings(self, entity_name):
+        page = generate_page(entity_name, rows=50, page=3)
+        assert page['count'] == 50
+        records = StitchApi(client_id='1').parse_entity_data_to_stitch_records(page[entity_name], entity_name)
+        assert [record['data']['id'] for record in records] == list(range(100, 150))
+
+    def test_rows_are_deterministic(self):
+        assert generate_row('tasks', 7, seed=1) == generate_row('tasks', 7, seed=1)
+        assert generate_row('tasks', 7, seed=1) != generate_row('tasks', 7, seed=2)
+
+    def test_custom_fields_count(self):
+        records = StitchApi(client_id='1').parse_entity_data_to_stitch_records(
+            [generate_row('customers', 1, custom_fields=75)], 'customers')
+        assert sum(column.startswith('custom_fields_') for column in records[0]['data']) == 75
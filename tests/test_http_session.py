@@ -0,0 +1,19 @@
+from benchmarks.fake_servers import FakeSensedataServer
+from commons import build_session
+from sensedata_api import SensedataAPI
+
+
+class TestHttpSession:
+    def test_build_session_sets_default_headers(self):
+        session = build_session(headers={'Authorization': 'token'}, pool_size=3)
+        assert session.headers['Authorization'] == 'token'
+        assert session.get_adapter('https://api.sensedata.io')._pool_maxsize == 3
+
+    def test_connections_are_reused(self):
+        with FakeSensedataServer(rows=30, latency=0) as server:
+            with SensedataAPI(base_url=server.base_url, token='token', limit=10) as api:
+                for page in range(1, 5):
+                    api.get_entity_data(entity_name='tasks', page=page)
+                stats = api.connection_stats()
+
+        assert list(stats.values()) == [{'connections': 1, 'requests': 4}]
@@ -0,0 +1,32 @@
+import pytest
+
+from stitch_api.mapping import CUSTOMERS, MAPPINGS, EntityMapping
+
+
+class TestEntityMapping:
+    def test_extract_nested_paths(self):
+        mapping = EntityMapping(table_name='t', fields=[('id', 'id'), ('owner_name', 'owner.name'),
+                                                        ('owner_role', 'owner.profile.role')])
+        row = {'id': 1, 'owner': {'name': 'Ana', 'profile': {'role': 'viewer'}}}
+        assert mapping.extract(row) == {'id': 1, 'owner_name': 'Ana', 'owner_role': 'viewer'}
+
+    def test_nullable_objects_default_to_none(self):
+        mapping = EntityMapping(table_name='t', fields=[('id', 'id'), ('owner_role', 'owner.profile.role')],
+                                nullable=('owner',))
+        assert mapping.extract({'id': 1, 'owner': None}) == {'id': 1, 'owner_role': None}
+        assert mapping.extract({'id': 1}) == {'id': 1, 'owner_role': None}
+
+    def test_required_objects_still_raise(self):
+        mapping = EntityMapping(table_name='t', fields=[('owner_name', 'owner.name')])
+        with pytest.raises(KeyError):
+            mapping.extract({'id': 1})
+
+    def test_customers_without_cs(self):
+        row = {field.split('.')[0]: None for _, field in CUSTOMERS.fields}
+        row['status'] = {'id': 1, 'description': 'ok', 'enabled': True}
+        data = CUSTOMERS.extract(row)
+        assert data['cs.profile.name'] is None
+        assert data['csm.email'] is None
+
+    def test_every_entity_is_mapped(self):
+        assert sorted(MAPPINGS) == ['contacts', 'customers', 'nps', 'tasks']
@@ -0,0 +1,82 @@
+import json
+
+import pytest
+
+from sync_engine import JsonLinesExporter, Metrics, MetricsHook, PrometheusTextExporter, SyncEngine
+
+
+class Collector(MetricsHook):
+    def __init__(self):
+        self.events = []
+
+    def on_event(self, event: dict):
+        self.events.append(event)
+
+
+class TestMetrics:
+    def test_timer_records_values(self):
+        collector = Collector()
+        metrics = Metrics(hooks=[collector])
+        with metrics.timer('push', 'nps', page=1, rows=2) as values:
+            values['bytes'] = 10
+        event, = collector.events
+        assert event['stage'] == 'push' and event['entity'] == 'nps'
+        assert event['rows'] == 2 and event['bytes'] == 10 and event['seconds'] >= 0
+
+    def test_timer_flags_errors(self):
+        collector = Collector()
+        metrics = Metrics(hooks=[collector])
+        with pytest.raises(ValueError):
+            with metrics.timer('fetch', 'nps', page=1):
+                raise ValueError('boom')
+        assert collector.events[0]['errors'] == 1
+
+    def test_sync_engine_reports_every_stage(self, fake_sensedata_api, recording_stitch):
+        collector = Collector()
+        metrics = Metrics(hooks=[collector])
+        engine = SyncEngine(sense_data_api=fake_sensedata_api(rows=2, limit=1), stitch=recording_stitch,
+                            metrics=metrics)
+        engine.run(entities=['nps'])
+
+        stages = [event['stage'] for event in collector.events if event.get('page') == 1]
+        assert sorted(stages) == ['fetch', 'parse']
+        assert sorted(event['stage'] for event in collector.events if 'page' not in event) == [
+            'push', 'push', 'serialize', 'serialize']
+        summary = metrics.summary()['nps']
+        assert summary['rows'] == 2
+        assert summary['push_count'] == 2
+        pushed = [call.kwargs['data'] for call in recording_stitch.push_data_to_stitch.call_args_list]
+        assert summary['push_bytes'] == sum(map(len, pushed))
+        assert 'nps' in metrics.summary_table()
+
+    def test_rows_per_second_over_each_entity_active_time(self, clock):
+        metrics = Metrics(clock=clock)
+        with metrics.timer('parse', 'nps', rows=100):
+            clock.now += 2
+        with metrics.timer('parse', 'tasks', rows=100):
+            clock.now += 8
+        summary = metrics.summary()
+        assert summary['nps']['active_seconds'] == 2 and summary['nps']['rows_per_second'] == 50
+        assert summary['tasks']['active_seconds'] == 8 and summary['tasks']['rows_per_second'] == 12.5
+
+    def test_json_lines_exporter(self, tmp_path):
+        path = str(tmp_path / 'metrics.jsonl')
+        metrics = Metrics(hooks=[JsonLinesExporter(path)])
+        metrics.record('fetch', 'tasks', 0.5, page=3, rows=500)
+        metrics.close()
+        with open(path) as metrics_file:
+            assert json.loads(metrics_file.readline()) == {'stage': 'fetch', 'entity': 'tasks', 'seconds': 0.5,
+                                                           'page': 3, 'rows': 500}
+
+    def test_prometheus_text_exporter(self, tmp_path):
+        path = str(tmp_path / 'metrics.prom')
+        metrics = Metrics(hooks=[PrometheusTextExporter(path)])
+        metrics.record('push', 'tasks', 0.25, rows=500, bytes=1000)
+        metrics.record('push', 'tasks', 0.25, rows=100, bytes=200, retries=1)
+        metrics.close()
+        with open(path) as metrics_file:
+            text = metrics_file.read()
+        assert 'sensedata_sync_stage_seconds_sum{stage="push",entity="tasks"} 0.500000' in text
+        assert 'sensedata_sync_stage_seconds_count{stage="push",entity="tasks"} 2' in text
+        assert 'sensedata_sync_rows_total{stage="push",entity="tasks"} 600' in text
+        assert 'sensedata_sync_retries_total{stage="push",entity="tasks"} 1' in text
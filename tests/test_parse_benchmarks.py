@@ -0,0 +1,100 @@
+# pytest-benchmark micro-benchmarks of the Stitch transformation hot path on
+# synthetic 500-row pages, skipped when the plugin isn't installed and left
+# out of the default run (see conftest.py), run them with:
+#
+#   python -m pytest tests/test_parse_benchmarks.py --benchmark-only
+#
+# Each benchmark also fails when a page goes through slower than its rows/sec
+# budget. The budgets are several times below what a laptop does, so they
+# only catch real regressions of the hot path.
+import json
+
+import pytest
+
+from benchmarks.fixtures import ENTITIES, generate_rows
+from stitch_api import StitchApi
+
+pytest.importorskip('pytest_benchmark')
+
+PAGE_SIZE = 500
+
+PARSERS = {
+    'contacts': '_parse_contact_to_stitch_standard',
+    'customers': '_parse_customer_to_stitch_standard',
+    'nps': '_parse_nps_to_stitch_standard',
+    'tasks': '_parse_tasks_to_stitch_standard',
+}
+
+# Minimum rows/sec of parse + serialize, customers with 20 custom fields
+BUDGETS = {
+    'contacts': 40_000,
+    'customers': 10_000,
+    'nps': 80_000,
+    'tasks': 15_000,
+}
+
+
+@pytest.fixture(scope='module')
+def stitch():
+    return StitchApi(client_id='bench')
+
+
+def assert_budget(benchmark, rows: int, budget: float):
+    # No stats with --benchmark-disable
+    if benchmark.stats is not None:
+        rows_per_second = rows / benchmark.stats.stats.mean
+        assert rows_per_second >= budget, f'{rows_per_second:,.0f} rows/s is below the {budget:,} rows/s budget'
+
+
+@pytest.mark.parametrize("entity_name", ENTITIES)
+def test_benchmarked_paths_agree(stitch, entity_name):
+    # Not timed, so part of the default run: what is benchmarked gives the same records
+    page = generate_rows(entity_name, PAGE_SIZE)
+    records = stitch.parse_entity_data_to_stitch_records(page, entity_name)
+    assert len(records) == PAGE_SIZE
+    assert json.loads(getattr(stitch, PARSERS[entity_name])(data=page)) == json.loads(
+        stitch.serialize_records(records))
+
+
+@pytest.mark.parametrize("entity_name", ENTITIES)
+def test_parse_and_serialize(benchmark, stitch, entity_name):
+    benchmark.group = 'parse + serialize'
+    page = generate_rows(entity_name, PAGE_SIZE)
+    body = benchmark(getattr(stitch, PARSERS[entity_name]), data=page)
+    assert len(json.loads(body)) == PAGE_SIZE
+    assert_budget(benchmark, PAGE_SIZE, BUDGETS[entity_name])
+
+
+@pytest.mark.parametrize("entity_name", ENTITIES)
+def test_parse(benchmark, stitch, entity_name):
+    benchmark.group = 'parse'
+    page = generate_rows(entity_name, PAGE_SIZE)
+    records = benchmark(stitch.parse_entity_data_to_stitch_records, data=page, entity_name=entity_name)
+    assert len(records) == PAGE_SIZE
+    assert_budget(benchmark, PAGE_SIZE, BUDGETS[entity_name])
+
+
+@pytest.mark.parametrize("entity_name", ENTITIES)
+def test_serialize(benchmark, stitch, entity_name):
+    benchmark.group = 'serialize'
+    records = stitch.parse_entity_data_to_stitch_records(generate_rows(entity_name, PAGE_SIZE), entity_name)
+    body = benchmark(stitch.serialize_records, records)
+    assert len(json.loads(body)) == PAGE_SIZE
+    assert_budget(benchmark, PAGE_SIZE, BUDGETS[entity_name])
+
+
+@pytest.mark.parametrize("custom_fields", [0, 20, 100])
+def test_parse_custom_fields(benchmark, stitch, custom_fields):
+    benchmark.group = 'custom fields'
+    page = generate_rows('customers', PAGE_SIZE, custom_fields=custom_fields)
+
+    def parse_page():
+        objects = [{'data': {}} for _ in page]
+        for obj, row in zip(objects, page):
+            stitch._parse_custom_fields(obj=obj, row=row)
+        return objects
+
+    objects = benchmark(parse_page)
+    assert len(objects[0]['data']) == custom_fields
+    # Budgeted per custom field value rather than per row
+    assert_budget(benchmark, PAGE_SIZE * max(custom_fields, 1), 200_000)
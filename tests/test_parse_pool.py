@@ -0,0 +1,58 @@
+import json
+from unittest.mock import Mock
+
+import pytest
+
+from commons import get_serializer
+from sync_engine import DedupCache, Metrics, ParsePool, SyncEngine
+
+
+def nps_row(row_id: int, updated_at: str = '2021-01-01T00:00:00Z') -> dict:
+    return {
+        "id": row_id, "id_legacy": "internal-tes", "id_customer": 277, "ref_date": "2019-10-28T00:00:00",
+        "survey_date": "2019-10-28T00:00:00", "medium": "tes@gmail.com", "respondent": "test", "score": 7,
+        "role": "SUPER_ADMIN", "stage": "", "group": "", "category": "", "nps_status": "neutral", "comments": "",
+        "tags": "", "created_at": "2020-09-26T01:00:02.371497", "updated_at": updated_at,
+    }
+
+
+class TestParsePool:
+    @pytest.mark.parametrize("workers", [1, 2])
+    def test_parse_returns_encoded_records(self, workers):
+        body = json.dumps({'count': 2, 'nps': [nps_row(1, '2020-01-01'), nps_row(2, '2022-01-01')]}).encode()
+        with ParsePool(client_id='42', serializer_name='json', workers=workers) as pool:
+            parsed = pool.parse('nps', body, since='2021-01-01')
+
+        assert parsed['count'] == 2
+        record, = [json.loads(encoded) for encoded in parsed['encoded']]
+        assert record['client_id'] == '42'
+        assert record['data'] == nps_row(2, '2022-01-01')
+        assert parsed['high_water_mark'] == '2022-01-01T00:00:00+00:00'
+
+    def test_sync_engine_pushes_parsed_pages(self, fake_sensedata_api):
+        stitch = Mock()
+        with ParsePool(client_id='42', serializer_name='json', workers=2) as pool:
+            api = fake_sensedata_api(rows=3, limit=1, row_factory=lambda entity_name, index: nps_row(index + 1))
+            engine = SyncEngine(sense_data_api=api, stitch=stitch, parse_pool=pool)
+            assert engine.run(entities=['nps']) == {'nps': 3}
+
+        pushed = [get_serializer('json').loads(call.kwargs['data'])
+                  for call in stitch.push_data_to_stitch.call_args_list]
+        assert [batch[0]['data']['id'] for batch in pushed] == [1, 2, 3]
+
+    def test_fetch_events_carry_the_page_rows(self, fake_sensedata_api):
+        collector = Mock()
+        with ParsePool(client_id='42', serializer_name='json', workers=1) as pool:
+            api = fake_sensedata_api(rows=5, limit=2, row_factory=lambda entity_name, index: nps_row(index + 1))
+            engine = SyncEngine(sense_data_api=api, stitch=Mock(), parse_pool=pool,
+                                metrics=Metrics(hooks=[collector]))
+            engine.run(entities=['nps'])
+
+        fetches = [call.args[0] for call in collector.on_event.call_args_list if call.args[0]['stage'] == 'fetch']
+        # Pages past the end may be fetched ahead too
+        assert sorted((event['page'], event['rows']) for event in fetches if event['page'] <= 3) == [
+            (1, 2), (2, 2), (3, 1)]
+
+    def test_rejects_dedup(self, tmp_path):
+        with DedupCache(str(tmp_path / 'dedup.db')) as dedup, pytest.raises(ValueError):
+            SyncEngine(sense_data_api=Mock(), stitch=Mock(), dedup=dedup, parse_pool=Mock())
@@ -0,0 +1,98 @@
+import json
+from unittest.mock import Mock
+
+import pytest
+
+from benchmarks.fake_servers import FakeSensedataServer, FakeStitchServer
+from sensedata_api import SensedataAPI
+from sinks import Sink
+from stitch_api import RecordPage, StitchApi, StitchBatcher
+from stitch_api.mapping import MAPPINGS, EntityMapping
+from sync_engine import DedupCache, PagePipeline, SyncEngine
+
+
+class TestPagePipeline:
+    def test_iter_pages_keeps_page_order(self, fake_sensedata_api):
+        api = fake_sensedata_api(rows=10, limit=1, delay=0.01)
+        pipeline = PagePipeline(sense_data_api=api, workers=4, prefetch=6)
+        pages = [page for page, _ in pipeline.iter_pages(entity_name='tasks')]
+        assert pages == list(range(1, 11))
+
+    def test_iter_pages_stops_at_empty_page(self, fake_sensedata_api):
+        api = fake_sensedata_api(rows=3, limit=1)
+        pipeline = PagePipeline(sense_data_api=api, workers=2, prefetch=2)
+        data = [data['tasks'][0]['id'] for _, data in pipeline.iter_pages(entity_name='tasks')]
+        assert data == [1, 2, 3]
+
+    def test_iter_pages_bounds_concurrency(self, fake_sensedata_api):
+        api = fake_sensedata_api(rows=20, limit=1, delay=0.01)
+        pipeline = PagePipeline(sense_data_api=api, workers=3, prefetch=10)
+        list(pipeline.iter_pages(entity_name='tasks'))
+        assert api.max_in_flight <= 3
+
+    def test_iter_pages_raises_fetch_errors(self):
+        api = Mock()
+        api.get_entity_data.side_effect = ValueError('boom')
+        pipeline = PagePipeline(sense_data_api=api, workers=2)
+        with pytest.raises(ValueError):
+            list(pipeline.iter_pages(entity_name='tasks'))
+
+    def test_invalid_workers(self):
+        with pytest.raises(ValueError):
+            PagePipeline(sense_data_api=Mock(), workers=0)
+
+    def test_iter_pages_stops_at_the_total_from_metadata(self):
+        api = Mock()
+        api.get_entity_data.side_effect = lambda entity_name, page, filters: {
+            'count': 1, 'total_pages': 3, entity_name: [{'id': page}]}
+        api.last_page.side_effect = SensedataAPI(limit=1).last_page
+        pipeline = PagePipeline(sense_data_api=api, workers=1, prefetch=1)
+        assert [page for page, _ in pipeline.iter_pages('nps')] == [1, 2, 3]
+        assert api.get_entity_data.call_count == 3
+
+
+class TestSyncEngine:
+    def test_sync_entity_pushes_every_page(self, fake_sensedata_api, recording_stitch):
+        stitch = recording_stitch
+        engine = SyncEngine(sense_data_api=fake_sensedata_api(rows=4, limit=1), stitch=stitch)
+        assert engine.sync_entity(entity_name='nps') == 4
+        assert stitch.push_data_to_stitch.call_count == 4
+
+    def test_sync_with_batcher_batches_across_entities(self, fake_sensedata_api, recording_stitch):
+        batcher = StitchBatcher(recording_stitch)
+        engine = SyncEngine(sense_data_api=fake_sensedata_api(rows=2, limit=1), stitch=recording_stitch,
+                            batcher=batcher)
+        assert engine.run(entities=['nps', 'tasks']) == {'nps': 2, 'tasks': 2}
+        recording_stitch.push_data_to_stitch.assert_called_once()
+        pushed = json.loads(recording_stitch.push_data_to_stitch.call_args.kwargs['data'])
+        assert [(record['table_name'], record['data']['id']) for record in pushed] == [
+            ('nps', 1), ('nps', 2), ('tasks', 1), ('tasks', 2)]
+
+    def test_pages_reach_the_sink_as_record_pages(self, fake_sensedata_api, recording_stitch, tmp_path):
+        class RecordingSink(Sink):
+            def __init__(self):
+                self.written = []
+
+            def write(self, table_name, records, on_written=None):
+                self.written.append(records)
+
+        sink = RecordingSink()
+        SyncEngine(sense_data_api=fake_sensedata_api(rows=3), stitch=recording_stitch, sink=sink).run(['nps'])
+        assert [type(records) for records in sink.written] == [RecordPage]
+
+        sink = RecordingSink()
+        with DedupCache(str(tmp_path / 'dedup.db')) as dedup:
+            SyncEngine(sense_data_api=fake_sensedata_api(rows=3), stitch=recording_stitch, sink=sink,
+                       dedup=dedup).run(['nps'])
+        assert [type(records) for records in sink.written] == [list]
+
+    def test_syncs_every_row_when_the_server_caps_the_page_size(self, monkeypatch):
+        monkeypatch.setitem(MAPPINGS, 'tasks',
+                            EntityMapping(table_name='tasks', fields=[('id', 'id'), ('updated_at', 'updated_at')]))
+        with FakeSensedataServer(rows=3000, latency=0, max_limit=500) as sensedata, \
+                FakeStitchServer() as stitch_server:
+            engine = SyncEngine(sense_data_api=SensedataAPI(base_url=sensedata.base_url, token='token', limit=750),
+                                stitch=StitchApi(base_url=stitch_server.base_url, api_token='token', client_id='1'),
+                                workers=2, prefetch=2)
+            assert engine.sync_entity(entity_name='tasks') == 3000
+        assert stitch_server.rows == 3000
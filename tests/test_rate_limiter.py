@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+from requests import HTTPError
+
+from benchmarks.fake_servers import FakeSensedataServer, FakeStitchServer
+from commons import RetryPolicy, TokenBucket, retry_after_seconds, thread_retries, thread_throttles
+from sensedata_api import SensedataAPI
+from stitch_api import StitchApi
+
+
+class TestTokenBucket:
+    def test_allows_burst_then_throttles(self, clock):
+        bucket = TokenBucket(rate=2, capacity=2, clock=clock, sleep=clock.sleep)
+        waits = [bucket.acquire() for _ in range(4)]
+        assert waits == [0, 0, 0.5, 0.5]
+        assert clock.now == 1.0
+
+    def test_pause_holds_every_caller(self, clock):
+        bucket = TokenBucket(clock=clock, sleep=clock.sleep)
+        bucket.update_from_headers({'Retry-After': '3'})
+        assert bucket.acquire() == 3
+        assert bucket.acquire() == 0
+
+
+class TestRetryAfterSeconds:
+    @pytest.mark.parametrize(("headers", "expected"), [
+        ({}, None),
+        ({'Retry-After': '2'}, 2),
+        ({'Retry-After': 'Thu, 01 Jan 1970 00:00:00 GMT'}, 0),
+        ({'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '4'}, 4),
+        ({'X-RateLimit-Remaining': '10', 'X-RateLimit-Reset': '4'}, None),
+        ({'RateLimit-Remaining': '0', 'RateLimit-Reset': '1'}, 1),
+    ])
+    def test_retry_after_seconds(self, headers, expected):
+        assert retry_after_seconds(headers) == expected
+
+
+class TestRetryPolicy:
+    def test_backoff_is_bounded(self):
+        policy = RetryPolicy(backoff_factor=1, max_backoff=5)
+        assert all(0 <= policy.backoff(attempt) <= min(5, 2 ** attempt) for attempt in range(10))
+
+
+class TestRetries:
+    def test_sensedata_retries_429_and_503(self):
+        with FakeSensedataServer(rows=10, latency=0) as server:
+            server.inject_errors((429, {'Retry-After': '0'}), (503, {}))
+            api = SensedataAPI(base_url=server.base_url, token='token',
+                               retry_policy=RetryPolicy(backoff_factor=0.01))
+            retries, throttles = thread_retries(), thread_throttles()
+            data = api.get_entity_data(entity_name='nps', page=1)
+        assert data['count'] == 10
+        assert server.requests == 3
+        assert thread_retries() - retries == 2 and thread_throttles() - throttles == 1
+
+    def test_sensedata_gives_up_after_max_retries(self):
+        with FakeSensedataServer(rows=10, latency=0) as server:
+            server.inject_errors(*[(503, {})] * 3)
+            api = SensedataAPI(base_url=server.base_url, token='token',
+                               retry_policy=RetryPolicy(max_retries=2, backoff_factor=0.01))
+            with pytest.raises(HTTPError):
+                api.get_entity_data(entity_name='nps', page=1)
+        assert server.requests == 3
+
+    def test_stitch_retries_429(self):
+        with FakeStitchServer() as server:
+            server.inject_errors((429, {'Retry-After': '0'}))
+            api = StitchApi(base_url=server.base_url, api_token='token', client_id='1')
+            api.push_data_to_stitch(data='[{"id": 1}]')
+        assert server.batches == [[{'id': 1}]]
+
+    def test_async_sensedata_retries_503(self):
+        pytest.importorskip('aiohttp')
+        from sensedata_api import AsyncSensedataAPI
+
+        async def fetch(base_url):
+            async with AsyncSensedataAPI(base_url=base_url, token='token',
+                                         retry_policy=RetryPolicy(backoff_factor=0.01)) as api:
+                return await api.get_entity_data(entity_name='nps', page=1)
+
+        with FakeSensedataServer(rows=10, latency=0) as server:
+            server.inject_errors((503, {}), (429, {'Retry-After': '0'}))
+            data = asyncio.run(fetch(server.base_url))
+        assert data['count'] == 10
@@ -0,0 +1,70 @@
+import json
+import tracemalloc
+
+import pytest
+
+from benchmarks.fixtures import ENTITIES, generate_rows
+from commons.serializer import SERIALIZERS
+from stitch_api import RecordPage, StitchApi
+from stitch_api.mapping import TASKS
+
+
+def installed_serializers() -> list:
+    serializers = []
+    for serializer_class in SERIALIZERS.values():
+        try:
+            serializers.append(serializer_class())
+        except ImportError:
+            continue
+    return serializers
+
+
+@pytest.fixture
+def stitch():
+    return StitchApi(client_id='1')
+
+
+class TestRecordPage:
+    def test_extract_values_follows_columns(self):
+        row = generate_rows('tasks', 1)[0]
+        assert dict(zip(TASKS.columns, TASKS.extract_values(row))) == TASKS.extract(row)
+
+    @pytest.mark.parametrize('entity_name', ENTITIES)
+    def test_records_match_record_dicts(self, stitch, entity_name):
+        rows = generate_rows(entity_name, 20, custom_fields=5)
+        page = stitch.parse_entity_data_to_record_page(rows, entity_name)
+        records = stitch.parse_entity_data_to_stitch_records(rows, entity_name)
+        for record in records:
+            record['sequence'] = page.sequence
+        assert len(page) == 20
+        assert page.records() == records
+
+    @pytest.mark.parametrize('serializer', installed_serializers(), ids=lambda serializer: serializer.name)
+    @pytest.mark.parametrize('entity_name', ENTITIES)
+    def test_encode_writes_stitch_json(self, stitch, serializer, entity_name):
+        rows = generate_rows(entity_name, 20, custom_fields=5)
+        page = stitch.parse_entity_data_to_record_page(rows, entity_name)
+        encoded = page.encode(serializer)
+        assert [json.loads(record) for record in encoded] == page.records()
+        assert json.loads(page.dumps(serializer)) == page.records()
+
+    def test_empty_page(self, stitch):
+        page = stitch.parse_entity_data_to_record_page([], 'nps')
+        assert isinstance(page, RecordPage) and not page
+        assert page.dumps(stitch.serializer) == b'[]'
+
+    def test_holds_less_memory_than_record_dicts(self, stitch):
+        rows = generate_rows('tasks', 500)
+
+        def held(build) -> int:
+            tracemalloc.start()
+            before, _ = tracemalloc.get_traced_memory()
+            result = build()
+            after, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            del result
+            return after - before
+
+        records = held(lambda: stitch.parse_entity_data_to_stitch_records(rows, 'tasks'))
+        page = held(lambda: stitch.parse_entity_data_to_record_page(rows, 'tasks'))
+        assert page * 2 < records
@@ -0,0 +1,78 @@
+import pytest
+
+from benchmarks.fake_servers import FakeSensedataServer
+from sensedata_api import ResponseCache, ResponseCacheMiss, SensedataAPI
+
+
+class TestResponseCache:
+    def test_put_and_get(self, tmp_path):
+        with ResponseCache(str(tmp_path)) as cache:
+            key = cache.key('https://api.sensedata.io/v2/nps?page=1&limit=500', scope='token')
+            assert cache.get(key) is None
+            cache.put(key, b'{"count": 0}', etag='"abc"')
+            cached = cache.get(key)
+        assert cached.body == b'{"count": 0}' and cached.etag == '"abc"' and cached.fresh
+
+    def test_key_depends_on_url_and_scope(self):
+        url = 'https://api.sensedata.io/v2/nps?page=1&limit=500'
+        assert ResponseCache.key(url, 'a') != ResponseCache.key(url, 'b')
+        assert ResponseCache.key(url, 'a') != ResponseCache.key(url.replace('page=1', 'page=2'), 'a')
+
+    def test_entries_go_stale_after_ttl(self, clock, tmp_path):
+        with ResponseCache(str(tmp_path), ttl=60, clock=clock) as cache:
+            cache.put('key', b'body')
+            clock.now += 61
+            assert not cache.get('key').fresh
+
+    def test_evicts_least_recently_used(self, clock, tmp_path):
+        with ResponseCache(str(tmp_path), max_bytes=10, clock=clock) as cache:
+            for key in ('a', 'b', 'c'):
+                clock.now += 1
+                cache.put(key, b'x' * 4)
+                if key == 'b':
+                    clock.now += 1
+                    cache.get('a')
+            assert cache.get('b') is None
+            assert cache.get('a') is not None and cache.get('c') is not None
+            assert cache.size == 8 and cache.evictions == 1
+
+    def test_index_survives_reopening(self, tmp_path):
+        with ResponseCache(str(tmp_path)) as cache:
+            cache.put('key', b'body')
+        with ResponseCache(str(tmp_path)) as cache:
+            assert cache.get('key').body == b'body' and cache.size == 4
+
+
+class TestCachedSensedataAPI:
+    def test_second_fetch_is_served_from_cache(self, tmp_path):
+        with FakeSensedataServer(rows=10, latency=0) as server, ResponseCache(str(tmp_path)) as cache:
+            api = SensedataAPI(base_url=server.base_url, token='token', response_cache=cache)
+            first = api.get_entity_data(entity_name='nps', page=1)
+            second = api.get_entity_data(entity_name='nps', page=1)
+            api.get_entity_data(entity_name='nps', page=1, filters={'updated_after': '2020-01-01'})
+        assert first == second and first['count'] == 10
+        assert server.requests == 2
+
+    def test_stale_pages_are_revalidated(self, clock, tmp_path):
+        with FakeSensedataServer(rows=10, latency=0, etags=True) as server, \
+                ResponseCache(str(tmp_path), ttl=60, clock=clock) as cache:
+            api = SensedataAPI(base_url=server.base_url, token='token', response_cache=cache)
+            first = api.get_entity_data(entity_name='nps', page=1)
+            clock.now += 61
+            assert api.get_entity_data(entity_name='nps', page=1) == first
+            assert cache.get(cache.key(api._entity_endpoint('nps', 1), 'token')).fresh
+        assert server.requests == 2 and server.not_modified == 1
+
+    def test_offline_replay(self, clock, tmp_path):
+        with FakeSensedataServer(rows=1200, latency=0) as server, ResponseCache(str(tmp_path)) as cache:
+            api = SensedataAPI(base_url=server.base_url, token='token', response_cache=cache)
+            online = list(api.iter_pages('tasks'))
+            base_url = server.base_url
+
+        clock.now += 10 ** 9
+        with ResponseCache(str(tmp_path), ttl=1, offline=True, clock=clock) as cache:
+            # The server is gone, every page comes from the cache
+            api = SensedataAPI(base_url=base_url, token='token', response_cache=cache)
+            assert list(api.iter_pages('tasks')) == online
+            with pytest.raises(ResponseCacheMiss):
+                api.get_entity_data(entity_name='nps', page=1)
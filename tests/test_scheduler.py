@@ -0,0 +1,77 @@
+import json
+import threading
+import time
+
+import pytest
+
+from benchmarks.fake_servers import FakeSensedataServer, FakeStitchServer
+from stitch_api.mapping import MAPPINGS, EntityMapping
+from sync_engine import TenantScheduler, load_tenants
+
+
+def tenant(name: str, **extra) -> dict:
+    return {'name': name, 'sensedata_token': name, 'stitch_integration_token': name, 'stitch_client_id': name,
+            **extra}
+
+
+class RecordingScheduler(TenantScheduler):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.started = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def run_job(self, tenant: dict, entity_name: str) -> int:
+        with self._lock:
+            self.started.append((tenant['name'], entity_name))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(0.02)
+        with self._lock:
+            self.in_flight -= 1
+        if entity_name == 'broken':
+            raise RuntimeError('boom')
+        return 10
+
+
+class TestTenantScheduler:
+    def test_small_tenant_is_not_starved(self):
+        scheduler = RecordingScheduler(
+            tenants=[tenant('big'), tenant('small', entities=['nps'])],
+            entities=['contacts', 'customers', 'nps', 'tasks'], max_workers=2, max_per_tenant=1)
+        scheduler.run()
+        assert ('small', 'nps') in scheduler.started[:2]
+        assert scheduler.max_in_flight <= 2
+
+    def test_report_per_tenant(self):
+        scheduler = RecordingScheduler(tenants=[tenant('a'), tenant('b', entities=['nps', 'broken'])],
+                                       entities=['nps', 'tasks'], max_workers=3)
+        report = scheduler.run()
+        assert report['a']['status'] == 'ok'
+        assert report['a']['rows'] == 20
+        assert report['b']['status'] == 'failed'
+        assert report['b']['entities']['broken']['error'] == 'RuntimeError: boom'
+        assert report['b']['entities']['nps']['rows'] == 10
+
+    def test_syncs_every_tenant_end_to_end(self, monkeypatch):
+        monkeypatch.setitem(MAPPINGS, 'tasks',
+                            EntityMapping(table_name='tasks', fields=[('id', 'id'), ('updated_at', 'updated_at')]))
+        with FakeSensedataServer(rows=1200, latency=0) as sensedata, FakeStitchServer() as stitch:
+            report = TenantScheduler(tenants=[tenant('a'), tenant('b'), tenant('c')], entities=['tasks'],
+                                     sensedata_url=sensedata.base_url, stitch_url=stitch.base_url).run()
+        assert {name: result['rows'] for name, result in report.items()} == {'a': 1200, 'b': 1200, 'c': 1200}
+        assert {batch[0]['client_id'] for batch in stitch.batches} == {'a', 'b', 'c'}
+
+
+class TestLoadTenants:
+    def test_load_tenants(self, tmp_path):
+        path = tmp_path / 'tenants.json'
+        path.write_text(json.dumps([tenant('a')]))
+        assert load_tenants(str(path)) == [tenant('a')]
+
+    def test_missing_token(self, tmp_path):
+        path = tmp_path / 'tenants.json'
+        path.write_text(json.dumps([{'name': 'a', 'sensedata_token': 'x'}]))
+        with pytest.raises(ValueError, match='stitch_client_id'):
+            load_tenants(str(path))
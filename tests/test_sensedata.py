@@ -4,11 +4,12 @@ from unittest.mock import Mock
 import pytest
 from requests import HTTPError
 
+from benchmarks.fake_servers import FakeSensedataServer
 from sensedata_api import SensedataAPI
 
 
 class TestSensedataAPI:
-    @mock.patch('requests.get', return_value=Mock(status_code=200, json=lambda: {"data": {"id": 1}}))
+    @mock.patch('requests.Session.get', return_value=Mock(status_code=200, headers={}, content=b'{"data": {"id": 1}}'))
     def test_get_entity_data(self, mock_request):
         api = SensedataAPI()
         data = api.get_entity_data(entity_name='customers', page=1)
@@ -16,12 +17,49 @@ class TestSensedataAPI:
         actual_id = 1
         assert actual_id == data['data']['id']
 
-    @mock.patch('requests.get')
+    @mock.patch('requests.Session.get')
     def test_get_entity_data_not_ok(self, mock_request):
         api = SensedataAPI()
         exception = HTTPError(mock.Mock(status=404), "not found")
+        mock_request(mock.ANY).status_code = 404
+        mock_request(mock.ANY).headers = {}
         mock_request(mock.ANY).raise_for_status.side_effect = exception
 
         with pytest.raises(HTTPError) as error_info:
             api.get_entity_data(entity_name='customers', page=1)
             assert error_info == exception
+
+    @pytest.mark.parametrize("data, expected", [
+        ({'count': 3}, None),
+        ({'count': 10}, None),
+        ({'count': 10, 'total': 95}, 10),
+        ({'count': 10, 'pagination': {'total_pages': 4}}, 4),
+        ({'count': 10, 'pagination': {'next_page': None}}, 1),
+        ({'count': 10, 'has_more': False}, 1),
+    ])
+    def test_last_page(self, data, expected):
+        api = SensedataAPI(limit=500, limits={'tasks': 10})
+        assert api.last_page('tasks', 1, data) == expected
+
+    def test_short_page_is_last_once_the_limit_was_honored(self):
+        api = SensedataAPI(limit=500, limits={'tasks': 10})
+        assert api.last_page('tasks', 1, {'count': 10}) is None
+        assert api.last_page('tasks', 2, {'count': 3}) == 2
+        assert api.last_page('nps', 1, {'count': 3}) is None
+
+    def test_pages_all_rows_of_a_server_capping_the_limit(self):
+        with FakeSensedataServer(rows=3000, latency=0, max_limit=500) as server:
+            api = SensedataAPI(base_url=server.base_url, token='token', limit=750)
+            ids = [row['id'] for _, data in api.iter_pages('tasks') for row in data['tasks']]
+        assert ids == list(range(3000))
+
+    def test_page_limit_per_entity(self):
+        api = SensedataAPI(limit=500, limits={'tasks': 2000})
+        assert api._entity_endpoint('tasks', 3).endswith('?page=3&limit=2000')
+        assert api._entity_endpoint('nps', 3).endswith('?page=3&limit=500')
+
+    def test_iter_pages_has_no_page_cap(self):
+        api = SensedataAPI(limit=1)
+        pages = {page: {'count': 1, 'tasks': [{'id': page}]} for page in range(1, 1001)}
+        api.get_entity_data = lambda entity_name, page, filters=None: pages.get(page, {'count': 0, 'tasks': []})
+        assert [page for page, _ in api.iter_pages('tasks')] == list(range(1, 1001))
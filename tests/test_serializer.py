@@ -0,0 +1,33 @@
+import pytest
+
+from commons import get_serializer
+from commons.serializer import SERIALIZERS, StdlibSerializer
+
+
+def available_serializers():
+    names = []
+    for name, serializer in SERIALIZERS.items():
+        try:
+            serializer()
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+class TestSerializer:
+    @pytest.mark.parametrize("name", available_serializers())
+    def test_round_trip(self, name):
+        serializer = get_serializer(name)
+        obj = [{'id': 1, 'name': 'Itú', 'active': True, 'score': 7.5, 'tags': None}]
+        encoded = serializer.dumps(obj)
+        assert isinstance(encoded, bytes)
+        assert serializer.loads(encoded) == obj
+        assert StdlibSerializer().loads(encoded) == obj
+
+    def test_default_is_fastest_installed(self):
+        assert get_serializer().name == available_serializers()[0]
+
+    def test_unknown_serializer(self):
+        with pytest.raises(KeyError):
+            get_serializer('yaml')
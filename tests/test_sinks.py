@@ -0,0 +1,132 @@
+import gzip
+import json
+import os
+import sqlite3
+
+import pytest
+
+from benchmarks.fixtures import generate_row, generate_rows
+from sinks import NdjsonFileSink, ParquetFileSink, SQLiteSink, StitchSink
+from stitch_api import StitchApi, StitchBatcher
+from sync_engine import SyncEngine
+
+
+def encoded(*records: dict) -> list:
+    return [json.dumps(record).encode() for record in records]
+
+
+def record(record_id: int, **data) -> dict:
+    return {'table_name': 'tasks', 'action': 'upsert', 'key_names': ['id'], 'data': {'id': record_id, **data}}
+
+
+def read_lines(path: str) -> list:
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt') as lines:
+        return [json.loads(line) for line in lines]
+
+
+class TestNdjsonFileSink:
+    def test_rotates_files_and_reports_them_written(self, tmp_path):
+        written = []
+        with NdjsonFileSink(str(tmp_path), rotate_bytes=100) as sink:
+            sink.write('tasks', [record(1), record(2)], on_written=lambda: written.append(1))
+            sink.write_encoded('tasks', encoded(record(3)), on_written=lambda: written.append(2))
+            assert written == [1]
+        assert written == [1, 2]
+        assert sorted(os.listdir(tmp_path / 'tasks')) == ['tasks-000001.ndjson', 'tasks-000002.ndjson']
+        assert [line['data']['id'] for line in read_lines(str(tmp_path / 'tasks' / 'tasks-000001.ndjson'))] == [1, 2]
+
+    def test_gzip_and_numbering_after_earlier_runs(self, tmp_path):
+        (tmp_path / 'tasks').mkdir()
+        (tmp_path / 'tasks' / 'tasks-000004.ndjson.gz').write_bytes(gzip.compress(b''))
+        (tmp_path / 'tasks' / 'tasks-000005.ndjson.gz.part').write_bytes(b'partial')
+        with NdjsonFileSink(str(tmp_path), compress=True) as sink:
+            sink.write('tasks', [record(1)])
+        assert sorted(os.listdir(tmp_path / 'tasks')) == ['tasks-000004.ndjson.gz', 'tasks-000005.ndjson.gz']
+        assert read_lines(str(tmp_path / 'tasks' / 'tasks-000005.ndjson.gz')) == [record(1)]
+
+    def test_sync_engine_writes_to_the_sink(self, tmp_path, fake_sensedata_api):
+        sink = NdjsonFileSink(str(tmp_path))
+        engine = SyncEngine(sense_data_api=fake_sensedata_api(rows=150, limit=50, row_factory=generate_row),
+                            stitch=StitchApi(client_id='1'), workers=2, sink=sink)
+        assert engine.run(entities=['nps']) == {'nps': 150}
+        lines = read_lines(str(tmp_path / 'nps' / 'nps-000001.ndjson'))
+        assert len(lines) == 150 and lines[0]['table_name'] == 'nps'
+
+
+class TestSQLiteSink:
+    def test_upserts_rows_and_adds_columns(self, tmp_path):
+        path = str(tmp_path / 'export.db')
+        written = []
+        with SQLiteSink(path) as sink:
+            sink.write('tasks', [record(1, name='a'), record(2, name='b')], on_written=lambda: written.append(1))
+            sink.write_encoded('tasks', encoded(record(1, name='c', tags=['x'])))
+        assert written == [1]
+        rows = sqlite3.connect(path).execute('SELECT id, name, tags FROM tasks ORDER BY id').fetchall()
+        assert rows == [(1, 'c', '["x"]'), (2, 'b', None)]
+
+    def test_writes_a_record_page(self, tmp_path):
+        path = str(tmp_path / 'export.db')
+        stitch = StitchApi(client_id='1')
+        rows = generate_rows('customers', 3)
+        with SQLiteSink(path) as sink:
+            sink.write('customers', stitch.parse_entity_data_to_record_page(rows, 'customers'))
+        assert sqlite3.connect(path).execute('SELECT id FROM customers ORDER BY id').fetchall() == [
+            (row['id'],) for row in sorted(rows, key=lambda row: row['id'])]
+
+
+class TestParquetFileSink:
+    def test_writes_parquet_files(self, tmp_path):
+        parquet = pytest.importorskip('pyarrow.parquet')
+        with ParquetFileSink(str(tmp_path), rotate_rows=2) as sink:
+            sink.write('tasks', [record(1, name='a'), record(2, name='b')])
+            sink.write_encoded('tasks', encoded(record(3, name='c')))
+        assert sorted(os.listdir(tmp_path / 'tasks')) == ['tasks-000001.parquet', 'tasks-000002.parquet']
+        assert parquet.read_table(str(tmp_path / 'tasks' / 'tasks-000001.parquet')).to_pylist() == [
+            {'id': 1, 'name': 'a'}, {'id': 2, 'name': 'b'}]
+        assert parquet.read_table(str(tmp_path / 'tasks' / 'tasks-000002.parquet')).to_pylist() == [
+            {'id': 3, 'name': 'c'}]
+
+    def test_keeps_fields_missing_from_the_first_row(self, tmp_path):
+        parquet = pytest.importorskip('pyarrow.parquet')
+        with ParquetFileSink(str(tmp_path)) as sink:
+            sink.write('tasks', [record(1), record(2, name='b', score=None), record(3, score=7)])
+        table = parquet.read_table(str(tmp_path / 'tasks' / 'tasks-000001.parquet'))
+        assert table.column_names == ['id', 'name', 'score']
+        assert table.to_pylist() == [{'id': 1, 'name': None, 'score': None}, {'id': 2, 'name': 'b', 'score': None},
+                                     {'id': 3, 'name': None, 'score': 7}]
+
+    def test_writes_columns_of_mixed_types_as_strings(self, tmp_path):
+        parquet = pytest.importorskip('pyarrow.parquet')
+        stitch = StitchApi(client_id='1')
+        page = stitch.parse_entity_data_to_record_page(generate_rows('customers', 200), 'customers')
+        with ParquetFileSink(str(tmp_path)) as sink:
+            sink.write('customers', page)
+        table = parquet.read_table(str(tmp_path / 'customers' / 'customers-000001.parquet'))
+        assert table.num_rows == 200
+        # Custom fields hold text, numbers, booleans and nulls
+        assert table.schema.field('custom_fields_field_0').type == 'string'
+        expected = [row['custom_fields_field_0'] for row in page.iter_data()]
+        assert table.column('custom_fields_field_0').to_pylist() == [
+            value if value is None or isinstance(value, str) else json.dumps(value) for value in expected]
+        assert table.column('id').to_pylist() == [row['id'] for row in page.iter_data()]
+
+
+class TestStitchSink:
+    def test_pushes_every_write_without_a_batcher(self, recording_stitch):
+        written = []
+        with StitchSink(recording_stitch) as sink:
+            sink.write('tasks', [record(1), record(2)], on_written=lambda: written.append(1))
+            sink.write_encoded('tasks', encoded(record(3)), on_written=lambda: written.append(2))
+        pushed = [json.loads(call.kwargs['data']) for call in recording_stitch.push_data_to_stitch.call_args_list]
+        assert pushed == [[record(1), record(2)], [record(3)]]
+        assert written == [1, 2] and sink.records_written == 3
+
+    def test_hands_records_to_the_batcher(self, recording_stitch):
+        batcher = StitchBatcher(recording_stitch)
+        with StitchSink(recording_stitch, batcher=batcher) as sink:
+            sink.write('tasks', [record(1)])
+            sink.write_encoded('tasks', encoded(record(2)))
+            recording_stitch.push_data_to_stitch.assert_not_called()
+        pushed = [json.loads(call.kwargs['data']) for call in recording_stitch.push_data_to_stitch.call_args_list]
+        assert pushed == [[record(1), record(2)]]
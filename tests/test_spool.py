@@ -0,0 +1,135 @@
+import os
+import threading
+
+import pytest
+
+from benchmarks.fake_servers import FakeSensedataServer, FakeStitchServer
+from sensedata_api import SensedataAPI
+from stitch_api import StitchApi
+from stitch_api.mapping import MAPPINGS, EntityMapping
+from sync_engine import Spool, SpoolSyncEngine
+
+
+def segments(directory) -> list:
+    return sorted(name for name in os.listdir(directory) if name.endswith('.seg'))
+
+
+class TestSpool:
+    def test_pending_pages_survive_a_restart(self, tmp_path):
+        spool = Spool(str(tmp_path), fsync=False)
+        spool.append('nps', 1, b'[1]', rows=1)
+        spool.append('nps', 2, b'[2,3]', rows=2)
+        spool.ack(spool.pending()[0])
+        spool.close()
+
+        spool = Spool(str(tmp_path), fsync=False)
+        assert [(entry.page, spool.read(entry)) for entry in spool.pending()] == [(2, b'[2,3]')]
+        assert spool.last_fetched_page('nps') == 2
+        assert spool.last_fetched_page('tasks') == 0
+
+    def test_new_pages_after_restarts_are_not_taken_as_acknowledged(self, tmp_path):
+        spool = Spool(str(tmp_path), fsync=False)
+        spool.append('nps', 1, b'[1]', rows=1)
+        spool.append('nps', 2, b'[2]', rows=1)
+        for entry in spool.pending():
+            spool.ack(entry)
+        spool.close()
+        # Removes the acknowledged segment
+        Spool(str(tmp_path), fsync=False).close()
+
+        spool = Spool(str(tmp_path), fsync=False)
+        spool.append('nps', 3, b'[3]', rows=1)
+        spool.close()
+
+        spool = Spool(str(tmp_path), fsync=False)
+        assert [(entry.page, spool.read(entry)) for entry in spool.pending()] == [(3, b'[3]')]
+
+    def test_empty_pages_only_move_the_progress(self, tmp_path):
+        spool = Spool(str(tmp_path), fsync=False)
+        spool.append('nps', 1, b'', rows=0)
+        assert spool.pending() == []
+        assert spool.last_fetched_page('nps') == 1
+
+    def test_rotates_and_removes_acknowledged_segments(self, tmp_path):
+        spool = Spool(str(tmp_path), segment_bytes=100, fsync=False)
+        for page in range(1, 5):
+            spool.append('nps', page, b'[' + b'1,' * 40 + b'1]', rows=41)
+        assert len(segments(tmp_path)) == 4
+
+        for entry in spool.pending()[:3]:
+            spool.ack(entry)
+        assert segments(tmp_path) == ['000004.seg']
+        assert spool.size < 200
+
+    def test_an_acknowledged_open_segment_frees_its_space(self, tmp_path):
+        spool = Spool(str(tmp_path), segment_bytes=100, max_bytes=200, fsync=False)
+        spool.append('nps', 1, b'[' + b'1,' * 100 + b'1]', rows=101)
+        assert spool.size >= 200
+        spool.ack(spool.pending()[0])
+
+        appended = threading.Thread(target=spool.append, args=('nps', 2, b'[2]'), kwargs={'rows': 1}, daemon=True)
+        appended.start()
+        appended.join(timeout=5)
+        assert not appended.is_alive()
+        assert segments(tmp_path) == ['000002.seg']
+
+    def test_max_bytes_must_exceed_the_segment_size(self, tmp_path):
+        with pytest.raises(ValueError):
+            Spool(str(tmp_path), segment_bytes=100, max_bytes=100)
+
+    def test_drops_a_partially_written_record(self, tmp_path):
+        spool = Spool(str(tmp_path), fsync=False)
+        spool.append('nps', 1, b'[1]', rows=1)
+        spool.close()
+        with open(tmp_path / '000001.seg', 'ab') as segment_file:
+            segment_file.write(b'{"seq": 2, "entity": "nps", "page": 2, "rows": 1}\n[2')
+
+        spool = Spool(str(tmp_path), fsync=False)
+        assert [entry.page for entry in spool.pending()] == [1]
+        spool.append('nps', 2, b'[2]', rows=1)
+        assert [spool.read(entry) for entry in spool.pending()] == [b'[1]', b'[2]']
+
+    def test_finish_empties_the_spool(self, tmp_path):
+        spool = Spool(str(tmp_path), fsync=False)
+        spool.append('nps', 1, b'[1]', rows=1)
+        spool.mark_complete('nps')
+        spool.finish()
+        assert os.listdir(tmp_path) == []
+
+
+class TestSpoolSyncEngine:
+    @pytest.fixture(autouse=True)
+    def tasks_mapping(self, monkeypatch):
+        monkeypatch.setitem(MAPPINGS, 'tasks',
+                            EntityMapping(table_name='tasks', fields=[('id', 'id'), ('updated_at', 'updated_at')]))
+
+    def engine(self, sensedata, stitch_server, spool_dir, **spool_options):
+        return SpoolSyncEngine(
+            sense_data_api=SensedataAPI(base_url=sensedata.base_url, token='token'),
+            stitch=StitchApi(base_url=stitch_server.base_url, api_token='token', client_id='1'),
+            spool=Spool(spool_dir, fsync=False, **spool_options), workers=2, prefetch=2)
+
+    def test_pushes_every_page(self, tmp_path):
+        with FakeSensedataServer(rows=1250, latency=0) as sensedata, FakeStitchServer() as stitch_server:
+            assert self.engine(sensedata, stitch_server, str(tmp_path)).run(entities=['tasks']) == {'tasks': 1250}
+
+        assert sorted(len(batch) for batch in stitch_server.batches) == [250, 500, 500]
+        assert os.listdir(tmp_path) == []
+
+    def test_finishes_with_a_spool_smaller_than_a_page(self, tmp_path):
+        with FakeSensedataServer(rows=1250, latency=0) as sensedata, FakeStitchServer() as stitch_server:
+            engine = self.engine(sensedata, stitch_server, str(tmp_path), segment_bytes=1000, max_bytes=2000)
+            assert engine.run(entities=['tasks']) == {'tasks': 1250}
+        assert stitch_server.rows == 1250
+
+    def test_resumes_after_a_failed_push(self, tmp_path):
+        with FakeSensedataServer(rows=1250, latency=0) as sensedata, FakeStitchServer() as stitch_server:
+            stitch_server.inject_errors((400, {}))
+            with pytest.raises(Exception):
+                self.engine(sensedata, stitch_server, str(tmp_path)).run(entities=['tasks'])
+            assert stitch_server.rows == 0
+
+            self.engine(sensedata, stitch_server, str(tmp_path)).run(entities=['tasks'])
+
+        pushed = sorted(row['data']['id'] for batch in stitch_server.batches for row in batch)
+        assert pushed == list(range(1250))
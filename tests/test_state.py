@@ -0,0 +1,56 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from sync_engine import SyncEngine, SyncState
+from sync_engine.state import filter_changed_rows, parse_timestamp
+
+
+class TestTimestamps:
+    @pytest.mark.parametrize(("value", "expected"), [
+        ('', None),
+        (None, None),
+        ('2020-03-02', datetime(2020, 3, 2, tzinfo=timezone.utc)),
+        ('2021-02-27T10:35:00Z', datetime(2021, 2, 27, 10, 35, tzinfo=timezone.utc)),
+        ('2020-09-26T01:00:02.371497', datetime(2020, 9, 26, 1, 0, 2, 371497, tzinfo=timezone.utc)),
+    ])
+    def test_parse_timestamp(self, value, expected):
+        assert parse_timestamp(value) == expected
+
+    def test_filter_changed_rows(self):
+        rows = [
+            {'id': 1, 'updated_at': '2020-01-01T00:00:00Z'},
+            {'id': 2, 'updated_at': '2021-01-01T00:00:00Z'},
+            {'id': 3, 'updated_at': '', 'created_at': '2022-01-01'},
+            {'id': 4, 'updated_at': ''},
+        ]
+        changed = filter_changed_rows(rows, parse_timestamp('2020-06-01'))
+        assert [row['id'] for row in changed] == [2, 3, 4]
+
+
+class TestSyncState:
+    def test_bookmarks_round_trip(self, tmp_path):
+        path = str(tmp_path / 'state.json')
+        state = SyncState(path)
+        assert state.get_bookmark('tasks') is None
+
+        state.set_bookmark('tasks', parse_timestamp('2021-01-01'))
+        state.set_bookmark('tasks', parse_timestamp('2020-01-01'))
+        state.save()
+        assert SyncState(path).get_bookmark('tasks') == parse_timestamp('2021-01-01')
+
+    def test_incremental_run_pushes_only_changed_rows(self, tmp_path, fake_sensedata_api, recording_stitch):
+        path = str(tmp_path / 'state.json')
+        rows = [{'id': 1, 'updated_at': '2020-01-01T00:00:00Z'}, {'id': 2, 'updated_at': '2021-01-01T00:00:00Z'}]
+        stitch = recording_stitch
+
+        first = SyncEngine(sense_data_api=fake_sensedata_api(rows), stitch=stitch, state=SyncState(path))
+        assert first.run(entities=['nps']) == {'nps': 2}
+
+        rows.append({'id': 3, 'updated_at': '2022-01-01T00:00:00Z'})
+        api = fake_sensedata_api(rows)
+        second = SyncEngine(sense_data_api=api, stitch=stitch, state=SyncState(path),
+                            server_filters={'nps': 'updated_at_start'})
+        assert second.run(entities=['nps']) == {'nps': 1}
+        assert api.filters[0] == {'updated_at_start': '2021-01-01T00:00:00+00:00'}
+        assert SyncState(path).get_bookmark('nps') == parse_timestamp('2022-01-01T00:00:00Z')
@@ -8,7 +8,7 @@ from stitch_api import StitchApi
 
 
 class TestStitchApi:
-    @mock.patch('requests.request', return_value=Mock(status_code=201))
+    @mock.patch('requests.Session.post', return_value=Mock(status_code=201, headers={}))
     def test_push_data_to_stitch(self, mock_request):
         api = StitchApi()
         data = json.dumps([{}])
@@ -36,12 +36,17 @@ class TestStitchApi:
         assert obj['data']['custom_fields_etapa'] == row['custom_fields']['etapa']['value']
         assert obj['data']['custom_fields_trial'] == row['custom_fields']['trial']['value']
 
-    @mock.patch('stitch_api.StitchApi._parse_nps_to_stitch_standard', return_value='')
+    @mock.patch('stitch_api.StitchApi.parse_entity_data_to_stitch_records', return_value=[])
     def test_paser_entity_data_to_stitch_standard(self, mock_stitch_parser):
         api = StitchApi()
         api.paser_entity_data_to_stitch_standard(data=[], entity_name='nps')
         mock_stitch_parser.assert_called_once()
 
+    def test_parse_unknown_entity(self):
+        api = StitchApi()
+        with pytest.raises(ValueError):
+            api.parse_entity_data_to_stitch_records(data=[], entity_name='unknown')
+
     @pytest.mark.parametrize("data", [[{
         "id": 1,
         "id_legacy": "internal-tes",
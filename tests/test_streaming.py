@@ -0,0 +1,73 @@
+import json
+import tracemalloc
+
+import pytest
+
+from benchmarks.fake_servers import FakeSensedataServer, FakeStitchServer
+from commons import iter_array_bytes, iter_array_items
+from sensedata_api import SensedataAPI
+from stitch_api import StitchApi
+from stitch_api.mapping import MAPPINGS, EntityMapping
+from sync_engine import StreamingSyncEngine
+
+NPS_ROW = {
+    "id": 1, "id_legacy": "internal-tes", "id_customer": 277, "ref_date": "2019-10-28T00:00:00",
+    "survey_date": "2019-10-28T00:00:00", "medium": "tes@gmail.com", "respondent": "test", "score": 7,
+    "role": "SUPER_ADMIN", "stage": "", "group": "", "category": "", "nps_status": "neutral",
+    "comments": "a comment long enough to make every row a few hundred bytes " * 4, "tags": "",
+    "created_at": "2020-09-26T01:00:02.371497", "updated_at": "",
+}
+
+
+def page_chunks(rows: int, chunk_size: int = 65536):
+    # Produces the page body lazily so the source doesn't count towards the peak
+    buffer = b'{"count": %d, "nps": [' % rows
+    for index in range(rows):
+        buffer += (b',' if index else b'') + json.dumps(dict(NPS_ROW, id=index)).encode()
+        if len(buffer) >= chunk_size:
+            yield buffer
+            buffer = b''
+    yield buffer + b']}'
+
+
+class TestJsonStream:
+    @pytest.mark.parametrize("chunk_size", [1, 3, 16, 4096])
+    def test_iter_array_items(self, chunk_size):
+        body = json.dumps({'count': 2, 'nps': [{'id': 1, 'name': 'ção'}, {'id': 22}], 'other': [3]}).encode()
+        chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+        assert list(iter_array_items(chunks, 'nps')) == [{'id': 1, 'name': 'ção'}, {'id': 22}]
+
+    def test_iter_array_items_empty_page(self):
+        assert list(iter_array_items([b'{"count": 0, "nps": []}'], 'nps')) == []
+
+    def test_iter_array_bytes(self):
+        assert json.loads(b''.join(iter_array_bytes(iter([{'id': 1}, {'id': 2}])))) == [{'id': 1}, {'id': 2}]
+
+    def test_peak_memory_does_not_grow_with_page_size(self):
+        api = StitchApi(client_id='1')
+
+        def peak(rows: int) -> int:
+            tracemalloc.start()
+            records = api.iter_stitch_records(iter_array_items(page_chunks(rows), 'nps'), entity_name='nps')
+            for _ in iter_array_bytes(records):
+                pass
+            _, peak_size = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            return peak_size
+
+        small, large = peak(200), peak(5000)
+        assert large < small * 1.5
+
+
+class TestStreamingSyncEngine:
+    def test_streams_every_page_to_stitch(self, monkeypatch):
+        monkeypatch.setitem(MAPPINGS, 'tasks',
+                            EntityMapping(table_name='tasks', fields=[('id', 'id'), ('updated_at', 'updated_at')]))
+        with FakeSensedataServer(rows=1050, latency=0) as sensedata, FakeStitchServer() as stitch_server:
+            engine = StreamingSyncEngine(
+                sense_data_api=SensedataAPI(base_url=sensedata.base_url, token='token'),
+                stitch=StitchApi(base_url=stitch_server.base_url, api_token='token', client_id='1'))
+            assert engine.run(entities=['tasks']) == {'tasks': 1050}
+
+        assert [len(batch) for batch in stitch_server.batches] == [500, 500, 50]
+        assert stitch_server.batches[2][-1]['data'] == {'id': 1049, 'updated_at': '2020-01-01T00:00:00Z'}